@@ -7,6 +7,9 @@ import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'backend'))
 
 from claude_integration import ClaudeIntegration
+from document_store import DocumentStore, document_refs
+from file_parser import ParseCache
+from session_store import session_id_from_headers
 
 # Initialize Claude integration (singleton pattern for Vercel)
 claude_integration = None
@@ -14,7 +17,7 @@ claude_integration = None
 def get_claude_integration():
     global claude_integration
     if claude_integration is None:
-        claude_integration = ClaudeIntegration()
+        claude_integration = ClaudeIntegration(documents=DocumentStore(parse_cache=ParseCache()))
     return claude_integration
 
 class handler(BaseHTTPRequestHandler):
@@ -22,7 +25,7 @@ class handler(BaseHTTPRequestHandler):
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-Session-Id, X-User-Id')
         self.end_headers()
 
     def do_POST(self):
@@ -34,7 +37,7 @@ class handler(BaseHTTPRequestHandler):
 
             query_text = data.get('query')
             conversation_history = data.get('history', [])
-            file_contents = data.get('files', [])
+            file_contents = data.get('files', []) + document_refs(data.get('document_ids'))
 
             if not query_text:
                 self.send_response(400)
@@ -47,7 +50,8 @@ class handler(BaseHTTPRequestHandler):
 
             # Call Claude for conversational response with file content
             claude = get_claude_integration()
-            answer = claude.chat(query_text, conversation_history, file_contents)
+            answer = claude.chat(query_text, conversation_history, file_contents,
+                                 session_id=session_id_from_headers(self.headers))
 
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
@@ -0,0 +1,72 @@
+from http.server import BaseHTTPRequestHandler
+import json
+import sys
+import os
+
+# Add backend directory to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+
+from claude_integration import ClaudeIntegration
+from document_store import DocumentStore, document_refs
+from file_parser import ParseCache
+from session_store import session_id_from_headers
+from sse import chat_sse_events
+
+# Initialize Claude integration (singleton pattern for Vercel)
+claude_integration = None
+
+def get_claude_integration():
+    global claude_integration
+    if claude_integration is None:
+        claude_integration = ClaudeIntegration(documents=DocumentStore(parse_cache=ParseCache()))
+    return claude_integration
+
+class handler(BaseHTTPRequestHandler):
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-Session-Id, X-User-Id')
+        self.end_headers()
+
+    def do_POST(self):
+        try:
+            # Read request body
+            content_length = int(self.headers['Content-Length'])
+            post_data = self.rfile.read(content_length)
+            data = json.loads(post_data.decode('utf-8'))
+
+            query_text = data.get('query')
+            conversation_history = data.get('history', [])
+            file_contents = data.get('files', []) + document_refs(data.get('document_ids'))
+
+            if not query_text:
+                self.send_response(400)
+                self.send_header('Content-type', 'application/json')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                response = json.dumps({"error": "No query provided"})
+                self.wfile.write(response.encode())
+                return
+
+        except Exception as e:
+            self.send_response(500)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            response = json.dumps({"error": str(e)})
+            self.wfile.write(response.encode())
+            return
+
+        self.send_response(200)
+        self.send_header('Content-type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+
+        # Stream answer chunks as they arrive (errors are reported as an SSE event)
+        claude = get_claude_integration()
+        for event in chat_sse_events(claude, query_text, conversation_history, file_contents,
+                                         session_id=session_id_from_headers(self.headers)):
+            self.wfile.write(event.encode())
+            self.wfile.flush()
@@ -6,29 +6,31 @@ import os
 # Add backend directory to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'backend'))
 
-from graph_manager import GraphManager
+from session_store import SessionStore, session_id_from_headers
+from graph_persistence import SQLitePersistence
 
-# Initialize graph manager (singleton pattern for Vercel)
-graph_manager = None
+# Per-session graph store (singleton pattern for Vercel)
+graph_store = None
 
-def get_graph_manager():
-    global graph_manager
-    if graph_manager is None:
-        graph_manager = GraphManager()
-    return graph_manager
+def get_graph_manager(headers):
+    global graph_store
+    if graph_store is None:
+        graph_store = SessionStore(persistence=SQLitePersistence.from_env())
+    return graph_store.get(session_id_from_headers(headers))
 
 class handler(BaseHTTPRequestHandler):
     def do_OPTIONS(self):
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-Session-Id, X-User-Id')
         self.end_headers()
 
     def do_POST(self):
         try:
-            graph = get_graph_manager()
+            graph = get_graph_manager(self.headers)
             graph.clear_graph()
+            graph.flush()
 
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
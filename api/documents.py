@@ -0,0 +1,63 @@
+from http.server import BaseHTTPRequestHandler
+import json
+import sys
+import os
+from urllib.parse import urlparse, parse_qs
+
+# Add backend directory to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from document_store import DocumentStore, parse_page_range
+from file_parser import ParseCache
+
+# Uploaded documents in LEGOL_DOCUMENT_DIR (singleton pattern for Vercel)
+document_store = None
+
+def get_document_store():
+    global document_store
+    if document_store is None:
+        document_store = DocumentStore(parse_cache=ParseCache())
+    return document_store
+
+class handler(BaseHTTPRequestHandler):
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.end_headers()
+
+    def send_json(self, status, payload):
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(json.dumps(payload).encode())
+
+    def do_GET(self):
+        # GET /api/documents?id=<document_id>&pages=2-4 or &q=<question>
+        try:
+            params = parse_qs(urlparse(self.path).query)
+            document_id = params.get('id', [None])[0]
+            store = get_document_store()
+            info = store.info(document_id)
+            if info is None:
+                self.send_json(404, {"error": "Document not found"})
+                return
+
+            query_text = params.get('q', [None])[0]
+            if query_text:
+                sections = store.search(document_id, query_text)
+                self.send_json(200, dict(info, chunks=[{"page": page + 1, "text": text} for page, text in sections]))
+                return
+
+            try:
+                start, stop = parse_page_range(params.get('pages', ['1'])[0])
+            except ValueError as e:
+                self.send_json(400, {"error": str(e)})
+                return
+            texts = store.pages(document_id, start, stop)
+            self.send_json(200, dict(info, text=[{"page": start + i + 1, "text": text} for i, text in enumerate(texts)]))
+
+        except Exception as e:
+            self.send_json(500, {"error": str(e)})
@@ -2,33 +2,61 @@ from http.server import BaseHTTPRequestHandler
 import json
 import sys
 import os
+from urllib.parse import urlparse, parse_qs
 
 # Add backend directory to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'backend'))
 
-from graph_manager import GraphManager
+from session_store import SessionStore, session_id_from_headers
+from graph_persistence import SQLitePersistence
+from layout_engine import LAYOUT_MODES
 
-# Initialize graph manager (singleton pattern for Vercel)
-graph_manager = None
+# Per-session graph store (singleton pattern for Vercel)
+graph_store = None
 
-def get_graph_manager():
-    global graph_manager
-    if graph_manager is None:
-        graph_manager = GraphManager()
-    return graph_manager
+def get_graph_manager(headers):
+    global graph_store
+    if graph_store is None:
+        graph_store = SessionStore(persistence=SQLitePersistence.from_env())
+    return graph_store.get(session_id_from_headers(headers))
 
 class handler(BaseHTTPRequestHandler):
     def do_OPTIONS(self):
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-Session-Id, X-User-Id')
         self.end_headers()
 
     def do_GET(self):
         try:
-            graph = get_graph_manager()
-            data = graph.get_graph_data()
+            params = parse_qs(urlparse(self.path).query)
+            layout = params.get('layout', ['spring'])[0]
+
+            if layout not in LAYOUT_MODES:
+                self.send_response(400)
+                self.send_header('Content-type', 'application/json')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                response = json.dumps({"error": f"Unknown layout: {layout}"})
+                self.wfile.write(response.encode())
+                return
+
+            since = params.get('since', [None])[0]
+            if since is not None and not since.lstrip('-').isdigit():
+                self.send_response(400)
+                self.send_header('Content-type', 'application/json')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                response = json.dumps({"error": "since must be an integer revision"})
+                self.wfile.write(response.encode())
+                return
+
+            graph = get_graph_manager(self.headers)
+            if since is not None:
+                data = graph.get_changes_since(int(since), layout=layout)
+            else:
+                data = graph.get_graph_data(layout=layout)
 
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
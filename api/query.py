@@ -6,18 +6,23 @@ import os
 # Add backend directory to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'backend'))
 
-from graph_manager import GraphManager
+from session_store import SessionStore, session_id_from_headers
+from graph_persistence import SQLitePersistence
 from claude_integration import ClaudeIntegration
+from response_cache import cache_bypassed
+from rules_snapshot import RulesReloader
+from rules_prepass import QueryPrepass
 
 # Initialize managers (singleton pattern for Vercel)
-graph_manager = None
+graph_store = None
 claude_integration = None
+query_prepass = None
 
-def get_graph_manager():
-    global graph_manager
-    if graph_manager is None:
-        graph_manager = GraphManager()
-    return graph_manager
+def get_graph_manager(headers):
+    global graph_store
+    if graph_store is None:
+        graph_store = SessionStore(persistence=SQLitePersistence.from_env())
+    return graph_store.get(session_id_from_headers(headers))
 
 def get_claude_integration():
     global claude_integration
@@ -25,12 +30,19 @@ def get_claude_integration():
         claude_integration = ClaudeIntegration()
     return claude_integration
 
+def get_query_prepass():
+    # The compiled rules snapshot keeps this cheap on a cold start
+    global query_prepass
+    if query_prepass is None:
+        query_prepass = QueryPrepass(RulesReloader())
+    return query_prepass
+
 class handler(BaseHTTPRequestHandler):
     def do_OPTIONS(self):
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-Session-Id, X-User-Id, X-Cache-Bypass')
         self.end_headers()
 
     def do_POST(self):
@@ -51,57 +63,34 @@ class handler(BaseHTTPRequestHandler):
                 self.wfile.write(response.encode())
                 return
 
-            # Get current graph context
-            graph = get_graph_manager()
-            current_data = graph.get_graph_data()
-
-            # Call Claude
-            claude = get_claude_integration()
-            updates = claude.process_query(query_text, current_data)
-
-            # Update Graph
-            label_to_id = {node['data']['label']: node['id'] for node in current_data['nodes']}
-            new_nodes_created = []
-
-            for node in updates.get("new_nodes", []):
-                if node['label'] in label_to_id:
-                    continue
-
-                new_id = graph.add_node(
-                    node_type=node.get('type', 'action'),
-                    label=node['label'],
-                    description=node.get('description', ''),
-                    source=node.get('source', 'AI Generated'),
-                    status=node.get('status', 'pending'),
-                    agency=node.get('agency'),
-                    deadline=node.get('deadline'),
-                    required_documents=node.get('required_documents', [])
-                )
-                label_to_id[node['label']] = new_id
-                new_nodes_created.append(node)
-
-            for edge in updates.get("new_edges", []):
-                source_label = edge.get('source_label')
-                target_label = edge.get('target_label')
+            # Rule-derived steps first; Claude only for what the rules don't cover
+            # (labels are deduplicated through the graph's label index)
+            graph = get_graph_manager(self.headers)
+            updates, prepass = get_query_prepass().answer(query_text, graph, get_claude_integration(),
+                                                          use_cache=not cache_bypassed(self.headers))
 
-                if source_label in label_to_id and target_label in label_to_id:
-                    graph.add_edge(
-                        source_id=label_to_id[source_label],
-                        target_id=label_to_id[target_label],
-                        edge_type=edge.get('type', 'dependency'),
-                        description=edge.get('description', '')
-                    )
+            graph.flush()
 
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
             self.end_headers()
 
-            response = json.dumps({
-                "message": "Graph updated",
-                "updates": updates,
-                "graph": graph.get_graph_data()
-            })
+            since = data.get('since')
+            if isinstance(since, int):
+                response = json.dumps({
+                    "message": "Graph updated",
+                    "updates": updates,
+                    "rules": prepass,
+                    "changes": graph.get_changes_since(since)
+                })
+            else:
+                response = json.dumps({
+                    "message": "Graph updated",
+                    "updates": updates,
+                    "rules": prepass,
+                    "graph": graph.get_graph_data()
+                })
             self.wfile.write(response.encode())
 
         except Exception as e:
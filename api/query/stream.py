@@ -0,0 +1,89 @@
+from http.server import BaseHTTPRequestHandler
+import json
+import sys
+import os
+
+# Add backend directory to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+
+from session_store import SessionStore, session_id_from_headers
+from graph_persistence import SQLitePersistence
+from claude_integration import ClaudeIntegration
+from response_cache import cache_bypassed
+from rules_snapshot import RulesReloader
+from rules_prepass import QueryPrepass
+from sse import query_sse_events
+
+# Initialize managers (singleton pattern for Vercel)
+graph_store = None
+claude_integration = None
+query_prepass = None
+
+def get_graph_manager(headers):
+    global graph_store
+    if graph_store is None:
+        graph_store = SessionStore(persistence=SQLitePersistence.from_env())
+    return graph_store.get(session_id_from_headers(headers))
+
+def get_claude_integration():
+    global claude_integration
+    if claude_integration is None:
+        claude_integration = ClaudeIntegration()
+    return claude_integration
+
+def get_query_prepass():
+    global query_prepass
+    if query_prepass is None:
+        query_prepass = QueryPrepass(RulesReloader())
+    return query_prepass
+
+class handler(BaseHTTPRequestHandler):
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-Session-Id, X-User-Id, X-Cache-Bypass')
+        self.end_headers()
+
+    def do_POST(self):
+        try:
+            # Read request body
+            content_length = int(self.headers['Content-Length'])
+            post_data = self.rfile.read(content_length)
+            data = json.loads(post_data.decode('utf-8'))
+
+            query_text = data.get('query')
+
+            if not query_text:
+                self.send_response(400)
+                self.send_header('Content-type', 'application/json')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                response = json.dumps({"error": "No query provided"})
+                self.wfile.write(response.encode())
+                return
+
+            graph = get_graph_manager(self.headers)
+            prepass = get_query_prepass()
+
+        except Exception as e:
+            self.send_response(500)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            response = json.dumps({"error": str(e)})
+            self.wfile.write(response.encode())
+            return
+
+        self.send_response(200)
+        self.send_header('Content-type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+
+        # Apply and stream each node/edge as the rules or Claude produce it (errors are reported as an SSE event)
+        claude = get_claude_integration()
+        for event in query_sse_events(claude, graph, query_text, None,
+                                      use_cache=not cache_bypassed(self.headers), query_prepass=prepass):
+            self.wfile.write(event.encode())
+            self.wfile.flush()
@@ -0,0 +1,54 @@
+from http.server import BaseHTTPRequestHandler
+import json
+import sys
+import os
+
+# Add backend directory to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from session_store import SessionStore, session_id_from_headers
+from graph_persistence import SQLitePersistence
+
+# Per-session graph store (singleton pattern for Vercel)
+graph_store = None
+
+def get_graph_manager(headers):
+    global graph_store
+    if graph_store is None:
+        graph_store = SessionStore(persistence=SQLitePersistence.from_env())
+    return graph_store.get(session_id_from_headers(headers))
+
+class handler(BaseHTTPRequestHandler):
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-Session-Id, X-User-Id')
+        self.end_headers()
+
+    def send_json(self, status, data):
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(json.dumps(data).encode())
+
+    def do_GET(self):
+        self.respond(None)
+
+    def do_POST(self):
+        # Anchors aren't persisted with the graph: send them with every request
+        content_length = int(self.headers.get('Content-Length') or 0)
+        data = json.loads(self.rfile.read(content_length).decode('utf-8') or '{}') if content_length else {}
+        self.respond(data.get('anchors'))
+
+    def respond(self, anchors):
+        try:
+            if anchors is not None and not isinstance(anchors, dict):
+                self.send_json(400, {"error": "anchors must be an object of name: date"})
+                return
+            self.send_json(200, get_graph_manager(self.headers).get_schedule(anchors))
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+        except Exception as e:
+            self.send_json(500, {"error": str(e)})
@@ -7,6 +7,7 @@ import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'backend'))
 
 from claude_integration import ClaudeIntegration
+from response_cache import cache_bypassed
 
 # Initialize Claude integration (singleton pattern for Vercel)
 claude_integration = None
@@ -22,7 +23,7 @@ class handler(BaseHTTPRequestHandler):
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-Cache-Bypass')
         self.end_headers()
 
     def do_POST(self):
@@ -44,7 +45,7 @@ class handler(BaseHTTPRequestHandler):
                 return
 
             claude = get_claude_integration()
-            items = claude.extract_timeline_from_conversation(history)
+            items = claude.extract_timeline_from_conversation(history, use_cache=not cache_bypassed(self.headers))
 
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
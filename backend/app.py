@@ -1,21 +1,33 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-from graph_manager import GraphManager
+from session_store import SessionStore, session_id_from_headers
+from graph_persistence import SQLitePersistence
+from layout_engine import LAYOUT_MODES
 from claude_integration import ClaudeIntegration
-from file_parser import extract_text_from_file
-import os
-from werkzeug.utils import secure_filename
+from sse import chat_sse_events, query_sse_events
+from response_cache import cache_bypassed
+from file_parser import ParseCache
+from upload_stream import UploadError, stream_uploads
+from document_store import DocumentStore, document_refs, parse_page_range
+from rules_snapshot import RulesReloader
+from rules_prepass import QueryPrepass
 
 app = Flask(__name__)
 CORS(app)
 
-UPLOAD_FOLDER = 'uploads'
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
-graph_manager = GraphManager()
-claude_integration = ClaudeIntegration()
+graph_store = SessionStore(persistence=SQLitePersistence.from_env())
+parse_cache = ParseCache()
+document_store = DocumentStore(parse_cache=parse_cache)
+claude_integration = ClaudeIntegration(documents=document_store)
+# Compiled rules, swapped out when rules.json changes
+rules = RulesReloader()
+query_prepass = QueryPrepass(rules)
+
+def get_graph_manager():
+    """Returns the graph for the session named in the request headers."""
+    return graph_store.get(session_id_from_headers(request.headers))
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -23,9 +35,54 @@ def health_check():
 
 @app.route('/graph', methods=['GET'])
 def get_graph():
-    data = graph_manager.get_graph_data()
+    layout = request.args.get('layout', 'spring')
+    if layout not in LAYOUT_MODES:
+        return jsonify({"error": f"Unknown layout: {layout}"}), 400
+
+    graph_manager = get_graph_manager()
+    since = request.args.get('since')
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return jsonify({"error": "since must be an integer revision"}), 400
+        return jsonify(graph_manager.get_changes_since(since, layout=layout)), 200
+
+    data = graph_manager.get_graph_data(layout=layout)
     return jsonify(data), 200
 
+@app.route('/schedule', methods=['GET', 'POST'])
+def get_schedule():
+    """
+    Earliest/latest dates, slack and the critical path over the session's
+    dependency edges. POST {"anchors": {"graduation": "2024-05-15"}} sets
+    the named dates deadlines are measured from (null drops one).
+    """
+    anchors = (request.json or {}).get('anchors') if request.method == 'POST' else None
+    if anchors is not None and not isinstance(anchors, dict):
+        return jsonify({"error": "anchors must be an object of name: date"}), 400
+    try:
+        return jsonify(get_graph_manager().get_schedule(anchors)), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return jsonify({
+        "sessions": graph_store.metrics(),
+        "chat": claude_integration.get_chat_stats(),
+        "llm_usage": claude_integration.get_usage_stats(),
+        "parse_cache": parse_cache.metrics(),
+        "documents": document_store.metrics(),
+        "retrieval": claude_integration.retrieval.metrics(),
+        "chat_stream": claude_integration.get_stream_stats(),
+        "llm_cache": claude_integration.cache.metrics(),
+        "timeline": dict(claude_integration.timeline_stats),
+        "layout": get_graph_manager().get_layout_stats(),
+        "rules": rules.metrics(),
+        "query_rules": query_prepass.metrics()
+    }), 200
+
 @app.route('/query', methods=['POST'])
 def query_graph():
     data = request.json
@@ -34,72 +91,87 @@ def query_graph():
     if not query_text:
         return jsonify({"error": "No query provided"}), 400
 
-    # 1. Get current graph context (simplified for prompt)
-    current_data = graph_manager.get_graph_data()
-    
-    # 2. Call Claude
-    updates = claude_integration.process_query(query_text, current_data)
-    
-    # 3. Update Graph
-    # We need a mapping from label to ID to create edges, as Claude returns labels
-    # Use existing nodes first
-    label_to_id = {node['data']['label']: node['id'] for node in current_data['nodes']}
-    
-    new_nodes_created = []
-    
-    for node in updates.get("new_nodes", []):
-        # Check if node with same label exists to avoid duplicates (basic check)
-        if node['label'] in label_to_id:
-            continue
-            
-        new_id = graph_manager.add_node(
-            node_type=node.get('type', 'action'),
-            label=node['label'],
-            description=node.get('description', ''),
-            source=node.get('source', 'AI Generated'),
-            status=node.get('status', 'pending'),
-            agency=node.get('agency'),
-            deadline=node.get('deadline'),
-            required_documents=node.get('required_documents', [])
-        )
-        label_to_id[node['label']] = new_id
-        new_nodes_created.append(node)
-
-    for edge in updates.get("new_edges", []):
-        source_label = edge.get('source_label')
-        target_label = edge.get('target_label')
-        
-        if source_label in label_to_id and target_label in label_to_id:
-            graph_manager.add_edge(
-                source_id=label_to_id[source_label],
-                target_id=label_to_id[target_label],
-                edge_type=edge.get('type', 'dependency'),
-                description=edge.get('description', '')
-            )
+    graph_manager = get_graph_manager()
+
+    # 1. Steps of the rules that apply to facts the user states go in first;
+    #    if the rules cover the whole question, that's the answer
+    # 2. Otherwise Claude is asked about the rest, given the current graph
+    #    context (compact, pruned to what's relevant, with the rule steps)
+    # 3. Claude refers to nodes by label; the graph's label index maps them to
+    #    existing nodes (normalized/fuzzy) so we don't create duplicates.
+    updates, prepass = query_prepass.answer(query_text, graph_manager, claude_integration,
+                                            use_cache=not cache_bypassed(request.headers))
+
+    graph_manager.flush()
+
+    # Clients that send the revision they already have get a delta back
+    # instead of the full snapshot.
+    since = data.get('since')
+    if isinstance(since, int):
+        return jsonify({
+            "message": "Graph updated",
+            "updates": updates,
+            "rules": prepass,
+            "changes": graph_manager.get_changes_since(since)
+        }), 200
 
     return jsonify({
         "message": "Graph updated", 
         "updates": updates,
+        "rules": prepass,
         "graph": graph_manager.get_graph_data()
     }), 200
 
+@app.route('/query/stream', methods=['POST'])
+def query_graph_stream():
+    """Same as /query (rules pre-pass included), but applies and streams each node and edge as it's written (SSE)."""
+    data = request.json or {}
+    query_text = data.get('query')
+    if not query_text:
+        return jsonify({"error": "No query provided"}), 400
+
+    graph_manager = get_graph_manager()
+    events = query_sse_events(claude_integration, graph_manager, query_text, None,
+                              use_cache=not cache_bypassed(request.headers), query_prepass=query_prepass)
+    return Response(stream_with_context(events), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/chat', methods=['POST'])
 def chat():
     data = request.json
     query_text = data.get('query')
     conversation_history = data.get('history', [])
-    file_contents = data.get('files', [])
+    # Uploaded documents are referenced by id; `files` still accepts inline text
+    file_contents = data.get('files', []) + document_refs(data.get('document_ids'))
 
     if not query_text:
         return jsonify({"error": "No query provided"}), 400
 
     # Call Claude for conversational response with file content
-    answer = claude_integration.chat(query_text, conversation_history, file_contents)
+    answer = claude_integration.chat(query_text, conversation_history, file_contents,
+                                     session_id=session_id_from_headers(request.headers))
 
     return jsonify({
         "answer": answer
     }), 200
 
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Same as /chat, but streams the answer back as Server-Sent Events."""
+    data = request.json
+    query_text = data.get('query')
+    conversation_history = data.get('history', [])
+    # Uploaded documents are referenced by id; `files` still accepts inline text
+    file_contents = data.get('files', []) + document_refs(data.get('document_ids'))
+
+    if not query_text:
+        return jsonify({"error": "No query provided"}), 400
+
+    events = chat_sse_events(claude_integration, query_text, conversation_history, file_contents,
+                             session_id=session_id_from_headers(request.headers))
+    return Response(stream_with_context(events), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/timeline', methods=['POST'])
 def extract_timeline():
     """Extract timeline action items from the chat conversation (no hardcoded patterns)."""
@@ -109,45 +181,56 @@ def extract_timeline():
     if not history:
         return jsonify({"items": []}), 200
 
-    items = claude_integration.extract_timeline_from_conversation(history)
+    items = claude_integration.extract_timeline_from_conversation(history,
+                                                                  use_cache=not cache_bypassed(request.headers))
     return jsonify({"items": items}), 200
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    if 'files' not in request.files:
+    # The body is parsed as it streams in (request.files would buffer it first).
+    # Files are kept in the document store; chat requests refer to them by document_id.
+    try:
+        uploaded_files = stream_uploads(request.stream, request.content_type, request.content_length,
+                                        documents=document_store, max_bytes=app.config['MAX_CONTENT_LENGTH'])
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+
+    if not uploaded_files:
         return jsonify({"error": "No files provided"}), 400
 
-    files = request.files.getlist('files')
-    uploaded_files = []
-
-    for file in files:
-        if file.filename == '':
-            continue
-
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-
-        # Extract text content from the file
-        file_content = extract_text_from_file(filepath)
-
-        uploaded_files.append({
-            'filename': filename,
-            'path': filepath,
-            'content': file_content.get('text'),
-            'pages': file_content.get('pages', 0),
-            'type': file_content.get('type', 'Unknown'),
-            'error': file_content.get('error')
-        })
-
     return jsonify({
         "message": "Files uploaded successfully",
         "files": uploaded_files
     }), 200
 
+@app.route('/documents/<document_id>', methods=['GET'])
+def get_document(document_id):
+    """
+    Text of an uploaded document: the pages in ?pages= (1-based, e.g. 2-4),
+    or with ?q= the chunks most relevant to the question. Only those pages
+    are extracted.
+    """
+    info = document_store.info(document_id)
+    if info is None:
+        return jsonify({"error": "Document not found"}), 404
+
+    query_text = request.args.get('q')
+    if query_text:
+        sections = document_store.search(document_id, query_text)
+        return jsonify(dict(info, chunks=[{"page": page + 1, "text": text} for page, text in sections])), 200
+
+    try:
+        start, stop = parse_page_range(request.args.get('pages', '1'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    texts = document_store.pages(document_id, start, stop)
+    return jsonify(dict(info, text=[{"page": start + i + 1, "text": text} for i, text in enumerate(texts)])), 200
+
 @app.route('/clear', methods=['POST'])
 def clear_graph():
+    graph_manager = get_graph_manager()
     graph_manager.clear_graph()
+    graph_manager.flush()
     return jsonify({"message": "Graph cleared"}), 200
 
 if __name__ == '__main__':
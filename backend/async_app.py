@@ -0,0 +1,164 @@
+"""
+asyncio entry point for the LLM-bound routes, served with aiohttp.
+
+Runs alongside app.py and speaks the same JSON contract for /health, /graph,
+/query, /chat, /timeline and /clear, but a single worker can keep many Claude
+round trips in flight instead of pinning a thread per request. Work that
+blocks (SQLite session loads and writes, layout, context serialization)
+runs in the default thread pool so it doesn't stall the event loop.
+
+    python async_app.py   # listens on LEGOL_ASYNC_PORT (default 5002)
+"""
+import asyncio
+import os
+from aiohttp import web
+from async_claude_integration import AsyncClaudeIntegration
+from document_store import document_refs
+from graph_persistence import SQLitePersistence
+from layout_engine import LAYOUT_MODES
+from response_cache import cache_bypassed
+from rules_prepass import QueryPrepass
+from rules_snapshot import RulesReloader
+from session_store import SessionStore, session_id_from_headers
+
+graph_store = SessionStore(persistence=SQLitePersistence.from_env())
+query_prepass = QueryPrepass(RulesReloader())
+# Created on startup, inside the event loop that owns its connection pool
+claude_integration = None
+
+routes = web.RouteTableDef()
+
+
+async def get_graph_manager(request):
+    """Returns the graph for the session named in the request headers (loading it may hit SQLite)."""
+    return await asyncio.to_thread(graph_store.get, session_id_from_headers(request.headers))
+
+
+def _graph_response(graph_manager, updates, prepass, since):
+    """Writes the session back and builds the /query response, like app.py."""
+    graph_manager.flush()
+    # Clients that send the revision they already have get a delta back
+    if isinstance(since, int):
+        return {"message": "Graph updated", "updates": updates, "rules": prepass,
+                "changes": graph_manager.get_changes_since(since)}
+    return {"message": "Graph updated", "updates": updates, "rules": prepass, "graph": graph_manager.get_graph_data()}
+
+
+@web.middleware
+async def cors_middleware(request, handler):
+    if request.method == 'OPTIONS':
+        response = web.Response()
+    else:
+        response = await handler(request)
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
+    response.headers['Access-Control-Allow-Headers'] = 'Content-Type, X-Session-Id, X-User-Id, X-Cache-Bypass'
+    return response
+
+
+@routes.get('/health')
+async def health_check(request):
+    return web.json_response({"status": "healthy"})
+
+
+@routes.get('/graph')
+async def get_graph(request):
+    layout = request.query.get('layout', 'spring')
+    if layout not in LAYOUT_MODES:
+        return web.json_response({"error": f"Unknown layout: {layout}"}, status=400)
+
+    graph_manager = await get_graph_manager(request)
+    since = request.query.get('since')
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return web.json_response({"error": "since must be an integer revision"}, status=400)
+        return web.json_response(await asyncio.to_thread(graph_manager.get_changes_since, since, layout=layout))
+
+    return web.json_response(await asyncio.to_thread(graph_manager.get_graph_data, layout=layout))
+
+
+@routes.post('/query')
+async def query_graph(request):
+    data = await request.json()
+    query_text = data.get('query')
+    if not query_text:
+        return web.json_response({"error": "No query provided"}, status=400)
+
+    graph_manager = await get_graph_manager(request)
+    # Rule-derived steps first; Claude only for what the rules don't cover
+    updates, prepass = await query_prepass.answer_async(query_text, graph_manager, claude_integration,
+                                                        use_cache=not cache_bypassed(request.headers))
+    return web.json_response(await asyncio.to_thread(_graph_response, graph_manager, updates, prepass,
+                                                     data.get('since')))
+
+
+@routes.post('/chat')
+async def chat(request):
+    data = await request.json()
+    query_text = data.get('query')
+    if not query_text:
+        return web.json_response({"error": "No query provided"}, status=400)
+
+    files = data.get('files', []) + document_refs(data.get('document_ids'))
+    answer = await claude_integration.chat(query_text, data.get('history', []), files,
+                                           session_id=session_id_from_headers(request.headers))
+    return web.json_response({"answer": answer})
+
+
+@routes.post('/timeline')
+async def extract_timeline(request):
+    data = await request.json()
+    history = data.get('history', [])
+    if not history:
+        return web.json_response({"items": []})
+
+    items = await claude_integration.extract_timeline_from_conversation(
+        history, use_cache=not cache_bypassed(request.headers))
+    return web.json_response({"items": items})
+
+
+@routes.post('/clear')
+async def clear_graph(request):
+    graph_manager = await get_graph_manager(request)
+    graph_manager.clear_graph()
+    await asyncio.to_thread(graph_manager.flush)
+    return web.json_response({"message": "Graph cleared"})
+
+
+@routes.get('/metrics')
+async def get_metrics(request):
+    return web.json_response({
+        "sessions": graph_store.metrics(),
+        "llm_limiter": dict(claude_integration.limiter.stats),
+        "chat": claude_integration.get_chat_stats(),
+        "llm_usage": claude_integration.get_usage_stats(),
+        "llm_cache": claude_integration.cache.metrics(),
+        "timeline": dict(claude_integration.timeline_stats),
+        "documents": claude_integration.documents.metrics(),
+        "retrieval": claude_integration.retrieval.metrics(),
+        "rules": query_prepass.rules.metrics(),
+        "query_rules": query_prepass.metrics()
+    })
+
+
+async def init_claude_integration(app):
+    global claude_integration
+    claude_integration = AsyncClaudeIntegration()
+
+
+async def close_claude_integration(app):
+    await claude_integration.client.close()
+
+
+def create_app():
+    app = web.Application(middlewares=[cors_middleware])
+    app.add_routes(routes)
+    app.on_startup.append(init_claude_integration)
+    app.on_cleanup.append(close_claude_integration)
+    return app
+
+
+if __name__ == '__main__':
+    web.run_app(create_app(), port=int(os.getenv("LEGOL_ASYNC_PORT", 5002)))
@@ -0,0 +1,187 @@
+import asyncio
+import json
+import os
+import time
+from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient
+from claude_integration import ClaudeIntegration, CHAT_ERROR_MESSAGE, CHAT_MODEL, extract_json, parse_json_output
+
+# One client (and so one HTTP connection pool) per process, shared by every
+# AsyncClaudeIntegration. Concurrency is bounded by RateLimiter, well below
+# the SDK's default pool size.
+_shared_client = None
+
+
+def make_async_http_client():
+    """
+    Prefers the SDK's aiohttp transport (anthropic[aiohttp]), whose pool holds
+    up much better under many concurrent requests than httpx's default one.
+    Must be called from inside a running event loop.
+    """
+    try:
+        from anthropic import DefaultAioHttpClient
+        return DefaultAioHttpClient()
+    except (ImportError, RuntimeError):
+        return DefaultAsyncHttpxClient()
+
+
+def get_shared_async_client():
+    global _shared_client
+    if _shared_client is None:
+        api_key = os.getenv("ANTHROPIC_API_KEY")
+        if not api_key:
+            print("WARNING: ANTHROPIC_API_KEY not found in environment variables.")
+        _shared_client = AsyncAnthropic(api_key=api_key, http_client=make_async_http_client())
+    return _shared_client
+
+
+class RateLimiter:
+    """
+    Async context manager that keeps LLM calls under provider limits: at most
+    `max_concurrency` calls in flight (semaphore) and, if `requests_per_second`
+    is set, no more than that many starts per second (token bucket with
+    `burst` capacity). Defaults come from LEGOL_LLM_MAX_CONCURRENCY and
+    LEGOL_LLM_RPS (0 = no rate cap).
+    """
+
+    def __init__(self, max_concurrency=None, requests_per_second=None, burst=None):
+        self.max_concurrency = max_concurrency or int(os.getenv("LEGOL_LLM_MAX_CONCURRENCY", 16))
+        self.requests_per_second = (requests_per_second if requests_per_second is not None
+                                    else float(os.getenv("LEGOL_LLM_RPS", 0)))
+        self.burst = burst or max(1, int(self.requests_per_second))
+        self.stats = {"acquired": 0, "in_flight": 0, "waited_ms": 0.0}
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._bucket_lock = asyncio.Lock()
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+
+    async def __aenter__(self):
+        start = time.perf_counter()
+        await self._semaphore.acquire()
+        try:
+            await self._take_token()
+        except BaseException:
+            self._semaphore.release()
+            raise
+        self.stats["acquired"] += 1
+        self.stats["in_flight"] += 1
+        self.stats["waited_ms"] += (time.perf_counter() - start) * 1000
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.stats["in_flight"] -= 1
+        self._semaphore.release()
+        return False
+
+    async def _take_token(self):
+        if not self.requests_per_second:
+            return
+        async with self._bucket_lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.requests_per_second)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.requests_per_second)
+
+
+class AsyncClaudeIntegration(ClaudeIntegration):
+    """
+    asyncio version of ClaudeIntegration built on AsyncAnthropic. Prompts are
+    shared with the sync class; every call goes through `limiter`.
+    """
+
+    def __init__(self, client=None, limiter=None, cache=None, documents=None):
+        super().__init__(client=client or get_shared_async_client(), cache=cache, documents=documents)
+        self.limiter = limiter or RateLimiter()
+
+    async def _cached_json(self, request, use_cache=True):
+        key, text = self._cache_lookup(request, use_cache)
+        if text is not None:
+            return json.loads(extract_json(text))
+        start = time.perf_counter()
+        async with self.limiter:
+            response = await self.client.messages.create(**request)
+        self._record_usage(response)
+        text = response.content[0].text
+        data, complete = parse_json_output(text)
+        if complete:
+            self.cache.put(key, text, (time.perf_counter() - start) * 1000)
+        return data
+
+    async def process_query(self, query_text, current_graph_context, use_cache=True):
+        request = self._build_query_request(query_text, current_graph_context)
+        try:
+            return await self._cached_json(request, use_cache)
+        except Exception as e:
+            print(f"Error calling Claude: {e}")
+            return {"new_nodes": [], "new_edges": []}
+
+    async def _summarize_turns(self, previous_summary, turns):
+        self.chat_stats["summaries"] += 1
+        try:
+            async with self.limiter:
+                response = await self.client.messages.create(**self._build_summary_request(previous_summary, turns))
+            self._record_usage(response)
+            return response.content[0].text.strip()
+        except Exception as e:
+            print(f"Error summarizing conversation: {type(e).__name__}: {e}")
+            return self._fallback_summary(previous_summary, turns)
+
+    async def _chat_request(self, query_text, conversation_history=None, file_contents=None, session_id=None,
+                            metrics=None):
+        plan = self.window.plan(conversation_history, CHAT_MODEL)
+        summary = plan["summary"]
+        if plan["to_fold"]:
+            summary = await self._summarize_turns(summary, plan["to_fold"])
+            self.window.remember(plan["key"], summary)
+        # Page extraction reads files; keep it off the event loop
+        documents = await asyncio.to_thread(self._document_excerpts, query_text, session_id, file_contents)
+        request = self._build_chat_request(query_text, plan["turns"], summary, documents)
+        tokens = self._record_chat_request(request, plan)
+        if metrics is not None:
+            metrics["prompt_tokens"] = tokens
+        return request
+
+    async def chat(self, query_text, conversation_history=None, file_contents=None, session_id=None):
+        request = await self._chat_request(query_text, conversation_history, file_contents, session_id)
+        try:
+            async with self.limiter:
+                response = await self.client.messages.create(**request)
+            self._record_usage(response, chat=True)
+            return response.content[0].text
+        except Exception as e:
+            print(f"Error calling Claude for chat: {type(e).__name__}: {e}")
+            return CHAT_ERROR_MESSAGE
+
+    async def chat_stream(self, query_text, conversation_history=None, file_contents=None, session_id=None,
+                          metrics=None):
+        metrics = {} if metrics is None else metrics
+        request = await self._chat_request(query_text, conversation_history, file_contents, session_id, metrics)
+        start = time.perf_counter()
+        first_chunk_at = None
+        try:
+            async with self.limiter:
+                async with self.client.messages.stream(**request) as stream:
+                    async for text in stream.text_stream:
+                        if first_chunk_at is None:
+                            first_chunk_at = time.perf_counter()
+                        yield text
+                    tokens = self._record_usage(await stream.get_final_message(), chat=True)
+                    if tokens is not None:
+                        metrics["prompt_tokens"] = tokens
+        except Exception as e:
+            print(f"Error streaming chat from Claude: {type(e).__name__}: {e}")
+            yield ("\n\n" if first_chunk_at else "") + CHAT_ERROR_MESSAGE
+        metrics.update(self._record_stream(start, first_chunk_at or time.perf_counter(), time.perf_counter()))
+
+    async def extract_timeline_from_conversation(self, conversation_history, use_cache=True):
+        keys, previous, request = self._plan_timeline(conversation_history, incremental=use_cache)
+        if request is None:
+            return previous or []
+        try:
+            return self._finish_timeline(keys, previous, await self._cached_json(request, use_cache))
+        except Exception as e:
+            print(f"Error extracting timeline from conversation: {e}")
+            return previous or []
@@ -0,0 +1,101 @@
+"""
+Load test: sync ClaudeIntegration on a fixed pool of worker threads (like
+Flask workers) vs AsyncClaudeIntegration on a single event loop, both talking
+to a local stub of the Messages API that answers after a fixed latency.
+
+Usage: python bench_async_load.py [--latency 0.2] [--requests 200] [--workers 1 4 16]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+from anthropic import Anthropic, AsyncAnthropic
+
+from async_claude_integration import AsyncClaudeIntegration, RateLimiter, make_async_http_client
+from claude_integration import ClaudeIntegration
+
+HISTORY = [{"role": "user", "text": "I'm on an F-1 visa and graduating in May. What do I need for OPT?"}]
+STUB_RESPONSE = {
+    "id": "msg_stub",
+    "type": "message",
+    "role": "assistant",
+    "model": "claude-3-haiku-20240307",
+    "content": [{"type": "text", "text": '{"items": [{"title": "File I-765", "description": "d", "relatedDocuments": []}]}'}],
+    "stop_reason": "end_turn",
+    "stop_sequence": None,
+    "usage": {"input_tokens": 100, "output_tokens": 20}
+}
+
+
+def _serve_stub(port, latency):
+    async def messages(request):
+        await request.read()
+        await asyncio.sleep(latency)
+        return web.json_response(STUB_RESPONSE)
+
+    app = web.Application()
+    app.router.add_post('/v1/messages', messages)
+    web.run_app(app, host='127.0.0.1', port=port, print=None)
+
+
+def start_stub_server(latency):
+    """Runs the stub Messages API in a separate process; returns its base URL."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    multiprocessing.Process(target=_serve_stub, args=(port, latency), daemon=True).start()
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+def run_sync(base_url, workers, total):
+    claude = ClaudeIntegration(client=Anthropic(api_key="stub", base_url=base_url, max_retries=0))
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda _: claude.extract_timeline_from_conversation(HISTORY, use_cache=False), range(total)))
+    assert all(results)
+    return total / (time.perf_counter() - start)
+
+
+def run_async(base_url, concurrency, total):
+    async def main():
+        client = AsyncAnthropic(api_key="stub", base_url=base_url, max_retries=0,
+                                http_client=make_async_http_client())
+        claude = AsyncClaudeIntegration(client=client, limiter=RateLimiter(max_concurrency=concurrency))
+        start = time.perf_counter()
+        results = await asyncio.gather(*[claude.extract_timeline_from_conversation(HISTORY, use_cache=False) for _ in range(total)])
+        elapsed = time.perf_counter() - start
+        await client.close()
+        assert all(results)
+        return total / elapsed
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.2, help="stub response latency in seconds")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--async-concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    base_url = start_stub_server(args.latency)
+    print(f"stub latency {args.latency * 1000:.0f} ms, {args.requests} requests per run")
+    for workers in args.workers:
+        print(f"sync ClaudeIntegration, {workers:>3} worker threads:      "
+              f"{run_sync(base_url, workers, args.requests):8.1f} req/s")
+    print(f"AsyncClaudeIntegration, 1 worker, limit {args.async_concurrency:>3}: "
+          f"{run_async(base_url, args.async_concurrency, args.requests):8.1f} req/s")
+
+
+if __name__ == "__main__":
+    main()
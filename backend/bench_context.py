@@ -0,0 +1,51 @@
+"""
+Reports how much smaller the compact process_query context is than the old
+json.dumps(get_graph_data(), indent=2) payload on synthetic session graphs.
+
+Usage: python bench_context.py [--sizes 20 100 300 1000] [--budget 2000]
+"""
+import argparse
+import json
+import random
+
+from graph_manager import GraphManager
+from context_serializer import serialize_graph_context, estimate_tokens
+
+LABELS = ["Passport", "DS-160", "I-20", "SEVIS Fee", "Visa Interview", "OPT", "EAD Card",
+          "H-1B Petition", "Military Service Notice", "Tax Return", "Bank Statement", "Transcript"]
+TYPES = ["document", "action", "agency", "event"]
+
+
+def make_session(n, seed=0):
+    rng = random.Random(seed)
+    gm = GraphManager()
+    ids = []
+    for i in range(n):
+        ids.append(gm.add_node(rng.choice(TYPES), f"{rng.choice(LABELS)} {i}",
+                               "Explanation of what this step involves and why it matters for the user.",
+                               source="USCIS", agency=rng.choice(["USCIS", "TECO", "CMU OIE", None]),
+                               deadline=rng.choice(["30 days before expiry", None]),
+                               required_documents=["Passport", "I-20"]))
+        if i:
+            gm.add_edge(ids[rng.randrange(max(0, i - 10), i)], ids[i],
+                        rng.choice(["dependency", "timeline", "conflict"]), "relationship")
+    return gm
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20, 100, 300, 1000])
+    parser.add_argument("--budget", type=int, default=2000)
+    args = parser.parse_args()
+
+    query = "What do I need to bring to my visa interview?"
+    print(f"{'nodes':>6} {'json tokens':>12} {'compact tokens':>15} {'reduction':>10}")
+    for n in args.sizes:
+        gm = make_session(n)
+        old = estimate_tokens(json.dumps(gm.get_graph_data(), indent=2))
+        new = estimate_tokens(serialize_graph_context(gm.graph, query, token_budget=args.budget))
+        print(f"{n:>6} {old:>12} {new:>15} {old / new:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Compares the spring and layered layout modes on synthetic, mostly-acyclic
+graphs shaped like the ones Claude produces (dependency/timeline chains with
+the odd conflict edge).
+
+Usage: python bench_layout.py [--sizes 100 1000 10000] [--max-spring 10000]
+"""
+import argparse
+import random
+import time
+
+import networkx as nx
+from layout_engine import layered_layout
+
+
+def make_graph(n, seed=0):
+    rng = random.Random(seed)
+    graph = nx.DiGraph()
+    graph.add_nodes_from(range(n))
+    for v in range(1, n):
+        for _ in range(rng.randint(1, 2)):
+            u = rng.randrange(max(0, v - 50), v)
+            graph.add_edge(u, v, type=rng.choice(["dependency", "timeline"]))
+    for _ in range(n // 20):
+        u, v = rng.randrange(n), rng.randrange(n)
+        graph.add_edge(u, v, type="conflict")
+    return graph
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--max-spring", type=int, default=10000,
+                        help="skip spring layout above this many nodes")
+    args = parser.parse_args()
+
+    print(f"{'nodes':>8} {'edges':>8} {'spring (s)':>12} {'layered (s)':>12} {'speedup':>9}")
+    for n in args.sizes:
+        graph = make_graph(n)
+        layered = timed(lambda: layered_layout(graph))
+        if n <= args.max_spring:
+            try:
+                spring = timed(lambda: nx.spring_layout(graph, seed=42))
+                spring_col, speedup = f"{spring:12.3f}", f"{spring / layered:8.0f}x"
+            except ImportError as e:
+                spring_col, speedup = f"{'n/a':>12}", f"{'':>9}"
+                print(f"spring layout unavailable at n={n}: {e}")
+        else:
+            spring_col, speedup = f"{'skipped':>12}", f"{'':>9}"
+        print(f"{n:>8} {graph.number_of_edges():>8} {spring_col} {layered:12.4f} {speedup}")
+
+
+if __name__ == "__main__":
+    main()
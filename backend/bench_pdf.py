@@ -0,0 +1,74 @@
+"""
+Benchmark: serial vs parallel PDF text extraction on generated text PDFs
+of 10, 100 and 1000 pages.
+
+Usage: python bench_pdf.py [--pages 10 100 1000] [--workers 4]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from file_parser import extract_text_from_pdf
+
+
+def write_text_pdf(path, pages, lines_per_page=45):
+    """Writes a minimal PDF with `pages` pages of Helvetica text (no PDF library needed)."""
+    objects = {1: b"<< /Type /Catalog /Pages 2 0 R >>", 3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    kids = []
+    for page in range(pages):
+        page_id, content_id = 4 + 2 * page, 5 + 2 * page
+        lines = [f"({'Form I-20 section %d line %d: certificate of eligibility for nonimmigrant student status' % (page, line)}) Tj T*"
+                 for line in range(lines_per_page)]
+        stream = ("BT /F1 9 Tf 11 TL 40 800 Td\n" + "\n".join(lines) + "\nET").encode()
+        objects[content_id] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream)
+        objects[page_id] = (b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id)
+        kids.append(b"%d 0 R" % page_id)
+    objects[2] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), pages)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for obj_id in sorted(objects):
+        offsets[obj_id] = len(out)
+        out += b"%d 0 obj\n%s\nendobj\n" % (obj_id, objects[obj_id])
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for obj_id in sorted(objects):
+        out += b"%010d 00000 n \n" % offsets[obj_id]
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    print(f"workers={args.workers}")
+    print(f"{'pages':>6} {'serial ms':>10} {'parallel ms':>12} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        # Warm up the process pool so its start-up isn't billed to the first PDF
+        warmup = os.path.join(tmp, "warmup.pdf")
+        write_text_pdf(warmup, 32)
+        extract_text_from_pdf(warmup, workers=args.workers)
+
+        for pages in args.pages:
+            path = os.path.join(tmp, f"{pages}.pdf")
+            write_text_pdf(path, pages)
+            serial, serial_ms = timed(lambda: extract_text_from_pdf(path, workers=1))
+            parallel, parallel_ms = timed(lambda: extract_text_from_pdf(path, workers=args.workers))
+            assert serial["text"] == parallel["text"] and serial["pages"] == pages
+            print(f"{pages:>6} {serial_ms:>10.1f} {parallel_ms:>12.1f} {serial_ms / parallel_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
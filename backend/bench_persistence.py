@@ -0,0 +1,49 @@
+"""
+Measures how long it takes to persist and reload a large session graph
+through SQLitePersistence.
+
+Usage: python bench_persistence.py [--nodes 10000] [--db /tmp/legol_bench.db]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from graph_manager import GraphManager
+from graph_persistence import SQLitePersistence
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=10000)
+    parser.add_argument("--db", default=os.path.join(tempfile.mkdtemp(), "legol_bench.db"))
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    persistence = SQLitePersistence(args.db)
+    gm = GraphManager(persistence=persistence, session_id="bench")
+
+    start = time.perf_counter()
+    ids = []
+    for i in range(args.nodes):
+        ids.append(gm.add_node(rng.choice(["document", "action", "agency", "event"]), f"Step {i}",
+                               "Synthetic node used for the persistence benchmark",
+                               required_documents=["Passport", "I-20"]))
+        if i:
+            gm.add_edge(ids[rng.randrange(max(0, i - 50), i)], ids[i])
+    gm.flush()
+    write_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    loaded = GraphManager.load(SQLitePersistence(args.db), "bench")
+    load_time = time.perf_counter() - start
+
+    assert loaded.graph.number_of_nodes() == args.nodes
+    print(f"nodes={args.nodes} edges={loaded.graph.number_of_edges()}")
+    print(f"build + write-behind flushes: {write_time:.3f}s")
+    print(f"cold load:                    {load_time:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark: /query with the deterministic rules pre-pass vs sending every
+question to the model, over a fixed set of student questions (some the
+rules cover fully, some partly, some not at all).
+
+The model is simulated: each call sleeps --llm-ms (set it to the p50 you
+see in production) and returns one node, so the numbers isolate what the
+pre-pass saves. Reports the share of queries answered without a model
+call and the mean and p50 latency of both pipelines.
+
+Usage: python bench_query_prepass.py [--llm-ms 2500] [--repeat 1]
+"""
+import argparse
+import statistics
+import time
+
+from context_serializer import serialize_graph_context
+from graph_manager import GraphManager
+from rules_prepass import QueryPrepass
+from rules_snapshot import RulesReloader
+
+QUERIES = [
+    "I'm an F-1 student and have to do military service for 8 months. What happens to my status?",
+    "I'm on F-1 and got drafted into the army for two years, what do I need to do?",
+    "F-1 student here, I have national service for 24 months starting soon. What happens?",
+    "I'm an F-1 student doing military service, I already notified OIE. What happens to SEVIS?",
+    "I'm on F-1 and graduating in May. How do I apply for OPT?",
+    "I graduated on F-1 last month, what is the OPT deadline?",
+    "My OPT is approved and my employer will sponsor me for H-1B. What's next?",
+    "I'm an F-1 student, when do I need to apply for OPT after graduation?",
+    "I graduated on F-1, can I travel to Canada while my OPT application is pending?",
+    "I'm an F-1 student doing military service for 6 months, will my scholarship be affected?",
+    "My OPT was approved and my company wants to sponsor me, do I need a lawyer for the H-1B lottery?",
+    "How do I renew my passport from Singapore?",
+    "What documents do I need for a J-1 waiver?",
+    "Can I work on campus during my first semester?",
+    "How long does a green card application take for a spouse?",
+    "What is the difference between CPT and OPT for engineering internships?",
+    "Can my parents visit me on a B-2 tourist visa?",
+    "I'm an F-1 student, how do I transfer my SEVIS record to another university?",
+    "I got a speeding ticket, does that affect my visa renewal?",
+    "What are the tax filing requirements for international students?",
+]
+
+
+class SimulatedClaude:
+    def __init__(self, latency_ms):
+        self.latency_ms = latency_ms
+        self.calls = 0
+
+    def process_query(self, query_text, current_graph_context, use_cache=True):
+        self.calls += 1
+        time.sleep(self.latency_ms / 1000)
+        return {"new_nodes": [{"type": "action", "label": f"Answer {self.calls}", "description": query_text}],
+                "new_edges": []}
+
+
+def model_only(query_text, graph_manager, claude):
+    """/query before the pre-pass."""
+    graph_context = serialize_graph_context(graph_manager.graph, query_text)
+    graph_manager.apply_updates(claude.process_query(query_text, graph_context))
+
+
+def timed_queries(run, repeat):
+    times = []
+    for _ in range(repeat):
+        for query_text in QUERIES:
+            graph_manager = GraphManager()  # a fresh session per question
+            start = time.perf_counter()
+            run(query_text, graph_manager)
+            times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--llm-ms", type=float, default=2500)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    baseline_claude = SimulatedClaude(args.llm_ms)
+    baseline = timed_queries(lambda q, g: model_only(q, g, baseline_claude), args.repeat)
+
+    prepass_claude = SimulatedClaude(args.llm_ms)
+    prepass = QueryPrepass(RulesReloader())
+    with_rules = timed_queries(lambda q, g: prepass.answer(q, g, prepass_claude), args.repeat)
+    metrics = prepass.metrics()
+
+    queries = len(QUERIES) * args.repeat
+    print(f"{queries} queries, simulated model latency {args.llm_ms:.0f} ms")
+    print(f"{'pipeline':>14} {'model calls':>12} {'served by rules':>16} {'mean ms':>9} {'p50 ms':>8}")
+    print(f"{'model only':>14} {baseline_claude.calls:>12} {0:>16.0%} "
+          f"{statistics.mean(baseline):>9.1f} {statistics.median(baseline):>8.1f}")
+    print(f"{'rules pre-pass':>14} {prepass_claude.calls:>12} {metrics['served_by_rules_ratio']:>16.0%} "
+          f"{statistics.mean(with_rules):>9.1f} {statistics.median(with_rules):>8.1f}")
+    print(f"rules-only answers: {metrics['rules_ms_avg']:.2f} ms avg; "
+          f"partly covered (rule steps + model): {metrics['rules_with_llm']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark: per-session BM25 retrieval over 100+ uploaded documents.
+
+Each synthetic document is ~`--pages` pages of immigration boilerplate with
+one distinctive clause planted at a random depth. For a question about each
+clause it reports whether the clause reaches the prompt under the old
+newest-first 4000-character truncation vs retrieval within the same token
+budget, plus incremental indexing cost and query latency (NumPy scoring vs
+a pure-Python loop over the same postings).
+
+Usage: python bench_retrieval.py [--documents 100 200] [--pages 10] [--queries 200]
+"""
+import argparse
+import math
+import random
+import statistics
+import time
+from collections import defaultdict
+
+from context_serializer import estimate_tokens
+from conversation_window import DOCUMENT_EXCERPT_CHARS
+from retrieval_index import BM25Index, RETRIEVAL_TOP_K, tokenize
+
+WORDS = ("visa status employment authorization petition consular processing travel signature "
+         "passport validity enrollment school official record address change deadline filing "
+         "fee receipt notice biometrics interview appointment sponsor eligibility practical training "
+         "optional curricular program extension transfer grace period unlawful presence").split()
+TOKEN_BUDGET = 4000
+
+
+def synthetic_document(rng, number, pages):
+    lines = [" ".join(rng.choice(WORDS) for _ in range(14)) + "." for _ in range(pages * 40)]
+    depth = rng.randrange(len(lines))
+    code = f"k{number}q{rng.randrange(10 ** 6)}"
+    lines[depth] = f"Clause {code}: the {code} waiver must be requested within 60 days of the notice."
+    return "\n".join(lines), code, depth / len(lines)
+
+
+def truncation_prompt(documents):
+    """The old behavior: newest documents first, each cut to DOCUMENT_EXCERPT_CHARS, until the budget is spent."""
+    selected, budget = [], TOKEN_BUDGET
+    for text, _, _ in reversed(documents):
+        excerpt = text[:DOCUMENT_EXCERPT_CHARS]
+        if selected and estimate_tokens(excerpt) > budget:
+            break
+        selected.append(excerpt)
+        budget -= estimate_tokens(excerpt)
+    return "\n".join(selected)
+
+
+def python_scores(index, query):
+    """Reference BM25 scoring with plain Python loops over the same postings."""
+    count = len(index.chunks)
+    average = sum(index.lengths) / count
+    scores = defaultdict(float)
+    for term in set(tokenize(query)):
+        if term not in index.postings:
+            continue
+        chunk_ids, frequencies = index.postings[term]
+        idf = math.log(1 + (count - len(chunk_ids) + 0.5) / (len(chunk_ids) + 0.5))
+        for chunk_id, tf in zip(chunk_ids, frequencies):
+            norm = index.k1 * (1 - index.b + index.b * index.lengths[chunk_id] / average)
+            scores[chunk_id] += idf * tf * (index.k1 + 1) / (tf + norm)
+    return sorted(scores, key=scores.get, reverse=True)[:RETRIEVAL_TOP_K]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, nargs="+", default=[100, 200])
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+    rng = random.Random(7)
+
+    print(f"{'docs':>5} {'chunks':>7} {'index ms/doc':>13} {'numpy p50':>10} {'p95 ms':>7} "
+          f"{'python p50':>11} {'p95 ms':>7} {'recall trunc':>13} {'recall bm25':>12}")
+    for count in args.documents:
+        documents = [synthetic_document(rng, number, args.pages) for number in range(count)]
+        index = BM25Index()
+        start = time.perf_counter()
+        for number, (text, _, _) in enumerate(documents):
+            # Incremental: each upload is indexed as it arrives
+            index.add(number, [(0, text)])
+        index_ms = (time.perf_counter() - start) * 1000 / count
+
+        truncated = truncation_prompt(documents)
+        numpy_ms, python_ms, truncation_hits, retrieval_hits = [], [], 0, 0
+        for _ in range(args.queries):
+            number = rng.randrange(count)
+            _, code, _ = documents[number]
+            query = f"What does the {code} waiver clause say about the deadline?"
+
+            start = time.perf_counter()
+            hits = index.search(query, top_k=RETRIEVAL_TOP_K, token_budget=TOKEN_BUDGET)
+            numpy_ms.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            python_scores(index, query)
+            python_ms.append((time.perf_counter() - start) * 1000)
+
+            truncation_hits += code in truncated
+            retrieval_hits += any(code in text for _, _, text in hits)
+
+        print(f"{count:>5} {len(index.chunks):>7} {index_ms:>13.2f} {statistics.median(numpy_ms):>10.2f} "
+              f"{percentile(numpy_ms, 0.95):>7.2f} {statistics.median(python_ms):>11.2f} "
+              f"{percentile(python_ms, 0.95):>7.2f} {truncation_hits / args.queries:>13.0%} "
+              f"{retrieval_hits / args.queries:>12.0%}")
+
+
+if __name__ == "__main__":
+    main()
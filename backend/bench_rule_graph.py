@@ -0,0 +1,96 @@
+"""
+Benchmark: RulesEngine.build_dependency_graph on a synthetic rule DAG of
+10k rules, 1000 levels deep, vs the old recursive walk that looked up
+every dependency with a linear scan over the rules.
+
+The old walk recurses once per level, so it needs the recursion limit
+raised to run at this depth at all.
+
+Usage: python bench_rule_graph.py [--rules 10000] [--depth 1000] [--repeat 5]
+"""
+import argparse
+import random
+import sys
+import time
+
+from rules_engine import RulesEngine
+
+
+def synthetic_dag(count, depth, rng):
+    """`count` rules in `depth` levels; each rule depends on 1-3 rules of the level below."""
+    width = max(1, count // depth)
+    rules = []
+    for number in range(count):
+        level = number // width
+        below = range((level - 1) * width, level * width) if level else range(0)
+        deps = [f"rule_{dep}" for dep in rng.sample(below, min(len(below), rng.randint(1, 3)))]
+        # Only the top level applies to the benchmark's facts
+        condition = {"stage": "final"} if level == depth - 1 else {"stage": f"level_{level}"}
+        rules.append({"id": f"rule_{number}", "name": f"Rule {number}", "condition": condition,
+                      "depends_on": deps, "source": "synthetic"})
+    return rules
+
+
+def recursive_dependency_graph(engine, facts):
+    """build_dependency_graph before the id index: recursive, one linear scan per dependency."""
+    applicable_rules = engine.find_applicable_rules(facts)
+    nodes = []
+    edges = []
+    visited = set()
+
+    def add_rule(rule_id, depth=0):
+        if rule_id in visited:
+            return
+        visited.add(rule_id)
+        rule = next((r for r in engine.rules if r["id"] == rule_id), None)
+        if not rule:
+            return
+        nodes.append({"id": rule_id, "label": rule["name"], "type": "rule",
+                      "source": rule.get("source", "Unknown"), "source_url": rule.get("source_url", ""),
+                      "deadline": rule.get("deadline_description", ""), "depth": depth})
+        for dep in rule.get("depends_on", []):
+            edges.append({"from": dep, "to": rule_id, "type": "dependency"})
+            add_rule(dep, depth + 1)
+
+    for rule in applicable_rules:
+        add_rule(rule["id"])
+    return {"nodes": nodes, "edges": edges}
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rules", type=int, default=10000)
+    parser.add_argument("--depth", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    facts = {"stage": "final"}
+
+    engine, load_ms = timed(lambda: RulesEngine(rules=synthetic_dag(args.rules, args.depth, random.Random(5))))
+    print(f"{args.rules} rules, depth {args.depth}; load + compile {load_ms:.1f} ms")
+
+    try:
+        recursive_dependency_graph(engine, facts)
+        print("old walk at the default recursion limit: ok")
+    except RecursionError:
+        print("old walk at the default recursion limit: RecursionError")
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, args.depth * 4))
+    old, old_ms = timed(lambda: recursive_dependency_graph(engine, facts))
+    sys.setrecursionlimit(limit)
+
+    new, cold_ms = timed(lambda: engine.build_dependency_graph(facts))
+    assert new == old
+    warm_ms = min(timed(lambda: engine.build_dependency_graph(facts))[1] for _ in range(args.repeat))
+
+    print(f"{'nodes':>6} {'edges':>6} {'old ms':>9} {'cold ms':>9} {'warm ms':>9}")
+    print(f"{len(new['nodes']):>6} {len(new['edges']):>6} {old_ms:>9.1f} {cold_ms:>9.1f} {warm_ms:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
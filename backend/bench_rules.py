@@ -0,0 +1,83 @@
+"""
+Benchmark: RulesEngine.find_applicable_rules with the compiled condition
+index vs the old linear scan over every rule, at 100, 10k and 100k
+synthetic jurisdiction rules.
+
+Usage: python bench_rules.py [--rules 100 10000 100000] [--fact-sets 200]
+"""
+import argparse
+import random
+import time
+
+from rules_engine import RulesEngine
+
+VISA_TYPES = ["F-1", "J-1", "H-1B", "O-1", "L-1", "TN", "E-3", "M-1"]
+STATUSES = ["enrolled", "graduated", "on_leave", "employed", "terminated"]
+FLAGS = ["military_service", "opt_approved", "employer_sponsoring", "oie_notified", "dependents"]
+
+
+def synthetic_rules(count, rng):
+    """`count` rules over 500 jurisdictions, mixing equality, flag and gt/lt conditions."""
+    rules = []
+    for number in range(count):
+        condition = {"jurisdiction": f"J{rng.randrange(500)}", "visa_type": rng.choice(VISA_TYPES)}
+        if rng.random() < 0.5:
+            condition["status"] = rng.choice(STATUSES)
+        if rng.random() < 0.4:
+            condition[rng.choice(FLAGS)] = True
+        if rng.random() < 0.3:
+            low = rng.randrange(24)
+            condition["months_in_status"] = {"gt": low, "lt": low + rng.randrange(1, 24)}
+        elif rng.random() < 0.3:
+            condition["age"] = {"gt": rng.randrange(16, 40)}
+        rules.append({"id": f"rule_{number}", "name": f"Rule {number}", "condition": condition,
+                      "deadline_days": rng.choice([None, 30, 60, 90])})
+    return rules
+
+
+def synthetic_facts(rng):
+    facts = {"jurisdiction": f"J{rng.randrange(500)}", "visa_type": rng.choice(VISA_TYPES),
+             "status": rng.choice(STATUSES), "months_in_status": rng.randrange(48), "age": rng.randrange(18, 45)}
+    for flag in FLAGS:
+        if rng.random() < 0.5:
+            facts[flag] = rng.random() < 0.5
+    return facts
+
+
+def linear_scan(engine, facts):
+    """find_applicable_rules before the index: every condition re-interpreted per call."""
+    return [rule for rule in engine.rules if engine.matches_condition(rule.get("condition", {}), facts)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rules", type=int, nargs="+", default=[100, 10000, 100000])
+    parser.add_argument("--fact-sets", type=int, default=200)
+    args = parser.parse_args()
+    rng = random.Random(11)
+
+    print(f"{'rules':>7} {'compile ms':>11} {'linear us':>10} {'indexed us':>11} {'speedup':>8} "
+          f"{'candidates':>11} {'matches':>8}")
+    for count in args.rules:
+        rules = synthetic_rules(count, rng)
+        start = time.perf_counter()
+        engine = RulesEngine(rules=rules)
+        compile_ms = (time.perf_counter() - start) * 1000
+        fact_sets = [synthetic_facts(rng) for _ in range(args.fact_sets)]
+
+        start = time.perf_counter()
+        expected = [linear_scan(engine, facts) for facts in fact_sets]
+        linear_us = (time.perf_counter() - start) * 1e6 / len(fact_sets)
+        start = time.perf_counter()
+        indexed = [engine.find_applicable_rules(facts) for facts in fact_sets]
+        indexed_us = (time.perf_counter() - start) * 1e6 / len(fact_sets)
+        assert indexed == expected
+
+        matches = sum(len(found) for found in indexed) / len(fact_sets)
+        candidates = sum(len(engine.condition_index.candidates(facts)) for facts in fact_sets) / len(fact_sets)
+        print(f"{count:>7} {compile_ms:>11.1f} {linear_us:>10.1f} {indexed_us:>11.1f} "
+              f"{linear_us / indexed_us:>7.1f}x {candidates:>11.1f} {matches:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark: RulesEngine.evaluate_batch over many client profiles at once vs
+calling find_applicable_rules and extract_timeline once per profile, on
+synthetic jurisdiction rules. Batch results are checked against the
+per-profile ones before timing is reported.
+
+Usage: python bench_rules_batch.py [--rules 1000 10000] [--profiles 20000] [--workers 4]
+"""
+import argparse
+import random
+import time
+
+from bench_rules import synthetic_facts, synthetic_rules
+from rules_batch import to_columns
+from rules_engine import RulesEngine
+
+
+def synthetic_profiles(count, rng):
+    """synthetic_facts with a military notice date on most profiles, so deadlines are computed."""
+    profiles = []
+    for _ in range(count):
+        facts = synthetic_facts(rng)
+        if rng.random() < 0.8:
+            facts["military_notice_date"] = f"2024-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}"
+        profiles.append(facts)
+    return profiles
+
+
+def per_profile(engine, profiles):
+    """The existing API, one call pair per profile."""
+    return [{"matches": [rule["id"] for rule in engine.find_applicable_rules(facts)],
+             "timeline": engine.extract_timeline(facts)} for facts in profiles]
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rules", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--profiles", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    rng = random.Random(13)
+
+    print(f"{'rules':>6} {'profiles':>9} {'loop /s':>10} {'batch /s':>10} {'speedup':>8} "
+          f"{f'{args.workers} procs /s':>12} {'speedup':>8}")
+    for count in args.rules:
+        engine = RulesEngine(rules=synthetic_rules(count, rng))
+        profiles = synthetic_profiles(args.profiles, rng)
+        columns = to_columns(profiles)
+
+        expected, loop_s = timed(lambda: per_profile(engine, profiles))
+        batch, batch_s = timed(lambda: engine.evaluate_batch(columns, workers=1))
+        assert batch == expected
+        # The first parallel call also starts the worker processes; time the second
+        engine.evaluate_batch(columns, workers=args.workers)
+        parallel, parallel_s = timed(lambda: engine.evaluate_batch(columns, workers=args.workers))
+        assert parallel == expected
+
+        print(f"{count:>6} {args.profiles:>9} {args.profiles / loop_s:>10.0f} {args.profiles / batch_s:>10.0f} "
+              f"{loop_s / batch_s:>7.1f}x {args.profiles / parallel_s:>12.0f} {loop_s / parallel_s:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
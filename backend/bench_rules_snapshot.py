@@ -0,0 +1,70 @@
+"""
+Benchmark: loading the rules engine from a compiled snapshot vs parsing
+rules.json and compiling its indexes (what RulesEngine("rules.json") does
+on every cold start), at 1k, 10k and 100k synthetic rules. Also times a
+hot reload: how long get() takes while a new rule set compiles, and how
+long until it is swapped in.
+
+Usage: python bench_rules_snapshot.py [--rules 1000 10000 100000] [--repeat 3]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from bench_rules import synthetic_rules
+from rules_engine import RulesEngine
+from rules_snapshot import RulesReloader, compile_rules, load_rules
+
+
+def best_ms(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return result, min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rules", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    rng = random.Random(23)
+
+    print(f"{'rules':>7} {'json MB':>8} {'json+compile ms':>16} {'snapshot ms':>12} {'speedup':>8} "
+          f"{'get() during reload ms':>23} {'swap ms':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        for count in args.rules:
+            rules_file = os.path.join(directory, f"rules_{count}.json")
+            with open(rules_file, "w") as f:
+                json.dump({"rules": synthetic_rules(count, rng)}, f)
+            compile_rules(rules_file)
+
+            _, json_ms = best_ms(lambda: RulesEngine(rules_file), args.repeat)
+            engine, snapshot_ms = best_ms(lambda: load_rules(rules_file), args.repeat)
+            assert [rule["id"] for rule in engine.rules] == [rule["id"] for rule in RulesEngine(rules_file).rules]
+
+            reloader = RulesReloader(rules_file, interval=0)
+            with open(rules_file, "w") as f:
+                json.dump({"rules": synthetic_rules(count, rng)}, f)
+            start = time.perf_counter()
+            old = reloader.get()  # notices the change and starts compiling in the background
+            get_ms = []
+            while reloader.engine is old:
+                call = time.perf_counter()
+                reloader.get()
+                get_ms.append((time.perf_counter() - call) * 1000)
+                time.sleep(0.001)
+            swap_ms = (time.perf_counter() - start) * 1000
+            reloader.wait()
+
+            print(f"{count:>7} {os.path.getsize(rules_file) / 1e6:>8.1f} {json_ms:>16.1f} {snapshot_ms:>12.1f} "
+                  f"{json_ms / snapshot_ms:>7.1f}x {max(get_ms or [0]):>23.3f} {swap_ms:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark: DeadlineScheduler on synthetic dependency DAGs of 10k+ nodes.
+
+Each graph has a handful of anchor dates; the first level starts after an
+anchor and about a fifth of the nodes carry an anchored or absolute
+deadline. After a full computation it times single changes (an anchor
+date, one node's duration, one new edge) recomputed incrementally vs from
+scratch, and checks both give the same dates.
+
+Usage: python bench_schedule.py [--nodes 10000 50000] [--depth 100] [--changes 50]
+"""
+import argparse
+import random
+import time
+from datetime import date
+
+from deadline_scheduler import DeadlineScheduler
+
+ANCHORS = ["graduation", "visa expiry", "program start", "job offer", "military notice"]
+BASE_DAY = 738000  # 2021-07-29
+
+
+def synthetic_schedule(count, depth, rng):
+    """A scheduler over `count` nodes in `depth` levels; each depends on 1-3 nodes of the level above."""
+    scheduler = DeadlineScheduler()
+    for name in ANCHORS:
+        scheduler.set_anchor(name, _day(BASE_DAY + rng.randrange(365)))
+    width = max(1, count // depth)
+    for number in range(count):
+        level = number // width
+        releases, dues = [], []
+        if level == 0:
+            releases.append((rng.choice(ANCHORS), rng.randrange(30)))
+        if rng.random() < 0.2:
+            if rng.random() < 0.5:
+                dues.append((rng.choice(ANCHORS), rng.randrange(200, 2000)))
+            else:
+                dues.append((None, BASE_DAY + rng.randrange(300, 3000)))
+        scheduler.set_node(number, duration=rng.randrange(10), releases=releases, dues=dues)
+        above = range((level - 1) * width, level * width) if level else range(0)
+        for dep in rng.sample(above, min(len(above), rng.randint(1, 3))):
+            scheduler.add_edge(dep, number)
+    return scheduler
+
+
+def _day(ordinal):
+    return date.fromordinal(ordinal)
+
+
+def dates(scheduler):
+    scheduler._settle()
+    return dict(scheduler.earliest), dict(scheduler.latest)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, nargs="+", default=[10000, 50000])
+    parser.add_argument("--depth", type=int, default=100)
+    parser.add_argument("--changes", type=int, default=50)
+    args = parser.parse_args()
+    rng = random.Random(17)
+
+    print(f"{'nodes':>6} {'change':>9} {'full ms':>8} {'incr ms':>8} {'speedup':>8} {'nodes recomputed':>17}")
+    for count in args.nodes:
+        scheduler = synthetic_schedule(count, args.depth, rng)
+        first_ms = timed(scheduler._settle)
+        full_ms = timed(scheduler.recompute)
+        print(f"{count:>6} {'initial':>9} {first_ms:>8.1f}")
+
+        changes = {
+            "anchor": lambda: scheduler.set_anchor(rng.choice(ANCHORS), _day(BASE_DAY + rng.randrange(365))),
+            "duration": lambda: scheduler.set_node(
+                node_id, duration=rng.randrange(10), releases=scheduler.specs[node_id][1],
+                dues=scheduler.specs[node_id][2]),
+            "edge": lambda: scheduler.add_edge(node_id, node_id + rng.randrange(1, count // args.depth + 2))
+        }
+        for name, change in changes.items():
+            incremental_ms, recomputed = 0.0, 0
+            for _ in range(args.changes):
+                # A node from the upper half, so the change has a downstream subgraph
+                node_id = rng.randrange(count // 2)
+                change()
+                before = scheduler.stats["recomputed"]
+                incremental_ms += timed(scheduler._settle)
+                recomputed += scheduler.stats["recomputed"] - before
+            expected = dates(scheduler)
+            scheduler.recompute()
+            assert dates(scheduler) == expected
+            incremental_ms /= args.changes
+            print(f"{count:>6} {name:>9} {full_ms:>8.1f} {incremental_ms:>8.2f} "
+                  f"{full_ms / incremental_ms:>7.0f}x {recomputed / args.changes:>17.0f}")
+
+
+if __name__ == "__main__":
+    main()
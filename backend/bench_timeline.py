@@ -0,0 +1,77 @@
+"""
+Benchmark: full vs incremental timeline extraction over a growing synthetic
+conversation, with /timeline called after every exchange.
+
+The Messages API is stubbed in-process; its latency is a fixed base plus a
+per-input-token cost, so the numbers track how much text each call sends.
+
+Usage: python bench_timeline.py [--exchanges 40] [--base-ms 40] [--ms-per-1k-tokens 20]
+"""
+import argparse
+import json
+import time
+from types import SimpleNamespace
+
+from claude_integration import ClaudeIntegration, prompt_text
+from context_serializer import estimate_tokens
+from response_cache import ResponseCache
+
+
+class StubMessages:
+    def __init__(self, base_ms, ms_per_1k_tokens):
+        self.base_ms = base_ms
+        self.ms_per_1k_tokens = ms_per_1k_tokens
+        self.input_tokens = []
+
+    def create(self, **request):
+        content = request["messages"][0]["content"]
+        tokens = estimate_tokens(prompt_text(request))
+        self.input_tokens.append(tokens)
+        time.sleep((self.base_ms + self.ms_per_1k_tokens * tokens / 1000) / 1000)
+        # One item per user question seen in this request
+        steps = [line.split("[")[1].split("]")[0] for line in content.splitlines() if line.startswith("Question [")]
+        items = [{"title": f"Submit form {step}", "description": f"File {step} on time.", "relatedDocuments": [step]}
+                 for step in steps]
+        return SimpleNamespace(content=[SimpleNamespace(text=json.dumps({"items": items}))])
+
+
+def synthetic_history(exchanges):
+    history = []
+    for i in range(exchanges):
+        form = f"I-{100 + i}"
+        history.append({"role": "user", "text": f"Question [{form}] what do I need to prepare? " + "context " * 40})
+        history.append({"role": "assistant", "text": f"For {form} you should gather documents. " + "detail " * 150})
+    return history
+
+
+def run(exchanges, incremental, base_ms, ms_per_1k_tokens):
+    stub = StubMessages(base_ms, ms_per_1k_tokens)
+    claude = ClaudeIntegration(client=SimpleNamespace(messages=stub), cache=ResponseCache(path=""))
+    history = synthetic_history(exchanges)
+    latencies = []
+    for turn in range(2, len(history) + 1, 2):
+        start = time.perf_counter()
+        items = claude.extract_timeline_from_conversation(history[:turn], use_cache=incremental)
+        latencies.append((time.perf_counter() - start) * 1000)
+    assert len(items) == exchanges, len(items)
+    return stub.input_tokens, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--exchanges", type=int, default=40)
+    parser.add_argument("--base-ms", type=float, default=40)
+    parser.add_argument("--ms-per-1k-tokens", type=float, default=20)
+    args = parser.parse_args()
+
+    checkpoints = [n for n in (1, 5, 10, 20, 40, 80, 160) if n <= args.exchanges]
+    print(f"{'mode':<12} {'exchange':>8} {'input tokens':>13} {'latency ms':>11}")
+    for mode, incremental in (("full", False), ("incremental", True)):
+        tokens, latencies = run(args.exchanges, incremental, args.base_ms, args.ms_per_1k_tokens)
+        for n in checkpoints:
+            print(f"{mode:<12} {n:>8} {tokens[n - 1]:>13} {latencies[n - 1]:>11.1f}")
+        print(f"{mode:<12} {'total':>8} {sum(tokens):>13} {sum(latencies):>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
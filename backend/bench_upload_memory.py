@@ -0,0 +1,113 @@
+"""
+Memory benchmark: peak RSS while handling concurrent 16 MB multipart
+uploads, buffered (cgi.FieldStorage + file.read(), the old api/upload.py)
+vs streamed (upload_stream.stream_uploads).
+
+Bodies are generated on the fly, so the input itself costs no memory. Each
+mode runs in its own subprocess so peak RSS is measured separately.
+
+Usage: python bench_upload_memory.py [--size-mb 16] [--concurrency 1 4 8]
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+BOUNDARY = "legolbenchboundary"
+
+
+class SyntheticBody:
+    """File-like multipart body with one `size`-byte file part, generated as it is read."""
+
+    def __init__(self, size):
+        self.head = (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"files\"; "
+                     f"filename=\"passport-scan.jpg\"\r\nContent-Type: image/jpeg\r\n\r\n").encode()
+        self.tail = f"\r\n--{BOUNDARY}--\r\n".encode()
+        self.size = size
+        self.length = len(self.head) + size + len(self.tail)
+        self.position = 0
+        self.block = bytes(range(256)) * 256
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            n = self.length - self.position
+        out = bytearray()
+        while n > 0 and self.position < self.length:
+            pos = self.position
+            if pos < len(self.head):
+                piece = self.head[pos:pos + n]
+            elif pos < len(self.head) + self.size:
+                offset = pos - len(self.head)
+                piece = self.block[offset % len(self.block):][:min(n, len(self.head) + self.size - pos)]
+            else:
+                offset = pos - len(self.head) - self.size
+                piece = self.tail[offset:offset + n]
+            out += piece
+            self.position += len(piece)
+            n -= len(piece)
+        return bytes(out)
+
+    def readline(self, limit=-1):
+        # cgi.FieldStorage reads line by line
+        chunk = self.read(limit if limit and limit > 0 else 1 << 16)
+        index = chunk.find(b"\n")
+        if index >= 0 and index + 1 < len(chunk):
+            self.position -= len(chunk) - index - 1
+            chunk = chunk[:index + 1]
+        return chunk
+
+
+def handle_buffered(size):
+    body = SyntheticBody(size)
+    form = cgi.FieldStorage(fp=body, headers={"content-type": f"multipart/form-data; boundary={BOUNDARY}",
+                                              "content-length": str(body.length)},
+                            environ={"REQUEST_METHOD": "POST"})
+    item = form["files"]
+    with tempfile.NamedTemporaryFile(delete=True, suffix=".jpg") as temp_file:
+        temp_file.write(item.file.read())
+
+
+def handle_streamed(size):
+    body = SyntheticBody(size)
+    files = stream_uploads(body, f"multipart/form-data; boundary={BOUNDARY}", body.length, max_bytes=0)
+    assert files[0]["filename"] == "passport-scan.jpg"
+
+
+def worker(mode, size, concurrency):
+    # Import before taking the baseline so module memory isn't counted as growth
+    global cgi, stream_uploads
+    import cgi
+    from upload_stream import stream_uploads
+    handler = handle_buffered if mode == "buffered" else handle_streamed
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda _: handler(size), range(concurrency)))
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{mode:<9} {concurrency:>11} {baseline / 1024:>12.1f} {peak / 1024:>10.1f} {(peak - baseline) / 1024:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--worker", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    size = args.size_mb * 1024 * 1024
+
+    if args.worker:
+        worker(args.worker[0], size, int(args.worker[1]))
+        return
+
+    print(f"{args.size_mb} MB uploads; RSS in MB (ru_maxrss)")
+    print(f"{'mode':<9} {'concurrency':>11} {'baseline':>12} {'peak':>10} {'growth':>10}")
+    for mode in ("buffered", "streamed"):
+        for concurrency in args.concurrency:
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--size-mb", str(args.size_mb),
+                            "--worker", mode, str(concurrency)], check=True)
+
+
+if __name__ == "__main__":
+    main()
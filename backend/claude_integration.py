@@ -1,23 +1,132 @@
 import os
 import json
+import time
+import hashlib
 from anthropic import Anthropic
 from dotenv import load_dotenv
+from response_cache import ResponseCache, request_key
+from json_stream import JsonItemStream, salvage_json_items
+from context_serializer import estimate_tokens
+from conversation_window import (ConversationWindow, PrefixStore, DOCUMENT_EXCERPT_CHARS,
+                                 conversation_turns, prefix_keys)
+from incremental_timeline import summarize_timeline_items, merge_timeline_items
+from document_store import DocumentStore
+from retrieval_index import SessionIndexes
 
 load_dotenv()
 
-class ClaudeIntegration:
-    def __init__(self):
-        api_key = os.getenv("ANTHROPIC_API_KEY")
-        if not api_key:
-            print("WARNING: ANTHROPIC_API_KEY not found in environment variables.")
-        self.client = Anthropic(api_key=api_key)
+CHAT_MODEL = "claude-3-haiku-20240307"
+SUMMARY_MAX_TOKENS = 400
+SUMMARY_SYSTEM_PROMPT = """You maintain a running summary of a conversation between a user and LEGOL, an immigration assistant.
+Update the summary with the new turns. Keep every fact that matters for later answers: the user's country, institution, visa type and status, goals, dates and deadlines, documents mentioned, and advice already given.
+Write plain prose under 200 words. Output the summary only."""
+CHAT_ERROR_MESSAGE = "I apologize, but I'm having trouble processing your request right now. Please try again."
+
+def cached_text(text):
+    """A text content block marked as a prompt-cache breakpoint (everything up to it is cached)."""
+    return [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}]
+
+def prompt_text(request):
+    """All prompt text of a messages.create request, whether given as strings or content blocks."""
+    parts = []
+    for content in [request.get("system", "")] + [m["content"] for m in request["messages"]]:
+        if isinstance(content, str):
+            parts.append(content)
+        else:
+            parts.extend(block.get("text", "") for block in content)
+    return "".join(parts)
+
+def parse_json_output(text):
+    """
+    Parses Claude's JSON answer. Returns (data, complete); if the text does not
+    parse as a whole (e.g. cut off at max_tokens), data holds the array
+    elements that did close. Raises ValueError if nothing is recoverable.
+    """
+    try:
+        return json.loads(extract_json(text)), True
+    except ValueError:
+        salvaged = salvage_json_items(text)
+        if not salvaged:
+            raise
+        print(f"Claude's JSON output was incomplete; kept {sum(len(v) for v in salvaged.values())} complete objects")
+        return salvaged, False
+
+def extract_json(content):
+    """Strips a markdown code fence around Claude's JSON output, if any."""
+    content = content.strip()
+    if "```json" in content:
+        content = content.split("```json")[1].split("```")[0].strip()
+    elif "```" in content:
+        content = content.split("```")[1].split("```")[0].strip()
+    return content
+
+TIMELINE_SYSTEM_PROMPT = """You are analyzing a conversation between a user and LEGOL (an immigration assistant) to extract actionable timeline items.
+
+Your task:
+1. Read the conversation carefully to understand the user's situation: their country of origin, institution (if student), visa type, immigration goals, and specific needs
+2. Extract ALL action items, steps, forms, documents, and deadlines that are relevant to their situation
+3. Create a comprehensive timeline with each step as a SEPARATE item
+
+Guidelines:
+- Be specific to their situation (country, visa type, institution, etc.)
+- Include government forms and documents (I-20, DS-160, visa applications, work permits, etc.)
+- Include institutional steps (financial aid office, DSO office, registrar, etc.)
+- Include agency/embassy consultations when relevant
+- Include deadlines and time-sensitive items
+- Each item should be actionable and clear
+
+Common immigration topics to address when mentioned:
+- Student visas (F-1): I-20, SEVIS fee, DS-160, visa interview, arrival, maintaining status
+- Work authorization: CPT, OPT, H-1B, EAD applications
+- Financial aid: FAFSA, institutional aid, scholarship applications
+- Status changes: adjustment of status, extensions, transfers
+- Country-specific requirements: military service obligations, dual citizenship issues, embassy requirements
+
+Output Format (JSON only, no markdown):
+{
+  "items": [
+    {
+      "title": "Short descriptive title",
+      "description": "One clear sentence explaining what needs to be done and why",
+      "relatedDocuments": ["Document 1", "Form 2", "Required ID 3"]
+    }
+  ]
+}
 
-    def process_query(self, query_text, current_graph_context):
+IMPORTANT:
+- Only extract items that are relevant to what was discussed in the conversation
+- Be comprehensive but specific to their situation
+- Each major step should be its own item (don't merge related steps)
+- If the conversation is too brief or vague, return fewer, more general items"""
+
+class ClaudeIntegration:
+    def __init__(self, client=None, cache=None, documents=None):
+        if client is None:
+            api_key = os.getenv("ANTHROPIC_API_KEY")
+            if not api_key:
+                print("WARNING: ANTHROPIC_API_KEY not found in environment variables.")
+            client = Anthropic(api_key=api_key)
+        self.client = client
+        # Only temperature-0 calls (process_query, timeline extraction) are cached.
+        self.cache = cache if cache is not None else ResponseCache()
+        self.timeline_store = PrefixStore(int(os.getenv("LEGOL_TIMELINE_STATES", 1000)))
+        self.timeline_stats = {"full": 0, "incremental": 0, "reused": 0}
+        self.window = ConversationWindow()
+        # Uploaded documents that chat requests refer to by id
+        self.documents = documents if documents is not None else DocumentStore()
+        self.retrieval = SessionIndexes()
+        self.chat_stats = {"requests": 0, "summaries": 0, "last_prompt_tokens": 0, "prompt_tokens_sum": 0,
+                           "last_window_turns": 0, "last_summarized_turns": 0}
+        # Token usage reported by the API, including prompt-cache reads and writes
+        self.usage_stats = {"responses": 0, "input_tokens": 0, "output_tokens": 0,
+                            "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0}
+        self.stream_stats = {"streams": 0, "fallbacks": 0, "last_ttfb_ms": 0, "last_total_ms": 0,
+                             "ttfb_ms_sum": 0.0, "total_ms_sum": 0.0}
+
+    def _build_query_request(self, query_text, current_graph_context):
         """
-        Sends the query and current graph context to Claude to generate graph updates.
-        Returns a structured JSON object with new nodes and edges.
+        Builds the messages.create arguments for process_query.
         """
-        
         system_prompt = """
         You are an expert legal aide and graph database architect for 'Mosaic'. 
         Your goal is to parse user questions about legal/bureaucratic processes (like visas, military service, etc.) 
@@ -58,8 +167,8 @@ class ClaudeIntegration:
         """
 
         user_message = f"""
-        Current Graph Context (JSON):
-        {json.dumps(current_graph_context, indent=2)}
+        Current Graph Context:
+        {current_graph_context}
 
         User Query: "{query_text}"
 
@@ -68,34 +177,95 @@ class ClaudeIntegration:
         If nodes already exist, connect to them. Avoid creating duplicate nodes with slightly different names.
         """
 
+        return {
+            "model": "claude-3-haiku-20240307",
+            "max_tokens": 4000,
+            "temperature": 0,
+            "system": cached_text(system_prompt),
+            "messages": [
+                {"role": "user", "content": user_message}
+            ]
+        }
+
+    def _cache_lookup(self, request, use_cache):
+        """Returns (cache key, cached response text or None)."""
+        key = request_key(request)
+        if not use_cache:
+            self.cache.record_bypass()
+            return key, None
+        return key, self.cache.get(key)
+
+    def _cached_json(self, request, use_cache=True):
+        """
+        Sends a temperature-0 request through the response cache and returns its
+        parsed JSON. Incomplete answers are salvaged but not cached.
+        """
+        key, text = self._cache_lookup(request, use_cache)
+        if text is not None:
+            return json.loads(extract_json(text))
+        start = time.perf_counter()
+        response = self.client.messages.create(**request)
+        self._record_usage(response)
+        text = response.content[0].text
+        data, complete = parse_json_output(text)
+        if complete:
+            self.cache.put(key, text, (time.perf_counter() - start) * 1000)
+        return data
+
+    def process_query(self, query_text, current_graph_context, use_cache=True):
+        """
+        Sends the query and current graph context to Claude to generate graph updates.
+        `current_graph_context` is the compact text from context_serializer.serialize_graph_context.
+        Returns a structured JSON object with new nodes and edges.
+        Identical requests are answered from the response cache unless `use_cache` is False.
+        """
+        request = self._build_query_request(query_text, current_graph_context)
+
         try:
-            response = self.client.messages.create(
-                model="claude-3-haiku-20240307",
-                max_tokens=4000,
-                temperature=0,
-                system=system_prompt,
-                messages=[
-                    {"role": "user", "content": user_message}
-                ]
-            )
-            
-            content = response.content[0].text
-            # Identify JSON block if wrapped in markdown
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0].strip()
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0].strip()
-            
-            return json.loads(content)
+            return self._cached_json(request, use_cache)
 
         except Exception as e:
             print(f"Error calling Claude: {e}")
             return {"new_nodes": [], "new_edges": []}
 
-    def chat(self, query_text, conversation_history=None, file_contents=None):
+    def process_query_stream(self, query_text, current_graph_context, use_cache=True):
         """
-        Sends a conversational query to Claude and returns a natural language response.
-        For use in the chat interface.
+        Streaming version of process_query(): yields ("new_nodes", node) and
+        ("new_edges", edge) as soon as each object closes in Claude's output.
+        If the output is cut off, the objects that closed are still yielded.
+        """
+        request = self._build_query_request(query_text, current_graph_context)
+        key, text = self._cache_lookup(request, use_cache)
+        if text is not None:
+            yield from JsonItemStream().feed(text)
+            return
+
+        parser = JsonItemStream()
+        chunks = []
+        start = time.perf_counter()
+        try:
+            with self.client.messages.stream(**request) as stream:
+                for chunk in stream.text_stream:
+                    chunks.append(chunk)
+                    yield from parser.feed(chunk)
+                self._record_usage(stream.get_final_message())
+        except Exception as e:
+            print(f"Error streaming graph updates from Claude: {type(e).__name__}: {e}")
+            return
+
+        text = "".join(chunks)
+        try:
+            json.loads(extract_json(text))
+            self.cache.put(key, text, (time.perf_counter() - start) * 1000)
+        except ValueError:
+            print("Claude's graph update stream was incomplete; kept the objects that closed")
+
+    def _build_chat_request(self, query_text, turns=(), summary=None, documents=None):
+        """
+        Builds the messages.create arguments shared by chat() and chat_stream().
+        `turns` is the verbatim history window and `summary` covers the turns
+        before it (see ConversationWindow); `documents` are the uploaded-file
+        excerpts to include.
         """
         system_prompt = """
         You are LEGOL, a helpful immigration assistant specializing in U.S. immigration law,
@@ -124,37 +294,39 @@ class ClaudeIntegration:
         - How this document relates to their specific situation (country, institution, topic)
         """
 
-        messages = []
+        # The static prompt and the verbatim history are cache breakpoints; the
+        # summary only changes when the window slides.
+        system = cached_text(system_prompt)
+        if summary:
+            system.append({"type": "text", "text": "Summary of the earlier conversation:\n" + summary})
 
-        # Add conversation history if provided
-        if conversation_history:
-            for msg in conversation_history:
-                # Skip the initial assistant greeting if it's in the history
-                if msg.get("role") == "assistant" and "LEGOL immigration assistant" in msg.get("text", ""):
-                    continue
-                messages.append({
-                    "role": msg.get("role"),
-                    "content": msg.get("text")
-                })
+        messages = [{"role": role, "content": text} for role, text in turns]
+        if messages:
+            messages[-1]["content"] = cached_text(messages[-1]["content"])
 
         # Build the current message content
         message_content = query_text
 
         # Add file content if provided
-        if file_contents and len(file_contents) > 0:
+        if documents:
             message_content += "\n\n--- UPLOADED DOCUMENTS ---\n"
-            for file_info in file_contents:
+            for file_info in documents:
                 filename = file_info.get('filename', 'Unknown')
                 content = file_info.get('content')
                 file_type = file_info.get('type', 'Unknown')
                 pages = file_info.get('pages', 0)
 
-                if content:
+                if content and file_info.get('excerpts'):
+                    # Retrieved chunks already fit the document token budget
+                    message_content += f"\n\nDocument: {filename} ({file_type}, {pages} pages)\n"
+                    message_content += "Excerpts relevant to the question:\n"
+                    message_content += content
+                elif content:
                     message_content += f"\n\nDocument: {filename} ({file_type}, {pages} pages)\n"
                     message_content += "Content:\n"
                     # Limit content to first 4000 characters to avoid token limits
-                    message_content += content[:4000]
-                    if len(content) > 4000:
+                    message_content += content[:DOCUMENT_EXCERPT_CHARS]
+                    if len(content) > DOCUMENT_EXCERPT_CHARS:
                         message_content += "\n... (content truncated)"
                 else:
                     error = file_info.get('error', 'Unknown error')
@@ -166,105 +338,305 @@ class ClaudeIntegration:
             "content": message_content
         })
 
+        return {
+            "model": CHAT_MODEL,
+            "max_tokens": 2048,
+            "temperature": 0.7,
+            "system": system,
+            "messages": messages
+        }
+
+    def _build_summary_request(self, previous_summary, turns):
+        content = f"Current summary:\n{previous_summary or '(none yet)'}\n\nNew turns:\n\n"
+        for role, text in turns:
+            content += f"{role.upper()}:\n{text}\n\n"
+        return {
+            "model": CHAT_MODEL,
+            "max_tokens": SUMMARY_MAX_TOKENS,
+            "temperature": 0,
+            "system": cached_text(SUMMARY_SYSTEM_PROMPT),
+            "messages": [{"role": "user", "content": content}]
+        }
+
+    def _fallback_summary(self, previous_summary, turns):
+        """Used when the summary call fails: the start of each folded turn."""
+        lines = [previous_summary] if previous_summary else []
+        lines += [f"{role}: {text[:200]}" for role, text in turns]
+        return "\n".join(lines)[-SUMMARY_MAX_TOKENS * 4:]
+
+    def _summarize_turns(self, previous_summary, turns):
+        """Folds `turns` into the running summary."""
+        self.chat_stats["summaries"] += 1
+        try:
+            response = self.client.messages.create(**self._build_summary_request(previous_summary, turns))
+            self._record_usage(response)
+            return response.content[0].text.strip()
+        except Exception as e:
+            print(f"Error summarizing conversation: {type(e).__name__}: {e}")
+            return self._fallback_summary(previous_summary, turns)
+
+    def _record_chat_request(self, request, plan):
+        tokens = estimate_tokens(prompt_text(request))
+        stats = self.chat_stats
+        stats["requests"] += 1
+        stats["last_prompt_tokens"] = tokens
+        stats["prompt_tokens_sum"] += tokens
+        stats["last_window_turns"] = len(plan["turns"])
+        stats["last_summarized_turns"] = plan["folded"]
+        print(f"Sending chat request to Claude: {len(request['messages'])} messages, "
+              f"~{tokens} prompt tokens, {plan['folded']} earlier turns summarized")
+        return tokens
+
+    def _chat_request(self, query_text, conversation_history=None, file_contents=None, session_id=None,
+                      metrics=None):
+        """Applies the conversation window and returns the chat request (its size goes in `metrics`)."""
+        plan = self.window.plan(conversation_history, CHAT_MODEL)
+        summary = plan["summary"]
+        if plan["to_fold"]:
+            summary = self._summarize_turns(summary, plan["to_fold"])
+            self.window.remember(plan["key"], summary)
+        documents = self._document_excerpts(query_text, session_id, file_contents)
+        request = self._build_chat_request(query_text, plan["turns"], summary, documents)
+        tokens = self._record_chat_request(request, plan)
+        if metrics is not None:
+            metrics["prompt_tokens"] = tokens
+        return request
+
+    def _document_excerpts(self, query_text, session_id, file_contents):
+        """
+        Pins this request's files for the session and returns the ones to
+        send. Their text is replaced by the chunks that best match the
+        question across all of the session's documents (BM25, see
+        SessionIndexes), within the window's document token budget; files
+        are indexed once, as they arrive. Page-ranged references get the
+        pages they name, and unreadable files are passed through as errors.
+        """
+        files = self.window.documents(session_id, self.documents.describe(file_contents))
+        index = self.retrieval.get(session_id)
+        selected, sources = [], {}
+        for file_info in files:
+            if file_info.get("error") or (not file_info.get("document_id") and not file_info.get("content")):
+                selected.append(file_info)
+            elif file_info.get("page_range"):
+                selected.append(self.documents.excerpt(file_info, query_text))
+            else:
+                source = self._index_document(index, file_info)
+                if source is not None:
+                    sources[source] = file_info
+
+        if not sources:
+            return selected
+        budget = self.window.document_tokens
+        hits = index.search(query_text, token_budget=budget, sources=list(sources))
+        self.retrieval.record("searches")
+        if not hits:
+            # Nothing matched the question: lead with the newest documents
+            hits = index.head(list(sources)[::-1], token_budget=budget)
+            self.retrieval.record("fallbacks")
+
+        excerpts = {}
+        for source, page, text in hits:
+            label = f"[page {page + 1}] " if sources[source].get("document_id") else ""
+            excerpts.setdefault(source, []).append(label + text)
+        for source, file_info in sources.items():
+            if source in excerpts:
+                selected.append(dict(file_info, content="\n\n".join(excerpts[source]), excerpts=True))
+        return selected
+
+    def _index_document(self, index, file_info):
+        """Adds a file to the session index unless it is already there; returns its source key."""
+        document_id = file_info.get("document_id")
+        if document_id:
+            source = "document:" + document_id
+        else:
+            source = "file:" + hashlib.sha256(file_info["content"].encode("utf-8")).hexdigest()
+        if source in index:
+            return source
+        try:
+            sections = self.documents.sections(document_id) if document_id else [(0, file_info["content"])]
+        except (KeyError, OSError) as e:
+            print(f"Could not read document {document_id}: {e}")
+            return None
+        self.retrieval.record("chunks_indexed", index.add(source, sections))
+        self.retrieval.record("sources_indexed")
+        return source
+
+    def _record_usage(self, response, chat=False):
+        """
+        Adds a response's token usage to usage_stats and returns its prompt
+        tokens: input_tokens (uncached) plus cache reads and writes. With
+        `chat`, that total replaces the estimate in chat_stats.
+        """
+        usage = getattr(response, "usage", None)
+        counts = {key: getattr(usage, key, None) for key in self.usage_stats if key != "responses"}
+        counts = {key: value for key, value in counts.items() if isinstance(value, int)}
+        if "input_tokens" not in counts:
+            return None
+        self.usage_stats["responses"] += 1
+        for key, value in counts.items():
+            self.usage_stats[key] += value
+        tokens = (counts["input_tokens"] + counts.get("cache_read_input_tokens", 0)
+                  + counts.get("cache_creation_input_tokens", 0))
+        if chat:
+            self.chat_stats["last_prompt_tokens"] = tokens
+        return tokens
+
+    def get_usage_stats(self):
+        """API token usage so far, with the share of prompt tokens served from the prompt cache."""
+        stats = dict(self.usage_stats)
+        prompt = stats["input_tokens"] + stats["cache_read_input_tokens"] + stats["cache_creation_input_tokens"]
+        stats["cache_read_ratio"] = round(stats["cache_read_input_tokens"] / prompt, 3) if prompt else 0
+        return stats
+
+    def get_chat_stats(self):
+        """Prompt sizes of chat requests, with the average over all requests so far."""
+        stats = dict(self.chat_stats)
+        tokens_sum = stats.pop("prompt_tokens_sum")
+        stats["avg_prompt_tokens"] = round(tokens_sum / stats["requests"], 1) if stats["requests"] else 0
+        return stats
+
+    def _send_chat(self, request):
         try:
-            print(f"Sending request to Claude with {len(messages)} messages")
-            response = self.client.messages.create(
-                model="claude-3-haiku-20240307",
-                max_tokens=2048,
-                temperature=0.7,
-                system=system_prompt,
-                messages=messages
-            )
-            print(f"Received response from Claude")
+            response = self.client.messages.create(**request)
+            self._record_usage(response, chat=True)
             return response.content[0].text
 
         except Exception as e:
             print(f"Error calling Claude for chat: {type(e).__name__}: {e}")
             import traceback
             traceback.print_exc()
-            return "I apologize, but I'm having trouble processing your request right now. Please try again."
+            return CHAT_ERROR_MESSAGE
 
-    def extract_timeline_from_conversation(self, conversation_history):
+    def chat(self, query_text, conversation_history=None, file_contents=None, session_id=None):
         """
-        Analyzes the full chat conversation and returns a list of timeline items
-        (action items, forms, documents, steps) that were actually discussed.
-        Used to drive the Timeline page from real conversation content.
+        Sends a conversational query to Claude and returns a natural language response.
+        For use in the chat interface. Documents uploaded earlier in the same
+        `session_id` are included again.
         """
-        if not conversation_history or len(conversation_history) == 0:
-            return []
-
-        system_prompt = """You are analyzing a conversation between a user and LEGOL (an immigration assistant) to extract actionable timeline items.
-
-Your task:
-1. Read the conversation carefully to understand the user's situation: their country of origin, institution (if student), visa type, immigration goals, and specific needs
-2. Extract ALL action items, steps, forms, documents, and deadlines that are relevant to their situation
-3. Create a comprehensive timeline with each step as a SEPARATE item
-
-Guidelines:
-- Be specific to their situation (country, visa type, institution, etc.)
-- Include government forms and documents (I-20, DS-160, visa applications, work permits, etc.)
-- Include institutional steps (financial aid office, DSO office, registrar, etc.)
-- Include agency/embassy consultations when relevant
-- Include deadlines and time-sensitive items
-- Each item should be actionable and clear
-
-Common immigration topics to address when mentioned:
-- Student visas (F-1): I-20, SEVIS fee, DS-160, visa interview, arrival, maintaining status
-- Work authorization: CPT, OPT, H-1B, EAD applications
-- Financial aid: FAFSA, institutional aid, scholarship applications
-- Status changes: adjustment of status, extensions, transfers
-- Country-specific requirements: military service obligations, dual citizenship issues, embassy requirements
-
-Output Format (JSON only, no markdown):
-{
-  "items": [
-    {
-      "title": "Short descriptive title",
-      "description": "One clear sentence explaining what needs to be done and why",
-      "relatedDocuments": ["Document 1", "Form 2", "Required ID 3"]
-    }
-  ]
-}
-
-IMPORTANT:
-- Only extract items that are relevant to what was discussed in the conversation
-- Be comprehensive but specific to their situation
-- Each major step should be its own item (don't merge related steps)
-- If the conversation is too brief or vague, return fewer, more general items"""
+        return self._send_chat(self._chat_request(query_text, conversation_history, file_contents, session_id))
 
-        # Build messages for Claude (same format as chat)
-        messages = []
-        for msg in conversation_history:
-            role = msg.get("role")
-            text = msg.get("text", "")
-            if not text or (role == "assistant" and "LEGOL immigration assistant" in text and "How can I assist" in text):
-                continue
-            messages.append({"role": role, "content": text})
+    def chat_stream(self, query_text, conversation_history=None, file_contents=None, session_id=None,
+                    metrics=None):
+        """
+        Streaming version of chat(): yields the response text in chunks as
+        Claude produces them. If the stream fails before any text arrives,
+        falls back to the blocking call and yields its answer whole.
+        Time to first chunk and total time are added to stream_stats; this
+        request's own "ttfb_ms", "total_ms" and "prompt_tokens" are written
+        to the `metrics` dict, if given, when the stream ends.
+        """
+        metrics = {} if metrics is None else metrics
+        request = self._chat_request(query_text, conversation_history, file_contents, session_id, metrics)
+        start = time.perf_counter()
+        first_chunk_at = None
 
-        if not messages:
-            return []
+        try:
+            with self.client.messages.stream(**request) as stream:
+                for text in stream.text_stream:
+                    if first_chunk_at is None:
+                        first_chunk_at = time.perf_counter()
+                    yield text
+                tokens = self._record_usage(stream.get_final_message(), chat=True)
+                if tokens is not None:
+                    metrics["prompt_tokens"] = tokens
+        except Exception as e:
+            print(f"Error streaming chat from Claude: {type(e).__name__}: {e}")
+            if first_chunk_at is not None:
+                yield "\n\n" + CHAT_ERROR_MESSAGE
+            else:
+                self.stream_stats["fallbacks"] += 1
+                answer = self._send_chat(request)
+                first_chunk_at = time.perf_counter()
+                yield answer
+
+        metrics.update(self._record_stream(start, first_chunk_at or time.perf_counter(), time.perf_counter()))
+
+    def _record_stream(self, start, first_chunk_at, end):
+        """Adds one stream's timings to stream_stats and returns them."""
+        timings = {"ttfb_ms": round((first_chunk_at - start) * 1000, 1), "total_ms": round((end - start) * 1000, 1)}
+        stats = self.stream_stats
+        stats["streams"] += 1
+        stats["last_ttfb_ms"], stats["last_total_ms"] = timings["ttfb_ms"], timings["total_ms"]
+        stats["ttfb_ms_sum"] += timings["ttfb_ms"]
+        stats["total_ms_sum"] += timings["total_ms"]
+        return timings
+
+    def get_stream_stats(self):
+        """Streaming chat timings, with averages over all streams so far."""
+        stats = dict(self.stream_stats)
+        count = stats.pop("streams")
+        ttfb_sum, total_sum = stats.pop("ttfb_ms_sum"), stats.pop("total_ms_sum")
+        stats["streams"] = count
+        stats["avg_ttfb_ms"] = round(ttfb_sum / count, 1) if count else 0
+        stats["avg_total_ms"] = round(total_sum / count, 1) if count else 0
+        return stats
+
+    def _build_timeline_request(self, turns, known_items=None):
+        """
+        Builds the messages.create arguments for extract_timeline_from_conversation.
+        With `known_items`, `turns` are only the turns added since those items were
+        extracted, and the items are sent as a compact summary instead of the history.
+        """
+        if known_items is None:
+            user_content = "Conversation:\n\n"
+        else:
+            user_content = "Timeline items already extracted from earlier in the conversation:\n"
+            user_content += summarize_timeline_items(known_items) + "\n\nNew conversation turns:\n\n"
+        for role, text in turns:
+            user_content += f"{role.upper()}:\n{text}\n\n"
+
+        if known_items is None:
+            user_content += "\nAnalyze the conversation above and extract a comprehensive timeline of action items based on what was discussed. Identify the user's situation and needs, then provide specific, actionable steps they should take. Output JSON only."
+        else:
+            user_content += "\nExtract timeline items for anything new in these turns. If they change an existing item, return it again with the same title and the updated description. Do not repeat unchanged items. Output JSON only."
+
+        return {
+            "model": "claude-3-haiku-20240307",
+            "max_tokens": 2048,
+            "temperature": 0,
+            "system": cached_text(TIMELINE_SYSTEM_PROMPT),
+            "messages": [{"role": "user", "content": user_content}]
+        }
 
-        user_content = "Conversation:\n\n"
-        for msg in messages:
-            user_content += f"{msg['role'].upper()}:\n{msg['content']}\n\n"
+    def _plan_timeline(self, conversation_history, incremental=True):
+        """
+        Returns (prefix keys, previously extracted items or None, request or None).
+        The request covers only turns after the longest history prefix already
+        in timeline_store; it is None when nothing new was said.
+        """
+        turns = conversation_turns(conversation_history)
+        if not turns:
+            return None, None, None
+        keys = prefix_keys(turns)
+        covered, previous = self.timeline_store.longest_prefix(keys) if incremental else (0, None)
+        if covered == len(turns):
+            self.timeline_stats["reused"] += 1
+            return keys, previous, None
+        self.timeline_stats["full" if previous is None else "incremental"] += 1
+        return keys, previous, self._build_timeline_request(turns[covered:], previous)
+
+    def _finish_timeline(self, keys, previous, data):
+        new_items = data.get("items", [])
+        items = new_items if previous is None else merge_timeline_items(previous, new_items)
+        self.timeline_store.put(keys[-1], items)
+        return items
+
+    def extract_timeline_from_conversation(self, conversation_history, use_cache=True):
+        """
+        Analyzes the chat conversation and returns a list of timeline items
+        (action items, forms, documents, steps) that were actually discussed.
+        Used to drive the Timeline page from real conversation content.
 
-        user_content += "\nAnalyze the conversation above and extract a comprehensive timeline of action items based on what was discussed. Identify the user's situation and needs, then provide specific, actionable steps they should take. Output JSON only."
+        Items extracted for an earlier prefix of the same conversation are
+        reused, so only new turns are sent. `use_cache=False` forces a full
+        extraction.
+        """
+        keys, previous, request = self._plan_timeline(conversation_history, incremental=use_cache)
+        if request is None:
+            return previous or []
 
         try:
-            response = self.client.messages.create(
-                model="claude-3-haiku-20240307",
-                max_tokens=2048,
-                temperature=0,
-                system=system_prompt,
-                messages=[{"role": "user", "content": user_content}]
-            )
-            content = response.content[0].text.strip()
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0].strip()
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0].strip()
-            data = json.loads(content)
-            return data.get("items", [])
+            return self._finish_timeline(keys, previous, self._cached_json(request, use_cache))
         except Exception as e:
             print(f"Error extracting timeline from conversation: {e}")
-            return []
+            return previous or []
@@ -0,0 +1,129 @@
+import os
+from collections import deque
+from label_index import identifiers, normalize_label
+
+DEFAULT_TOKEN_BUDGET = int(os.getenv("LEGOL_CONTEXT_TOKENS", 2000))
+CHARS_PER_TOKEN = 4
+# Share of the budget for fully described nodes when the graph has to be pruned;
+# the rest lists other nodes by label only.
+FULL_DETAIL_SHARE = 0.75
+EDGE_RESERVE = 24
+
+# Question words that would seed nodes on their own ("I" matching every I-form)
+QUERY_STOPWORDS = set("""
+a about after all also am an and any are as at be been before being but by can could did do does doing
+during for from get had has have having how i if im in into is it its just me might more much must my need
+next no not now of on or our should so some than that the their them then there these they this to too
+up us was we were what when where which while who why will with would you your
+""".split())
+
+HEADER = ("Nodes (id|type|label|status|agency|deadline):\n", "Edges (source>target:type):\n")
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _clean(value):
+    return str(value or "").replace("|", "/").replace("\n", " ")
+
+
+def _terms(text):
+    """
+    The words of `text` that can tie a question to a node: form and visa ids
+    as whole units ("i 20", not "i" and "20") plus the other words, minus
+    QUERY_STOPWORDS.
+    """
+    key = normalize_label(text)
+    ids = identifiers(key)
+    id_parts = {part for found in ids for part in found.split()}
+    return ids | {word for word in key.split() if word not in QUERY_STOPWORDS and word not in id_parts}
+
+
+def _relevant_order(graph, query, hops):
+    """
+    Returns node ids ordered by relevance to `query`: nodes whose label shares
+    a term (see _terms) with the query first, then their neighbors up to
+    `hops` away (ignoring edge direction), then everything else.
+    """
+    terms = _terms(query)
+    seeds = [n for n, label in graph.nodes(data="label") if terms & _terms(label)] if terms else []
+
+    distance = {n: 0 for n in seeds}
+    queue = deque(seeds)
+    while queue:
+        node = queue.popleft()
+        if distance[node] >= hops:
+            continue
+        for neighbor in list(graph.successors(node)) + list(graph.predecessors(node)):
+            if neighbor not in distance:
+                distance[neighbor] = distance[node] + 1
+                queue.append(neighbor)
+
+    rest = [n for n in graph if n not in distance]
+    return sorted(distance, key=distance.get) + rest
+
+
+def _render(graph, order, char_budget):
+    """Renders nodes in `order` until `char_budget` runs out. Returns (text, included ids)."""
+    budget = char_budget - sum(len(h) for h in HEADER)
+    local_ids = {}
+    node_lines = []
+    for node_id in order:
+        data = graph.nodes[node_id]
+        local_id = f"n{len(local_ids) + 1}"
+        line = "|".join([local_id, _clean(data.get("type")), _clean(data.get("label")),
+                         _clean(data.get("status")), _clean(data.get("agency")),
+                         _clean(data.get("deadline"))]) + "\n"
+        # Edges between included nodes need room too (roughly one per node).
+        if len(line) + EDGE_RESERVE > budget:
+            break
+        local_ids[node_id] = local_id
+        node_lines.append(line)
+        budget -= len(line) + EDGE_RESERVE
+
+    edge_lines = []
+    for u, v, edge_type in graph.edges(data="type"):
+        if u in local_ids and v in local_ids:
+            edge_lines.append(f"{local_ids[u]}>{local_ids[v]}:{edge_type or 'dependency'}\n")
+
+    return HEADER[0] + "".join(node_lines) + HEADER[1] + "".join(edge_lines), local_ids
+
+
+def serialize_graph_context(graph, query="", token_budget=None, hops=2):
+    """
+    Renders a networkx graph as a compact edge list for the process_query
+    prompt, with short local ids (n1, n2, ...) instead of UUIDs and without
+    layout or React Flow styling fields.
+
+    Graphs that fit `token_budget` are sent whole. Otherwise most of the
+    budget goes to the k-hop neighborhood of nodes matching the query, and
+    the rest lists remaining nodes by label only so Claude can still avoid
+    creating duplicates.
+    """
+    token_budget = token_budget or DEFAULT_TOKEN_BUDGET
+    char_budget = token_budget * CHARS_PER_TOKEN
+    if graph.number_of_nodes() == 0:
+        return "(empty graph)"
+
+    text, included = _render(graph, list(graph), char_budget)
+    if len(included) == graph.number_of_nodes():
+        return text
+
+    order = _relevant_order(graph, query, hops)
+    text, included = _render(graph, order, int(char_budget * FULL_DETAIL_SHARE))
+
+    others = []
+    budget = char_budget - len(text) - 64
+    for node_id in order[len(included):]:
+        label = _clean(graph.nodes[node_id].get("label"))
+        if len(label) + 2 > budget:
+            break
+        others.append(label)
+        budget -= len(label) + 2
+    if others:
+        text += "Other existing nodes (labels only): " + "; ".join(others) + "\n"
+    omitted = graph.number_of_nodes() - len(included) - len(others)
+    if omitted > 0:
+        text += f"({omitted} less relevant nodes omitted)\n"
+    return text
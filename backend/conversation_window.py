@@ -0,0 +1,149 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from context_serializer import estimate_tokens
+from session_store import DEFAULT_SESSION
+
+
+def conversation_turns(conversation_history):
+    """Returns [(role, text)] for the turns worth analyzing, skipping empty ones and the canned greeting."""
+    turns = []
+    for msg in conversation_history or []:
+        role = msg.get("role")
+        text = msg.get("text", "")
+        if not text or (role == "assistant" and "LEGOL immigration assistant" in text and "How can I assist" in text):
+            continue
+        turns.append((role, text))
+    return turns
+
+
+def prefix_keys(turns):
+    """Returns one hash per prefix: keys[i] identifies turns[:i + 1]. Built as a chain, so O(total text)."""
+    keys = []
+    digest = b""
+    for role, text in turns:
+        digest = hashlib.sha256(digest + f"{role}\0{text}\0".encode("utf-8")).digest()
+        keys.append(digest.hex())
+    return keys
+
+
+class PrefixStore:
+    """
+    Bounded LRU of values derived from a conversation (extracted timeline
+    items, running summaries), keyed by the prefix hash of the turns they
+    cover, so the next request only has to process turns added since.
+    """
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # prefix key -> value
+        self._lock = threading.Lock()
+
+    def longest_prefix(self, keys):
+        """Returns (number of turns covered, value) for the longest stored prefix of `keys`."""
+        with self._lock:
+            for length in range(len(keys), 0, -1):
+                value = self.entries.get(keys[length - 1])
+                if value is not None:
+                    self.entries.move_to_end(keys[length - 1])
+                    return length, value
+        return 0, None
+
+    def put(self, key, value):
+        with self._lock:
+            self.entries.pop(key, None)
+            self.entries[key] = value
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+# Tokens of verbatim history (plus summary) sent with each chat request, per model.
+HISTORY_TOKEN_BUDGETS = {
+    "claude-3-haiku-20240307": 12000,
+}
+DEFAULT_HISTORY_TOKENS = 8000
+DOCUMENT_EXCERPT_CHARS = 4000
+
+
+class ConversationWindow:
+    """
+    Bounds what chat() sends as history. The last `max_turns` turns are kept
+    verbatim (fewer if they exceed the model's token budget); older turns are
+    folded into a running summary. Summaries are cached by the prefix hash of
+    the turns they cover and only extended when the window slides, which
+    happens `fold_step` turns at a time.
+
+    Uploaded documents are pinned per session, so they stay available after
+    the upload turn; what is sent from them is retrieved per question under
+    their own token budget (`document_tokens`), without competing with the
+    history.
+
+    Defaults come from LEGOL_CHAT_WINDOW_TURNS, LEGOL_CHAT_HISTORY_TOKENS
+    (overrides HISTORY_TOKEN_BUDGETS), LEGOL_CHAT_DOCUMENT_TOKENS and
+    LEGOL_CHAT_FOLD_STEP.
+    """
+
+    def __init__(self, max_turns=None, history_tokens=None, document_tokens=None, fold_step=None, max_entries=1000):
+        self.max_turns = max_turns if max_turns is not None else int(os.getenv("LEGOL_CHAT_WINDOW_TURNS", 8))
+        self.history_tokens = history_tokens if history_tokens is not None else int(os.getenv("LEGOL_CHAT_HISTORY_TOKENS", 0))
+        self.document_tokens = (document_tokens if document_tokens is not None
+                                else int(os.getenv("LEGOL_CHAT_DOCUMENT_TOKENS", 4000)))
+        self.fold_step = max(1, fold_step if fold_step is not None else int(os.getenv("LEGOL_CHAT_FOLD_STEP", 4)))
+        self.summaries = PrefixStore(max_entries)
+        self.pinned = OrderedDict()  # session_id -> {filename: file_info}, LRU
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def history_budget(self, model):
+        return self.history_tokens or HISTORY_TOKEN_BUDGETS.get(model, DEFAULT_HISTORY_TOKENS)
+
+    def plan(self, conversation_history, model):
+        """
+        Splits the history into the verbatim window and the folded prefix.
+        Returns a dict with:
+          turns    [(role, text)] to send verbatim (starts with a user turn)
+          folded   number of turns covered by the summary
+          summary  cached summary of the longest already-summarized prefix, or None
+          to_fold  turns still to be folded into `summary` (empty if it is current)
+          key      prefix key to remember the updated summary under
+        """
+        turns = conversation_turns(conversation_history)
+        start = max(0, len(turns) - self.max_turns)
+        start -= start % self.fold_step
+
+        budget = self.history_budget(model)
+        used = sum(estimate_tokens(text) for _, text in turns[start:])
+        while start < len(turns) and (used > budget or turns[start][0] != "user"):
+            used -= estimate_tokens(turns[start][1])
+            start += 1
+
+        folded = turns[:start]
+        keys = prefix_keys(folded)
+        covered, summary = self.summaries.longest_prefix(keys)
+        return {"turns": turns[start:], "folded": len(folded), "summary": summary,
+                "to_fold": folded[covered:], "key": keys[-1] if keys else None}
+
+    def remember(self, key, summary):
+        self.summaries.put(key, summary)
+
+    def documents(self, session_id, file_contents=None):
+        """
+        Pins this request's uploaded files for the session and returns all of
+        the session's files, oldest first; a re-upload under the same name
+        replaces the earlier file. Nothing is pinned for the shared default
+        session, which gets only this request's files.
+        """
+        current = [f for f in file_contents or [] if f.get("filename")]
+        with self._lock:
+            if session_id in (None, DEFAULT_SESSION):
+                pinned = {}
+            else:
+                pinned = self.pinned.pop(session_id, {})
+                self.pinned[session_id] = pinned
+                while len(self.pinned) > self.max_entries:
+                    self.pinned.popitem(last=False)
+            for file_info in current:
+                pinned.pop(file_info["filename"], None)
+                pinned[file_info["filename"]] = file_info
+            return list(pinned.values()) or list(file_contents or [])
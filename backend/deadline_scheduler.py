@@ -0,0 +1,380 @@
+import heapq
+import re
+from datetime import date
+
+from label_index import normalize_label
+
+DAYS_PER_UNIT = {"day": 1, "week": 7, "month": 30, "year": 365}
+# Relative to the node's own earliest start rather than a named anchor
+SELF = ""
+
+_ISO_DATE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+_ANCHORED = re.compile(r"(\d+)\s*(day|week|month|year)s?\s+(before|after|of|from|following)\s+([^.,;()]+)", re.I)
+_WITHIN = re.compile(r"within\s+(\d+)\s*(day|week|month|year)s?", re.I)
+
+
+def anchor_key(name):
+    """Normalized anchor name: "military_notice_date" and "military notice" are the same anchor."""
+    key = normalize_label((name or "").replace("_", " "))
+    return key[:-5] if key.endswith(" date") else key
+
+
+def to_ordinal(value):
+    """date, datetime or "YYYY-MM-DD" -> day number, None for anything else."""
+    if isinstance(value, date):
+        return value.toordinal()
+    try:
+        return date.fromisoformat(value[:10]).toordinal()
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_deadline(text):
+    """
+    Reads a node's free-text deadline into scheduling constraints:
+    (releases, dues), each a list of (anchor, days).
+
+    "2024-05-01" is an absolute due date (anchor None, days = day number).
+    "30 days before expiry" is due 30 days before the "expiry" anchor;
+    "within 60 days of graduation" (or after/from/following) is due 60 days
+    after it and can't start before it. A bare "within 2 weeks" is measured
+    from the node's own earliest start (anchor SELF). Months count 30 days.
+    """
+    releases, dues = [], []
+    if not isinstance(text, str):
+        return releases, dues
+    for match in _ISO_DATE.finditer(text):
+        ordinal = to_ordinal(match.group(0))
+        if ordinal is not None:
+            dues.append((None, ordinal))
+    anchored = False
+    for count, unit, relation, phrase in _ANCHORED.findall(text):
+        key = anchor_key(phrase)
+        if not key:
+            continue
+        days = int(count) * DAYS_PER_UNIT[unit.lower()]
+        anchored = True
+        if relation.lower() == "before":
+            dues.append((key, -days))
+        else:
+            dues.append((key, days))
+            releases.append((key, 0))
+    if not anchored:
+        for count, unit in _WITHIN.findall(text):
+            dues.append((SELF, int(count) * DAYS_PER_UNIT[unit.lower()]))
+    return releases, dues
+
+
+def node_constraints(data):
+    """set_node arguments for a GraphManager node: its "deadline" text and optional "duration_days"."""
+    releases, dues = parse_deadline(data.get("deadline"))
+    duration = data.get("duration_days") or 0
+    return {"duration": int(duration) if isinstance(duration, (int, float)) else 0,
+            "releases": releases, "dues": dues}
+
+
+class DeadlineScheduler:
+    """
+    Earliest/latest dates over a dependency DAG, critical-path style.
+
+    Each node has a duration in days, release constraints (can't start before
+    anchor + days) and due constraints (must finish by anchor + days, by an
+    absolute date, or within days of its own earliest start). Anchors are
+    named dates that can change at any time. The forward pass takes
+    earliest start = latest of the releases and the predecessors' earliest
+    finishes; the backward pass takes latest finish = earliest of the dues
+    and the successors' latest starts. Slack is latest start - earliest
+    start. Nodes with no anchored input have no dates.
+
+    Changes only mark the nodes whose own inputs changed. The next read
+    propagates from those in topological order (a heap on each node's
+    position), forward to successors and backward to predecessors, and
+    stops wherever a recomputed node's dates come out unchanged. The order
+    itself is only rebuilt when a new edge goes against it or may break a
+    cycle; nodes on a cycle get no dates and are listed in `cyclic`.
+    """
+
+    def __init__(self, anchors=None):
+        self.clear()
+        for name, value in (anchors or {}).items():
+            self.set_anchor(name, value)
+
+    def clear(self):
+        self.anchors = {}  # anchor key -> day number
+        self.anchor_names = {}  # anchor key -> name as given
+        self.anchor_nodes = {}  # anchor key -> ids of nodes with constraints on it
+        self.specs = {}  # node id -> (duration, releases, dues)
+        self.successors = {}
+        self.predecessors = {}
+        self.position = {}  # node id -> place in a topological order
+        self._next_position = 0
+        self.cyclic = set()
+        self._order_valid = True
+        self.earliest = {}  # node id -> (earliest start, earliest finish)
+        self.latest = {}  # node id -> (latest start, latest finish)
+        self._forward = set()
+        self._backward = set()
+        self.stats = {"rebuilds": 0, "recomputed": 0}
+
+    def set_anchor(self, name, value):
+        """Sets (or with value None, removes) a named anchor date."""
+        key = anchor_key(name)
+        ordinal = to_ordinal(value)
+        if value is not None and ordinal is None:
+            raise ValueError(f"Invalid date for anchor {name!r}: {value!r}")
+        if ordinal is None:
+            self.anchors.pop(key, None)
+            self.anchor_names.pop(key, None)
+        else:
+            self.anchors[key] = ordinal
+            self.anchor_names[key] = name
+        self._mark(self.anchor_nodes.get(key, ()))
+
+    def set_node(self, node_id, duration=0, releases=(), dues=()):
+        """Adds a node or replaces its duration and constraints."""
+        if node_id in self.specs:
+            self._unindex_anchors(node_id)
+        else:
+            self.successors[node_id] = set()
+            self.predecessors[node_id] = set()
+            self.position[node_id] = self._next_position
+            self._next_position += 1
+        releases = [(anchor_key(key), days) for key, days in releases]
+        dues = [(key if not key else anchor_key(key), days) for key, days in dues]
+        self.specs[node_id] = (duration, releases, dues)
+        for key, _ in releases + dues:
+            if key:
+                self.anchor_nodes.setdefault(key, set()).add(node_id)
+        self._mark((node_id,))
+
+    def remove_node(self, node_id):
+        if node_id not in self.specs:
+            return
+        self._unindex_anchors(node_id)
+        for successor in self.successors.pop(node_id):
+            self.predecessors[successor].discard(node_id)
+            self._forward.add(successor)
+        for predecessor in self.predecessors.pop(node_id):
+            self.successors[predecessor].discard(node_id)
+            self._backward.add(predecessor)
+        if node_id in self.cyclic:
+            self._order_valid = False
+        for state in (self.specs, self.position, self.earliest, self.latest):
+            state.pop(node_id, None)
+        self._forward.discard(node_id)
+        self._backward.discard(node_id)
+
+    def add_edge(self, source_id, target_id):
+        """`target_id` depends on `source_id`: it can't start before the source finishes."""
+        for node_id in (source_id, target_id):
+            if node_id not in self.specs:
+                self.set_node(node_id)
+        if target_id in self.successors[source_id]:
+            return
+        self.successors[source_id].add(target_id)
+        self.predecessors[target_id].add(source_id)
+        if (source_id in self.cyclic or target_id in self.cyclic or
+                self.position[source_id] >= self.position[target_id]):
+            self._order_valid = False
+        self._forward.add(target_id)
+        self._backward.add(source_id)
+
+    def remove_edge(self, source_id, target_id):
+        if target_id not in self.successors.get(source_id, ()):
+            return
+        self.successors[source_id].discard(target_id)
+        self.predecessors[target_id].discard(source_id)
+        if source_id in self.cyclic or target_id in self.cyclic:
+            self._order_valid = False  # may have broken a cycle
+        self._forward.add(target_id)
+        self._backward.add(source_id)
+
+    def _unindex_anchors(self, node_id):
+        _, releases, dues = self.specs[node_id]
+        for key, _ in releases + dues:
+            if key in self.anchor_nodes:
+                self.anchor_nodes[key].discard(node_id)
+
+    def _mark(self, node_ids):
+        self._forward.update(node_ids)
+        self._backward.update(node_ids)
+
+    def _rebuild_order(self):
+        """Kahn's algorithm over every node; whatever is left over sits on or behind a cycle."""
+        self.stats["rebuilds"] += 1
+        pending = {node_id: len(predecessors) for node_id, predecessors in self.predecessors.items()}
+        ready = [node_id for node_id, count in pending.items() if not count]
+        position = {}
+        while ready:
+            node_id = ready.pop()
+            position[node_id] = len(position)
+            for successor in self.successors[node_id]:
+                pending[successor] -= 1
+                if not pending[successor]:
+                    ready.append(successor)
+        cyclic = set(self.specs) - set(position)
+        for node_id in cyclic:
+            position[node_id] = len(position)
+        # Nodes entering or leaving a cycle gain or lose their dates
+        for node_id in (cyclic ^ self.cyclic) & self.specs.keys():
+            self._mark((node_id,))
+            self._forward.update(self.successors.get(node_id, ()))
+            self._backward.update(self.predecessors.get(node_id, ()))
+        self.position = position
+        self._next_position = len(position)
+        self.cyclic = cyclic
+        self._order_valid = True
+        if cyclic:
+            print(f"Schedule ignores {len(cyclic)} nodes on or behind a dependency cycle")
+
+    def _anchor_date(self, key, days, own_start=None):
+        if key is None:
+            return days
+        base = own_start if key == SELF else self.anchors.get(key)
+        return None if base is None else base + days
+
+    def _settle(self):
+        """Propagates pending changes; see the class docstring."""
+        if not self._order_valid:
+            self._rebuild_order()
+        position = self.position
+
+        queue = [(position[node_id], node_id) for node_id in self._forward]
+        heapq.heapify(queue)
+        queued = set(self._forward)
+        self._forward = set()
+        while queue:
+            _, node_id = heapq.heappop(queue)
+            queued.discard(node_id)
+            self.stats["recomputed"] += 1
+            duration, releases, dues = self.specs[node_id]
+            start = None
+            if node_id not in self.cyclic:
+                candidates = [self._anchor_date(key, days) for key, days in releases]
+                candidates += [self.earliest[p][1] for p in self.predecessors[node_id]
+                               if p in self.earliest and p not in self.cyclic]
+                candidates = [value for value in candidates if value is not None]
+                start = max(candidates) if candidates else None
+            dates = None if start is None else (start, start + duration)
+            if dates == self.earliest.get(node_id):
+                continue
+            if dates is None:
+                self.earliest.pop(node_id, None)
+            else:
+                self.earliest[node_id] = dates
+            if any(key == SELF for key, _ in dues):
+                self._backward.add(node_id)
+            for successor in self.successors[node_id]:
+                if successor not in queued:
+                    queued.add(successor)
+                    heapq.heappush(queue, (position[successor], successor))
+
+        queue = [(-position[node_id], node_id) for node_id in self._backward]
+        heapq.heapify(queue)
+        queued = set(self._backward)
+        self._backward = set()
+        while queue:
+            _, node_id = heapq.heappop(queue)
+            queued.discard(node_id)
+            self.stats["recomputed"] += 1
+            duration, releases, dues = self.specs[node_id]
+            finish = None
+            if node_id not in self.cyclic:
+                own_start = self.earliest.get(node_id, (None,))[0]
+                candidates = [self._anchor_date(key, days, own_start) for key, days in dues]
+                candidates += [self.latest[s][0] for s in self.successors[node_id]
+                               if s in self.latest and s not in self.cyclic]
+                candidates = [value for value in candidates if value is not None]
+                finish = min(candidates) if candidates else None
+            dates = None if finish is None else (finish - duration, finish)
+            if dates == self.latest.get(node_id):
+                continue
+            if dates is None:
+                self.latest.pop(node_id, None)
+            else:
+                self.latest[node_id] = dates
+            for predecessor in self.predecessors[node_id]:
+                if predecessor not in queued:
+                    queued.add(predecessor)
+                    heapq.heappush(queue, (-position[predecessor], predecessor))
+
+    def recompute(self):
+        """Recomputes every node's dates from scratch."""
+        self.earliest, self.latest = {}, {}
+        self._mark(self.specs)
+        self._settle()
+
+    def slack(self, node_id):
+        """Latest start - earliest start in days, or None unless both are known."""
+        if node_id not in self.earliest or node_id not in self.latest:
+            return None
+        return self.latest[node_id][0] - self.earliest[node_id][0]
+
+    def node_dates(self, node_id):
+        """{"earliest_start", "earliest_finish", "latest_start", "latest_finish", "slack", "critical"}."""
+        self._settle()
+        earliest = self.earliest.get(node_id, (None, None))
+        latest = self.latest.get(node_id, (None, None))
+        slack = self.slack(node_id)
+        return {
+            "earliest_start": _iso(earliest[0]),
+            "earliest_finish": _iso(earliest[1]),
+            "latest_start": _iso(latest[0]),
+            "latest_finish": _iso(latest[1]),
+            "slack": slack,
+            "critical": slack is not None and slack <= 0
+        }
+
+    def critical_path(self):
+        """
+        The chain that sets the tightest deadline: from the node with the
+        least slack (ties: the later earliest finish), back through the
+        predecessors whose finish sets its earliest start and forward
+        through the successors it drives, as long as the slack stays the
+        same. Node ids in dependency order.
+        """
+        self._settle()
+        scheduled = [node_id for node_id in self.latest if node_id in self.earliest]
+        if not scheduled:
+            return []
+        worst = min(scheduled, key=lambda n: (self.slack(n), -self.earliest[n][1], self.position[n]))
+        slack = self.slack(worst)
+
+        def driving(node_id, neighbours, linked):
+            return sorted((n for n in neighbours if n in self.earliest and self.slack(n) == slack and linked(n)),
+                          key=self.position.get)
+
+        path = [worst]
+        node_id = worst
+        while True:
+            start = self.earliest[node_id][0]
+            drivers = driving(node_id, self.predecessors[node_id], lambda p: self.earliest[p][1] == start)
+            if not drivers:
+                break
+            node_id = drivers[0]
+            path.append(node_id)
+        path.reverse()
+        node_id = worst
+        while True:
+            finish = self.earliest[node_id][1]
+            driven = driving(node_id, self.successors[node_id], lambda s: self.earliest[s][0] == finish)
+            if not driven:
+                break
+            node_id = driven[0]
+            path.append(node_id)
+        return path
+
+    def snapshot(self):
+        """Every node with any date, the anchors, the critical path and the cyclic nodes."""
+        self._settle()
+        return {
+            "anchors": {self.anchor_names[key]: _iso(ordinal) for key, ordinal in self.anchors.items()},
+            "nodes": {node_id: self.node_dates(node_id) for node_id in self.specs
+                      if node_id in self.earliest or node_id in self.latest},
+            "critical_path": self.critical_path(),
+            "cyclic": sorted(self.cyclic)
+        }
+
+
+def _iso(ordinal):
+    return None if ordinal is None else date.fromordinal(ordinal).isoformat()
@@ -0,0 +1,371 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from PyPDF2 import PdfReader
+from file_parser import PARSER_VERSION, PDF_MAX_PAGES, extract_text_cached, extract_text_from_file
+from conversation_window import DOCUMENT_EXCERPT_CHARS
+from context_serializer import CHARS_PER_TOKEN
+from retrieval_index import BM25Index, split_text
+
+DOCUMENT_DIR = os.getenv("LEGOL_DOCUMENT_DIR") or os.path.join(tempfile.gettempdir(), "legol-documents")
+# Non-PDF text is split into pseudo-pages of this size
+DOCUMENT_PAGE_CHARS = 3000
+
+# How often, at most, a document in memory refreshes its TTL on disk and
+# the directory is scanned for expired files
+DOCUMENT_REFRESH_SECONDS = 600
+
+DOCUMENT_TYPES = {'.pdf': 'PDF', '.docx': 'Word Document', '.doc': 'Word Document', '.txt': 'Text File'}
+_DOCUMENT_ID = re.compile(r"[0-9a-f]{32}")
+def parse_page_range(value):
+    """
+    Parses a 1-based inclusive page range ("3", "2-5", [2, 5] or 4) into a
+    0-based [start, stop) pair. Raises ValueError if it isn't one.
+    """
+    if isinstance(value, (list, tuple)) and len(value) in (1, 2):
+        first, last = int(value[0]), int(value[-1])
+    elif isinstance(value, int):
+        first = last = value
+    elif isinstance(value, str):
+        first, _, last = value.strip().partition("-")
+        first = int(first)
+        last = int(last) if last else first
+    else:
+        raise ValueError(f"Invalid page range: {value!r}")
+    if first < 1 or last < first:
+        raise ValueError(f"Invalid page range: {value!r}")
+    return first - 1, last
+
+
+def document_refs(document_ids):
+    """
+    Turns the `document_ids` of a chat request (ids, or {"document_id", "pages"}
+    dicts) into file entries for ClaudeIntegration.chat.
+    """
+    refs = []
+    for item in document_ids or []:
+        if isinstance(item, str):
+            refs.append({"document_id": item})
+        elif isinstance(item, dict) and item.get("document_id"):
+            refs.append({"document_id": item["document_id"], "page_range": item.get("pages")})
+    return refs
+
+
+class DocumentStore:
+    """
+    Uploaded files kept server-side under a document id (a hash of their
+    bytes), so chat requests refer to documents instead of carrying their
+    text.
+
+    Files and their metadata live in `directory` (LEGOL_DOCUMENT_DIR, which
+    must be shared storage if uploads and chats are served by different
+    machines). Text is extracted lazily, one page at a time, only for the
+    pages a request needs; extracted pages go through `parse_cache` if given.
+    A keyword index over a document's chunks is built the first time it is
+    searched. At most `max_documents` (LEGOL_DOCUMENT_CACHE_ENTRIES) documents
+    keep their pages and index in memory; files untouched for `ttl_seconds`
+    (LEGOL_DOCUMENT_TTL_SECONDS) are deleted. Use refreshes a document's
+    metadata mtime, and expired files are looked for, at most every
+    DOCUMENT_REFRESH_SECONDS (or a tenth of the TTL, if shorter).
+    """
+
+    def __init__(self, directory=None, parse_cache=None, max_documents=None, ttl_seconds=None):
+        self.directory = directory or DOCUMENT_DIR
+        self.parse_cache = parse_cache
+        self.max_documents = (max_documents if max_documents is not None
+                              else int(os.getenv("LEGOL_DOCUMENT_CACHE_ENTRIES", 64)))
+        self.ttl_seconds = (ttl_seconds if ttl_seconds is not None
+                            else float(os.getenv("LEGOL_DOCUMENT_TTL_SECONDS", 7 * 86400)))
+        self.refresh_seconds = (min(DOCUMENT_REFRESH_SECONDS, self.ttl_seconds / 10) if self.ttl_seconds
+                                else DOCUMENT_REFRESH_SECONDS)
+        self.loaded = OrderedDict()  # document_id -> document dict, LRU
+        self._pruned_at = 0.0
+        self.stats = {"documents_added": 0, "documents_reused": 0, "pages_extracted": 0, "page_cache_hits": 0,
+                      "range_reads": 0, "searches": 0, "indexes_built": 0}
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _meta_path(self, document_id):
+        return os.path.join(self.directory, document_id + ".json")
+
+    def add(self, path, filename):
+        """
+        Moves the file at `path` into the store and returns its /upload entry:
+        document_id, filename, type and page count. Only the page count is
+        read for PDFs; other files are small enough to extract up front. Both
+        go through `parse_cache`, and bytes already in the store aren't
+        parsed again at all.
+        """
+        extension = os.path.splitext(filename)[1].lower()
+        if extension not in DOCUMENT_TYPES:
+            os.unlink(path)
+            return {'filename': filename, 'pages': 0, 'type': 'Unknown',
+                    'error': f'Unsupported file type: {extension}'}
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        document_id = digest.hexdigest()[:32]
+        document = self._load(document_id)
+        if document is not None and os.path.exists(document["path"]):
+            # Same bytes uploaded again: the stored entry already has everything
+            os.unlink(path)
+            with self._lock:
+                self.stats["documents_reused"] += 1
+            return {'filename': filename, 'document_id': document_id, 'pages': document["pages"],
+                    'type': document["type"], 'error': None}
+        stored = os.path.join(self.directory, document_id + extension)
+        shutil.move(path, stored)
+
+        pages = None
+        try:
+            if extension == '.pdf':
+                page_count = self._page_count(document_id, stored)
+            else:
+                if self.parse_cache is not None:
+                    result = extract_text_cached(stored, self.parse_cache)
+                else:
+                    result = extract_text_from_file(stored)
+                if result.get('error'):
+                    raise ValueError(result['error'])
+                pages = split_text(result['text'], DOCUMENT_PAGE_CHARS) or [""]
+                page_count = len(pages)
+        except Exception as e:
+            os.unlink(stored)
+            return {'filename': filename, 'pages': 0, 'type': DOCUMENT_TYPES[extension],
+                    'error': f'Error parsing file: {str(e)}'}
+
+        meta = {"document_id": document_id, "filename": filename, "type": DOCUMENT_TYPES[extension],
+                "pages": page_count, "path": os.path.basename(stored)}
+        with open(self._meta_path(document_id), "w") as f:
+            json.dump(meta, f)
+        document = self._load(document_id)
+        if pages is not None:
+            with self._lock:
+                document["page_texts"].update(enumerate(pages))
+        with self._lock:
+            self.stats["documents_added"] += 1
+        self._prune()
+        return {'filename': filename, 'document_id': document_id, 'pages': page_count,
+                'type': meta["type"], 'error': None}
+
+    def _page_count(self, document_id, path):
+        """Page count of a stored PDF, through `parse_cache` if given."""
+        key = f"v{PARSER_VERSION}:page_count:{document_id}"
+        cached = self.parse_cache.get(key) if self.parse_cache is not None else None
+        if cached is not None:
+            return int(cached)
+        start = time.perf_counter()
+        page_count = len(PdfReader(path).pages)
+        if self.parse_cache is not None:
+            self.parse_cache.put(key, str(page_count), (time.perf_counter() - start) * 1000)
+        return page_count
+
+    def _load(self, document_id):
+        """The in-memory record for `document_id`, read from disk if needed; None if unknown."""
+        if not isinstance(document_id, str) or not _DOCUMENT_ID.fullmatch(document_id):
+            return None
+        now = time.time()
+        with self._lock:
+            document = self.loaded.get(document_id)
+            if document is not None:
+                self.loaded.move_to_end(document_id)
+                stale = now - document["touched_at"] >= self.refresh_seconds
+                if stale:
+                    document["touched_at"] = now
+        if document is not None:
+            if stale:
+                # Keep documents in use from expiring on disk, without a write per request
+                try:
+                    os.utime(self._meta_path(document_id))
+                except OSError:
+                    pass
+            return document
+        try:
+            with open(self._meta_path(document_id)) as f:
+                meta = json.load(f)
+            os.utime(self._meta_path(document_id))
+        except (OSError, ValueError):
+            return None
+        document = dict(meta, path=os.path.join(self.directory, meta["path"]), page_texts={}, index=None,
+                        touched_at=now)
+        with self._lock:
+            document = self.loaded.setdefault(document_id, document)
+            while len(self.loaded) > self.max_documents:
+                self.loaded.popitem(last=False)
+        return document
+
+    def _prune(self):
+        """Deletes files untouched for ttl_seconds, scanning the directory at most every refresh_seconds."""
+        if not self.ttl_seconds:
+            return
+        now = time.time()
+        with self._lock:
+            if now - self._pruned_at < self.refresh_seconds:
+                return
+            self._pruned_at = now
+        cutoff = now - self.ttl_seconds
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            meta_path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(meta_path) >= cutoff:
+                    continue
+                with open(meta_path) as f:
+                    stored = json.load(f)["path"]
+                os.unlink(meta_path)
+                with self._lock:
+                    self.loaded.pop(name[:-5], None)
+                os.unlink(os.path.join(self.directory, stored))
+            except (OSError, ValueError, KeyError):
+                pass
+
+    def info(self, document_id):
+        """document_id, filename, type and page count, or None for an unknown id."""
+        document = self._load(document_id)
+        if document is None:
+            return None
+        return {key: document[key] for key in ("document_id", "filename", "type", "pages")}
+
+    def describe(self, file_contents):
+        """Fills in filename, type and page count of the document references in chat file entries."""
+        described = []
+        for file_info in file_contents or []:
+            document_id = file_info.get("document_id")
+            if not document_id:
+                described.append(file_info)
+                continue
+            info = self.info(document_id)
+            if info is None:
+                info = {"filename": file_info.get("filename") or document_id, "content": None,
+                        "error": "Document not found; please upload it again"}
+            described.append(dict(file_info, **info))
+        return described
+
+    def pages(self, document_id, start=0, stop=None):
+        """
+        Texts of pages [start, stop) (0-based, clipped to the document),
+        extracting only the pages not read before. Raises KeyError for an
+        unknown id.
+        """
+        document = self._load(document_id)
+        if document is None:
+            raise KeyError(document_id)
+        stop = document["pages"] if stop is None else min(stop, document["pages"])
+        start = max(0, start)
+        missing = [index for index in range(start, stop) if index not in document["page_texts"]]
+        if missing:
+            extracted = self._extract_pages(document, missing)
+            with self._lock:
+                document["page_texts"].update(extracted)
+        with self._lock:
+            self.stats["range_reads"] += 1
+            return [document["page_texts"].get(index, "") for index in range(start, stop)]
+
+    def _extract_pages(self, document, indexes):
+        texts = {}
+        reader = None
+        for index in indexes:
+            key = f"v{PARSER_VERSION}:page:{document['document_id']}:{index}"
+            cached = self.parse_cache.get(key) if self.parse_cache is not None else None
+            if cached is not None:
+                texts[index] = cached
+                with self._lock:
+                    self.stats["page_cache_hits"] += 1
+                continue
+            if not document["path"].endswith(".pdf"):
+                # Pseudo-pages of a file dropped from memory: re-split the whole text once
+                result = extract_text_from_file(document["path"])
+                pages = split_text(result.get('text'), DOCUMENT_PAGE_CHARS)
+                texts.update((i, pages[i] if i < len(pages) else "") for i in indexes)
+                break
+            start = time.perf_counter()
+            reader = reader or PdfReader(document["path"])
+            texts[index] = (reader.pages[index].extract_text() or "").strip()
+            if self.parse_cache is not None:
+                self.parse_cache.put(key, texts[index], (time.perf_counter() - start) * 1000)
+            with self._lock:
+                self.stats["pages_extracted"] += 1
+        return texts
+
+    def sections(self, document_id):
+        """[(page, text)] for every page (up to PDF_MAX_PAGES), extracting the ones not read yet."""
+        document = self._load(document_id)
+        if document is None:
+            raise KeyError(document_id)
+        page_count = document["pages"]
+        if document["path"].endswith(".pdf") and PDF_MAX_PAGES:
+            page_count = min(page_count, PDF_MAX_PAGES)
+        return list(enumerate(self.pages(document_id, 0, page_count)))
+
+    def _index(self, document):
+        """BM25Index over the document's pages, built on first search."""
+        if document["index"] is not None:
+            return document["index"]
+        index = BM25Index()
+        index.add(document["document_id"], self.sections(document["document_id"]))
+        with self._lock:
+            document["index"] = index
+            self.stats["indexes_built"] += 1
+        return index
+
+    def search(self, document_id, query, max_chars=DOCUMENT_EXCERPT_CHARS):
+        """
+        The chunks that best match the words of `query`, as [(page, text)]
+        best first, up to about `max_chars` characters. Empty if nothing
+        matches. Raises KeyError for an unknown id.
+        """
+        document = self._load(document_id)
+        if document is None:
+            raise KeyError(document_id)
+        index = self._index(document)
+        with self._lock:
+            self.stats["searches"] += 1
+        return [(page, text) for _, page, text in index.search(query, token_budget=max_chars // CHARS_PER_TOKEN)]
+
+    def excerpt(self, file_info, query, max_chars=DOCUMENT_EXCERPT_CHARS):
+        """
+        Resolves a document reference into a chat file entry whose content is
+        at most `max_chars` characters: the requested page range if it names
+        one, else the chunks most relevant to `query`, else the first pages.
+        """
+        document_id = file_info.get("document_id")
+        info = self.info(document_id)
+        if info is None:
+            return {"filename": file_info.get("filename") or document_id, "content": None,
+                    "error": "Document not found; please upload it again"}
+        entry = dict(file_info, **info)
+        try:
+            if file_info.get("page_range"):
+                start, stop = parse_page_range(file_info["page_range"])
+                sections = list(enumerate(self.pages(document_id, start, stop), start))
+            else:
+                sections = self.search(document_id, query, max_chars)
+                if not sections:
+                    # Nothing matched: read pages from the start until the excerpt is full
+                    sections, used = [], 0
+                    for page in range(info["pages"]):
+                        text = self.pages(document_id, page, page + 1)[0]
+                        sections.append((page, text))
+                        used += len(text)
+                        if used >= max_chars:
+                            break
+        except ValueError as e:
+            return dict(entry, content=None, error=str(e))
+        content = "\n\n".join(f"[page {page + 1}] {text}" for page, text in sections if text)
+        entry["content"] = content[:max_chars]
+        return entry
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["loaded"] = len(self.loaded)
+        return stats
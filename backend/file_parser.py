@@ -1,6 +1,63 @@
+import hashlib
+import json
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from PyPDF2 import PdfReader
 from docx import Document
+from response_cache import ResponseCache
+
+# PDFs with at least this many pages are split across worker processes.
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("LEGOL_PDF_PARALLEL_MIN_PAGES", 16))
+PDF_WORKERS = int(os.getenv("LEGOL_PDF_WORKERS", os.cpu_count() or 1))
+# 0 disables a budget; text is cut off after this many pages / seconds.
+PDF_MAX_PAGES = int(os.getenv("LEGOL_PDF_MAX_PAGES", 0))
+PDF_TIME_BUDGET_SECONDS = float(os.getenv("LEGOL_PDF_TIME_BUDGET_SECONDS", 0))
+
+_pdf_pool = None
+
+# Bump when extraction output changes so cached results from older parsers are not reused.
+PARSER_VERSION = 2
+
+
+class ParseCache(ResponseCache):
+    """
+    Parsed uploads keyed by parse_cache_key: an in-memory LRU plus an optional
+    SQLite store (LEGOL_PARSE_CACHE_PATH). Other limits use the
+    LEGOL_PARSE_CACHE_* variables documented on ResponseCache.
+    """
+    ENV_PREFIX = "LEGOL_PARSE_CACHE"
+    TABLE = "parse_cache"
+
+
+def parse_cache_key(filepath):
+    """SHA-256 of the file bytes plus everything else that changes the result."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    extension = os.path.splitext(filepath)[1].lower()
+    return f"v{PARSER_VERSION}:{extension}:{PDF_MAX_PAGES}:{digest.hexdigest()}"
+
+
+def extract_text_cached(filepath, cache):
+    """
+    extract_text_from_file through `cache`: repeat uploads of the same bytes
+    return the stored text, page count and type without re-parsing. Errors
+    and results cut short by the time budget are not cached.
+    """
+    key = parse_cache_key(filepath)
+    cached = cache.get(key)
+    if cached is not None:
+        return json.loads(cached)
+
+    start = time.perf_counter()
+    result = extract_text_from_file(filepath)
+    out_of_time = result.get('truncated') and result.get('pages_extracted', 0) < (PDF_MAX_PAGES or result.get('pages', 0))
+    if not result.get('error') and not out_of_time:
+        cache.put(key, json.dumps(result), (time.perf_counter() - start) * 1000)
+    return result
 
 def extract_text_from_file(filepath):
     """
@@ -29,19 +86,88 @@ def extract_text_from_file(filepath):
             'pages': 0
         }
 
-def extract_text_from_pdf(filepath):
-    """Extract text from PDF file"""
+def _get_pdf_pool():
+    global _pdf_pool
+    if _pdf_pool is None:
+        _pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+    return _pdf_pool
+
+def _reset_pdf_pool():
+    """Drops a broken pool so the next parallel extraction starts a fresh one."""
+    global _pdf_pool
+    pool, _pdf_pool = _pdf_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def _extract_page_range(filepath, start, stop, deadline=None):
+    """Worker: text of pages [start, stop), stopping early once `deadline` (time.time()) passes."""
     reader = PdfReader(filepath)
-    text = ""
+    texts = []
+    for index in range(start, stop):
+        if deadline is not None and time.time() > deadline:
+            break
+        texts.append(reader.pages[index].extract_text())
+    return texts
 
-    for page in reader.pages:
-        text += page.extract_text() + "\n\n"
+def _extract_pages_parallel(filepath, page_count, deadline, workers):
+    """Shards page ranges across the process pool; returns page texts in order, up to the first gap."""
+    # One shard per worker: each shard re-opens the PDF, so more shards cost more parsing
+    shard = max(4, -(-page_count // workers))
+    ranges = [(start, min(start + shard, page_count)) for start in range(0, page_count, shard)]
+    pool = _get_pdf_pool()
+    futures = [pool.submit(_extract_page_range, filepath, start, stop, deadline) for start, stop in ranges]
+    texts = []
+    for (start, stop), future in zip(ranges, futures):
+        shard_texts = future.result()
+        texts.extend(shard_texts)
+        if len(shard_texts) < stop - start:
+            # Out of time: keep the text contiguous
+            for rest in futures:
+                rest.cancel()
+            break
+    return texts
 
-    return {
-        'text': text.strip(),
-        'pages': len(reader.pages),
+def extract_text_from_pdf(filepath, max_pages=None, time_budget=None, workers=None):
+    """
+    Extract text from PDF file. Large PDFs are split into page ranges that
+    are extracted in parallel worker processes and joined in order.
+    At most `max_pages` pages and `time_budget` seconds are spent (0 = no
+    limit); a result cut short has 'truncated' and 'pages_extracted' set.
+    """
+    max_pages = PDF_MAX_PAGES if max_pages is None else max_pages
+    time_budget = PDF_TIME_BUDGET_SECONDS if time_budget is None else time_budget
+    workers = PDF_WORKERS if workers is None else workers
+
+    reader = PdfReader(filepath)
+    total_pages = len(reader.pages)
+    page_count = min(total_pages, max_pages) if max_pages else total_pages
+    deadline = time.time() + time_budget if time_budget else None
+
+    texts = None
+    if workers > 1 and page_count >= PDF_PARALLEL_MIN_PAGES:
+        try:
+            texts = _extract_pages_parallel(filepath, page_count, deadline, workers)
+        except (OSError, NotImplementedError, RuntimeError) as e:
+            # No multiprocessing (e.g. some serverless sandboxes), or a worker died
+            if isinstance(e, BrokenProcessPool):
+                _reset_pdf_pool()
+            print(f"Parallel PDF extraction unavailable, falling back to serial: {e}")
+    if texts is None:
+        texts = []
+        for page in reader.pages[:page_count]:
+            if deadline is not None and time.time() > deadline:
+                break
+            texts.append(page.extract_text())
+
+    result = {
+        'text': "\n\n".join(texts).strip(),
+        'pages': total_pages,
         'type': 'PDF'
     }
+    if len(texts) < total_pages:
+        result['truncated'] = True
+        result['pages_extracted'] = len(texts)
+    return result
 
 def extract_text_from_docx(filepath):
     """Extract text from Word document"""
@@ -1,86 +1,394 @@
 import networkx as nx
 import json
 import uuid
+from collections import deque
+from layout_engine import LayoutEngine, ORDERING_EDGE_TYPES
+from deadline_scheduler import DeadlineScheduler, node_constraints
+from label_index import LabelIndex
+
+# Rough per-item overhead (dicts, uuids, layout cache, change log entries) used
+# for the running memory estimate in GraphManager.approx_bytes.
+NODE_OVERHEAD_BYTES = 1200
+EDGE_OVERHEAD_BYTES = 600
+
+
+def _estimate_bytes(data, overhead):
+    size = overhead
+    for value in data.values():
+        if isinstance(value, str):
+            size += len(value)
+        elif isinstance(value, list):
+            size += sum(len(str(item)) + 56 for item in value)
+    return size
+
 
 class GraphManager:
-    def __init__(self):
+    def __init__(self, max_changes=1000, persistence=None, session_id="default"):
         self.graph = nx.DiGraph()
+        self.layout = LayoutEngine()
+        self.labels = LabelIndex()
+        # Earliest/latest dates over dependency edges, kept in step with the graph
+        self.schedule = DeadlineScheduler()
+        # Every mutation bumps `revision` and is recorded in `changes` as
+        # (revision, kind, op, item_id). Only the last `max_changes` entries
+        # are kept; deltas older than `_log_floor` fall back to a snapshot.
+        self.revision = 0
+        self.max_changes = max_changes
+        self.changes = deque()
+        self._log_floor = 0
+        self._relayout_revision = {}
+        self.approx_bytes = 0
+        # Optional write-behind persistence (see graph_persistence.py). Touched
+        # ids are collected here and written in one batch by flush().
+        self.persistence = persistence
+        self.session_id = session_id
+        self._persisted_version = 0
+        self._dirty_nodes = set()
+        self._dirty_edges = {}  # edge_id -> (source_id, target_id)
+        self._cleared = False
+
+    @classmethod
+    def load(cls, persistence, session_id, min_revision=0, **kwargs):
+        """
+        Rebuilds a session's graph from persistence. `min_revision` keeps
+        revisions monotonic when a stale in-memory graph is being replaced.
+        """
+        manager = cls(persistence=persistence, session_id=session_id, **kwargs)
+        version, revision, nodes, edges = persistence.load(session_id)
+        manager.graph.add_nodes_from(nodes)
+        manager.graph.add_edges_from(edges)
+        for node_id, data in nodes:
+            manager.labels.add(node_id, data.get("label", ""))
+            manager.schedule.set_node(node_id, **node_constraints(data))
+        for u, v, data in edges:
+            if data.get("type", "dependency") in ORDERING_EDGE_TYPES:
+                manager.schedule.add_edge(u, v)
+        manager.approx_bytes = (sum(_estimate_bytes(data, NODE_OVERHEAD_BYTES) for _, data in nodes) +
+                                sum(_estimate_bytes(data, EDGE_OVERHEAD_BYTES) for _, _, data in edges))
+        manager.revision = max(revision, min_revision)
+        manager._log_floor = manager.revision
+        manager._persisted_version = version
+        return manager
+
+    def _record(self, kind, op, item_id, endpoints=None):
+        self.revision += 1
+        self.changes.append((self.revision, kind, op, item_id))
+        if len(self.changes) > self.max_changes:
+            self._log_floor = self.changes.popleft()[0]
+
+        if self.persistence is not None:
+            if kind == "node":
+                self._dirty_nodes.add(item_id)
+            else:
+                self._dirty_edges[item_id] = endpoints
+            if len(self._dirty_nodes) + len(self._dirty_edges) >= self.persistence.batch_size:
+                self.flush()
+
+    def flush(self):
+        """Writes pending changes to persistence, if any."""
+        if self.persistence is None or not (self._dirty_nodes or self._dirty_edges or self._cleared):
+            return
+        nodes, removed_nodes = [], []
+        for node_id in self._dirty_nodes:
+            if node_id in self.graph:
+                nodes.append((node_id, self.graph.nodes[node_id]))
+            else:
+                removed_nodes.append(node_id)
+        edges, removed_edges = [], []
+        for edge_id, (u, v) in self._dirty_edges.items():
+            data = self.graph.edges[u, v] if self.graph.has_edge(u, v) else None
+            if data is not None and data.get("id") == edge_id:
+                edges.append((edge_id, u, v, data))
+            else:
+                removed_edges.append(edge_id)
+
+        previous, version = self.persistence.write_batch(self.session_id, self.revision, nodes, removed_nodes,
+                                                         edges, removed_edges, cleared=self._cleared)
+        # If someone else wrote in between, our in-memory graph is missing
+        # their changes and has to be reloaded.
+        self._persisted_version = version if previous == self._persisted_version else None
+        self._dirty_nodes = set()
+        self._dirty_edges = {}
+        self._cleared = False
+
+    def is_stale(self):
+        """True if another process has written this session since we last synced."""
+        if self.persistence is None or self._dirty_nodes or self._dirty_edges or self._cleared:
+            return False
+        return self.persistence.get_version(self.session_id) != self._persisted_version
 
-    def add_node(self, node_type, label, description, source="Unknown", status="pending", 
+    def add_node(self, node_type, label, description, source="Unknown", status="pending",
                  agency=None, deadline=None, required_documents=None):
         """
         Adds a node to the graph.
         """
         node_id = str(uuid.uuid4())
-        self.graph.add_node(node_id, 
-                            type=node_type, 
-                            label=label, 
-                            description=description, 
-                            source=source, 
+        self.graph.add_node(node_id,
+                            type=node_type,
+                            label=label,
+                            description=description,
+                            source=source,
                             status=status,
                             agency=agency,
                             deadline=deadline,
                             required_documents=required_documents or [])
+        self.approx_bytes += _estimate_bytes(self.graph.nodes[node_id], NODE_OVERHEAD_BYTES)
+        self.labels.add(node_id, label)
+        self.schedule.set_node(node_id, **node_constraints(self.graph.nodes[node_id]))
+        self.layout.node_added(node_id)
+        self._record("node", "added", node_id)
         return node_id
 
+    def update_node(self, node_id, **attrs):
+        """
+        Updates attributes (label, status, deadline, ...) of an existing node.
+        """
+        if node_id not in self.graph:
+            raise KeyError(node_id)
+        data = self.graph.nodes[node_id]
+        self.approx_bytes -= _estimate_bytes(data, NODE_OVERHEAD_BYTES)
+        data.update(attrs)
+        self.approx_bytes += _estimate_bytes(data, NODE_OVERHEAD_BYTES)
+        if "label" in attrs:
+            self.labels.remove(node_id)
+            self.labels.add(node_id, attrs["label"])
+        if "deadline" in attrs or "duration_days" in attrs:
+            self.schedule.set_node(node_id, **node_constraints(data))
+        self._record("node", "changed", node_id)
+
+    def remove_node(self, node_id):
+        """
+        Removes a node and every edge touching it.
+        """
+        if node_id not in self.graph:
+            raise KeyError(node_id)
+        incident = list(self.graph.in_edges(node_id, data=True)) + list(self.graph.out_edges(node_id, data=True))
+        for u, v, data in incident:
+            self.approx_bytes -= _estimate_bytes(data, EDGE_OVERHEAD_BYTES)
+            self._record("edge", "removed", data.get("id", f"e{u}-{v}"), (u, v))
+        self.approx_bytes -= _estimate_bytes(self.graph.nodes[node_id], NODE_OVERHEAD_BYTES)
+        self.graph.remove_node(node_id)
+        self.labels.remove(node_id)
+        self.schedule.remove_node(node_id)
+        self.layout.node_removed(node_id)
+        self._record("node", "removed", node_id)
+
     def add_edge(self, source_id, target_id, edge_type="dependency", description=""):
         """
         Adds an edge between two nodes.
         """
+        if self.graph.has_edge(source_id, target_id):
+            # DiGraph keeps one edge per pair, so the old one is replaced.
+            old = self.graph.edges[source_id, target_id]
+            self.approx_bytes -= _estimate_bytes(old, EDGE_OVERHEAD_BYTES)
+            self._record("edge", "removed", old.get("id"), (source_id, target_id))
+            self.schedule.remove_edge(source_id, target_id)
         edge_id = str(uuid.uuid4())
-        self.graph.add_edge(source_id, target_id, 
+        self.graph.add_edge(source_id, target_id,
                             id=edge_id,
                             type=edge_type,
                             description=description)
+        self.approx_bytes += _estimate_bytes(self.graph.edges[source_id, target_id], EDGE_OVERHEAD_BYTES)
+        if edge_type in ORDERING_EDGE_TYPES:
+            self.schedule.add_edge(source_id, target_id)
+        self.layout.edge_added(source_id, target_id)
+        self._record("edge", "added", edge_id, (source_id, target_id))
         return edge_id
 
-    def get_graph_data(self):
+    def find_node_by_label(self, label):
+        """
+        Returns the id of an existing node whose label matches `label`
+        (normalized or fuzzily, see label_index.py), or None.
+        """
+        return self.labels.find(label)
+
+    def apply_updates(self, updates, label_to_id=None):
+        """
+        Merges Claude's {"new_nodes": [...], "new_edges": [...]} into the graph.
+        Nodes matching an existing label are reused instead of duplicated, and
+        edges are resolved by label. Returns the list of nodes actually created.
+        Pass the same `label_to_id` dict to apply one answer in several parts.
+        """
+        # Labels from this batch resolve to the node they were merged into
+        label_to_id = {} if label_to_id is None else label_to_id
+        new_nodes_created = []
+
+        for node in updates.get("new_nodes", []):
+            label = node.get('label')
+            if not label:
+                continue
+            existing_id = label_to_id.get(label) or self.find_node_by_label(label)
+            if existing_id:
+                label_to_id[label] = existing_id
+                continue
+
+            label_to_id[label] = self.add_node(
+                node_type=node.get('type', 'action'),
+                label=label,
+                description=node.get('description', ''),
+                source=node.get('source', 'AI Generated'),
+                status=node.get('status', 'pending'),
+                agency=node.get('agency'),
+                deadline=node.get('deadline'),
+                required_documents=node.get('required_documents', [])
+            )
+            new_nodes_created.append(node)
+
+        for edge in updates.get("new_edges", []):
+            source_id = label_to_id.get(edge.get('source_label')) or self.find_node_by_label(edge.get('source_label'))
+            target_id = label_to_id.get(edge.get('target_label')) or self.find_node_by_label(edge.get('target_label'))
+
+            if source_id and target_id and source_id != target_id:
+                self.add_edge(
+                    source_id=source_id,
+                    target_id=target_id,
+                    edge_type=edge.get('type', 'dependency'),
+                    description=edge.get('description', '')
+                )
+
+        return new_nodes_created
+
+    def _get_positions(self, layout):
+        stats = self.layout.stats
+        before = stats["full_layouts"] + stats["layered_layouts"]
+        pos = self.layout.get_positions(self.graph, mode=layout)
+        if stats["full_layouts"] + stats["layered_layouts"] != before:
+            self._relayout_revision[layout] = self.revision
+        return pos
+
+    def _node_payload(self, node_id, data, pos):
+        x, y = pos.get(node_id, (0, 0))
+        return {
+            "id": node_id,
+            "type": data.get("type", "default").lower(), # Use internal type for React Flow
+            "data": {
+                "label": data.get("label", ""),
+                "type": data.get("type", "action"), # Keep internal type in data too
+                "description": data.get("description", ""),
+                "source": data.get("source", ""),
+                "status": data.get("status", ""),
+                "agency": data.get("agency", ""),
+                "deadline": data.get("deadline", ""),
+                "required_documents": data.get("required_documents", [])
+            },
+            "position": {"x": x * 500, "y": y * 500} # Scale up for visibility
+        }
+
+    def _edge_payload(self, u, v, data):
+        return {
+            "id": data.get("id", f"e{u}-{v}"),
+            "source": u,
+            "target": v,
+            "type": "smoothstep", # React Flow edge type
+            "label": data.get("description", ""),
+            "animated": True if data.get("type") == "dependency" else False
+        }
+
+    def get_graph_data(self, layout="spring"):
         """
         Returns the graph data in a format suitable for React Flow.
         Allowed types for React Flow nodes: "document", "action", "agency", "event"
+        `layout` is one of layout_engine.LAYOUT_MODES ("spring" or "layered").
         """
-        nodes = []
-        # Simple layout strategy: 
-        # We could use nx.spring_layout or similar if we want backend positioning,
-        # but often frontend handles layout better (e.g. Elkjs or Dagre). 
-        # For now, we'll just return nodes with a default position and let Frontend handle it or default it.
-        
-        # Using a simple layout for initial positioning to avoid all nodes stacking on 0,0
-        try:
-            pos = nx.spring_layout(self.graph, seed=42)
-        except:
-            pos = {}
-
-        for node_id, data in self.graph.nodes(data=True):
-            x, y = pos.get(node_id, (0, 0))
-            nodes.append({
-                "id": node_id,
-                "type": data.get("type", "default").lower(), # Use internal type for React Flow
-                "data": {
-                    "label": data.get("label", ""),
-                    "type": data.get("type", "action"), # Keep internal type in data too
-                    "description": data.get("description", ""),
-                    "source": data.get("source", ""),
-                    "status": data.get("status", ""),
-                    "agency": data.get("agency", ""),
-                    "deadline": data.get("deadline", ""),
-                    "required_documents": data.get("required_documents", [])
-                },
-                "position": {"x": x * 500, "y": y * 500} # Scale up for visibility
-            })
-
-        edges = []
-        for u, v, data in self.graph.edges(data=True):
-            edges.append({
-                "id": data.get("id", f"e{u}-{v}"),
-                "source": u,
-                "target": v,
-                "type": "smoothstep", # React Flow edge type
-                "label": data.get("description", ""),
-                "animated": True if data.get("type") == "dependency" else False
-            })
-
-        return {"nodes": nodes, "edges": edges}
+        # Positions come from the cached layout engine so that repeated polls
+        # don't rerun the force-directed layout over the whole graph.
+        pos = self._get_positions(layout)
+
+        nodes = [self._node_payload(node_id, data, pos)
+                 for node_id, data in self.graph.nodes(data=True)]
+        edges = [self._edge_payload(u, v, data)
+                 for u, v, data in self.graph.edges(data=True)]
+
+        return {"nodes": nodes, "edges": edges, "revision": self.revision}
+
+    def get_positions(self, layout="spring"):
+        """{node_id: {"x", "y"}} for every node, as placed by `layout`."""
+        return {n: {"x": x * 500, "y": y * 500} for n, (x, y) in self._get_positions(layout).items()}
+
+    def get_changes_since(self, since, layout="spring", positions=True):
+        """
+        Returns only what changed after revision `since`:
+        {"full": False, "revision", "since", "nodes": {"added", "changed", "removed"},
+         "edges": {"added", "removed"}}.
+        If the layout was recomputed as a whole in the meantime, a "positions"
+        map for every node is included as well. With `positions=False` the
+        layout isn't touched at all: node payloads carry no "position" and
+        there is no "positions" map (see get_positions). When `since` has been compacted
+        out of the change log (or is from the future), the full snapshot is
+        returned instead, with "full": True.
+        """
+        if since < self._log_floor or since > self.revision:
+            snapshot = self.get_graph_data(layout=layout)
+            snapshot["full"] = True
+            return snapshot
+
+        node_ops = {}
+        edge_ops = {}
+        for revision, kind, op, item_id in reversed(self.changes):
+            if revision <= since:
+                break
+            ops = node_ops if kind == "node" else edge_ops
+            ops.setdefault(item_id, []).insert(0, op)
+
+        pos = self._get_positions(layout) if positions else {}
+        nodes = {"added": [], "changed": [], "removed": []}
+        for node_id, ops in node_ops.items():
+            existed_before = ops[0] != "added"
+            exists_now = node_id in self.graph
+            if not exists_now:
+                if existed_before:
+                    nodes["removed"].append(node_id)
+                continue
+            payload = self._node_payload(node_id, self.graph.nodes[node_id], pos)
+            if not positions:
+                del payload["position"]
+            nodes["changed" if existed_before else "added"].append(payload)
+
+        edge_index = {data.get("id"): (u, v, data) for u, v, data in self.graph.edges(data=True)} if edge_ops else {}
+        edges = {"added": [], "removed": []}
+        for edge_id, ops in edge_ops.items():
+            existed_before = ops[0] != "added"
+            if edge_id in edge_index:
+                if not existed_before:
+                    edges["added"].append(self._edge_payload(*edge_index[edge_id]))
+            elif existed_before:
+                edges["removed"].append(edge_id)
+
+        delta = {
+            "full": False,
+            "revision": self.revision,
+            "since": since,
+            "nodes": nodes,
+            "edges": edges
+        }
+        if positions and self._relayout_revision.get(layout, 0) > since:
+            delta["positions"] = {n: {"x": x * 500, "y": y * 500} for n, (x, y) in pos.items()}
+        return delta
+
+    def get_schedule(self, anchors=None):
+        """
+        Computed dates for every node reachable from an anchor or a dated
+        deadline (see deadline_scheduler.py), after first setting `anchors`
+        ({name: "YYYY-MM-DD", or None to drop one}). Only what the changes
+        since the last call affect is recomputed.
+        """
+        for name, value in (anchors or {}).items():
+            self.schedule.set_anchor(name, value)
+        return self.schedule.snapshot()
+
+    def get_layout_stats(self):
+        return dict(self.layout.stats)
 
     def clear_graph(self):
         self.graph.clear()
+        self.labels.clear()
+        self.schedule.clear()
+        self.layout.reset()
+        self.approx_bytes = 0
+        # Nothing before a clear can be expressed as a delta any more.
+        self.revision += 1
+        self.changes.clear()
+        self._log_floor = self.revision
+        self._dirty_nodes = set()
+        self._dirty_edges = {}
+        self._cleared = self.persistence is not None
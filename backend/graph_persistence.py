@@ -0,0 +1,127 @@
+import json
+import os
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    revision INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS nodes (
+    session_id TEXT NOT NULL,
+    node_id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (session_id, node_id)
+);
+CREATE TABLE IF NOT EXISTS edges (
+    session_id TEXT NOT NULL,
+    edge_id TEXT NOT NULL,
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (session_id, edge_id)
+);
+"""
+
+
+class SQLitePersistence:
+    """
+    Stores session graphs in a local SQLite file (WAL mode) so they survive
+    restarts and can be shared by several worker processes.
+
+    Each session row carries a `version` that is bumped on every write.
+    GraphManager remembers the version it last saw, so a worker can tell when
+    another process has written the same session and reload it.
+    """
+
+    def __init__(self, path, batch_size=500):
+        self.path = path
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+
+    @classmethod
+    def from_env(cls):
+        """Returns a persistence backend if LEGOL_DB_PATH is set, otherwise None."""
+        path = os.getenv("LEGOL_DB_PATH")
+        if not path:
+            return None
+        return cls(path, batch_size=int(os.getenv("LEGOL_DB_BATCH_SIZE", 500)))
+
+    def _connection(self):
+        # sqlite3 connections can't be shared across threads, so keep one per thread.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self, mode="DEFERRED"):
+        return _Transaction(self._connection(), mode)
+
+    def get_version(self, session_id):
+        row = self._connection().execute("SELECT version FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    def load(self, session_id):
+        """Returns (version, revision, nodes, edges) for a session."""
+        with self._transaction() as conn:
+            row = conn.execute("SELECT version, revision FROM sessions WHERE session_id = ?",
+                               (session_id,)).fetchone()
+            nodes = conn.execute("SELECT node_id, data FROM nodes WHERE session_id = ? ORDER BY rowid",
+                                 (session_id,)).fetchall()
+            edges = conn.execute("SELECT source, target, data FROM edges WHERE session_id = ? ORDER BY rowid",
+                                 (session_id,)).fetchall()
+        version, revision = row if row else (0, 0)
+        nodes = [(node_id, json.loads(data)) for node_id, data in nodes]
+        edges = [(u, v, json.loads(data)) for u, v, data in edges]
+        return version, revision, nodes, edges
+
+    def write_batch(self, session_id, revision, nodes, removed_nodes, edges, removed_edges, cleared=False):
+        """
+        Applies one batch of changes atomically.
+        `nodes` is [(node_id, data)], `edges` is [(edge_id, source, target, data)].
+        Returns (previous_version, new_version).
+        """
+        with self._transaction("IMMEDIATE") as conn:
+            conn.execute("INSERT OR IGNORE INTO sessions (session_id) VALUES (?)", (session_id,))
+            previous = conn.execute("SELECT version FROM sessions WHERE session_id = ?",
+                                    (session_id,)).fetchone()[0]
+            if cleared:
+                conn.execute("DELETE FROM nodes WHERE session_id = ?", (session_id,))
+                conn.execute("DELETE FROM edges WHERE session_id = ?", (session_id,))
+            conn.executemany("DELETE FROM edges WHERE session_id = ? AND edge_id = ?",
+                             [(session_id, edge_id) for edge_id in removed_edges])
+            conn.executemany("DELETE FROM nodes WHERE session_id = ? AND node_id = ?",
+                             [(session_id, node_id) for node_id in removed_nodes])
+            conn.executemany(
+                "INSERT INTO nodes (session_id, node_id, data) VALUES (?, ?, ?) "
+                "ON CONFLICT (session_id, node_id) DO UPDATE SET data = excluded.data",
+                [(session_id, node_id, json.dumps(data)) for node_id, data in nodes])
+            conn.executemany(
+                "INSERT INTO edges (session_id, edge_id, source, target, data) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (session_id, edge_id) DO UPDATE SET data = excluded.data",
+                [(session_id, edge_id, u, v, json.dumps(data)) for edge_id, u, v, data in edges])
+            conn.execute("UPDATE sessions SET version = version + 1, revision = MAX(revision, ?) "
+                         "WHERE session_id = ?", (revision, session_id))
+        return previous, previous + 1
+
+
+class _Transaction:
+    """Wraps a connection in BEGIN ... COMMIT/ROLLBACK."""
+
+    def __init__(self, conn, mode):
+        self.conn = conn
+        self.mode = mode
+
+    def __enter__(self):
+        self.conn.execute(f"BEGIN {self.mode}")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
@@ -0,0 +1,40 @@
+from label_index import normalize_label
+
+SUMMARY_DESCRIPTION_CHARS = 80
+
+
+def summarize_timeline_items(items):
+    """One short line per existing item, for the incremental prompt."""
+    lines = []
+    for item in items:
+        description = (item.get("description") or "")[:SUMMARY_DESCRIPTION_CHARS]
+        lines.append(f"- {item.get('title', '')}: {description}")
+    return "\n".join(lines) or "(none yet)"
+
+
+def merge_timeline_items(existing, new_items):
+    """
+    Merges newly extracted items into `existing`. An item whose normalized
+    title matches an existing one updates it in place: the newer description
+    wins and related documents are unioned. Matching is exact rather than
+    fuzzy, since "File I-130" and "File I-131" are different steps.
+    """
+    merged = [dict(item) for item in existing]
+    index = {normalize_label(item.get("title")): position for position, item in enumerate(merged)}
+
+    for item in new_items:
+        title = item.get("title")
+        if not title:
+            continue
+        position = index.get(normalize_label(title))
+        if position is None:
+            index[normalize_label(title)] = len(merged)
+            merged.append(dict(item))
+            continue
+        target = merged[position]
+        if item.get("description"):
+            target["description"] = item["description"]
+        documents = list(target.get("relatedDocuments") or [])
+        documents += [d for d in item.get("relatedDocuments") or [] if d not in documents]
+        target["relatedDocuments"] = documents
+    return merged
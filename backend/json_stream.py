@@ -0,0 +1,88 @@
+import json
+
+
+class JsonItemStream:
+    """
+    Incremental parser for Claude's JSON answers of the form
+    {"new_nodes": [{...}, ...], "new_edges": [...]} (or {"items": [...]}).
+
+    feed() takes raw text as it streams in and returns (key, object) for
+    every element of a top-level array whose closing brace has arrived, so
+    callers can act on each node or edge without waiting for the rest.
+    Anything before the first "{" (prose, a ```json fence) and after the
+    root object closes is ignored. Output cut off mid-object loses only that
+    object.
+    """
+
+    def __init__(self):
+        self.stack = []  # open containers, "{" or "["
+        self.started = False
+        self.finished = False
+        self.in_string = False
+        self.escape = False
+        self.key_chars = None  # characters of a string directly inside the root object
+        self.last_key = None
+        self.array_key = None  # root key of the array being read
+        self.item_chars = None  # characters of the array element being read
+
+    def feed(self, chunk):
+        items = []
+        for ch in chunk:
+            if self.finished:
+                break
+            if not self.started:
+                if ch == "{":
+                    self.started = True
+                    self.stack.append(ch)
+                continue
+            if self.item_chars is not None:
+                self.item_chars.append(ch)
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    if self.key_chars is not None:
+                        self.last_key = "".join(self.key_chars)
+                        self.key_chars = None
+                    continue
+                if self.key_chars is not None:
+                    self.key_chars.append(ch)
+                continue
+
+            if ch == '"':
+                self.in_string = True
+                if len(self.stack) == 1:
+                    self.key_chars = []
+            elif ch in "{[":
+                if len(self.stack) == 1 and ch == "[":
+                    self.array_key = self.last_key
+                elif len(self.stack) == 2 and self.stack[-1] == "[" and ch == "{":
+                    self.item_chars = [ch]
+                self.stack.append(ch)
+            elif ch in "}]":
+                self.stack.pop()
+                if len(self.stack) == 2 and self.item_chars is not None:
+                    text = "".join(self.item_chars)
+                    self.item_chars = None
+                    try:
+                        items.append((self.array_key, json.loads(text)))
+                    except ValueError:
+                        pass
+                if not self.stack:
+                    self.finished = True
+        return items
+
+
+def salvage_json_items(text):
+    """
+    Recovers the complete array elements from JSON output that does not
+    parse as a whole (e.g. cut off at max_tokens): {key: [objects]}.
+    """
+    salvaged = {}
+    for key, item in JsonItemStream().feed(text):
+        salvaged.setdefault(key, []).append(item)
+    return salvaged
@@ -0,0 +1,109 @@
+import re
+from collections import Counter
+
+# Words that don't distinguish one node from another ("DS-160 Form" is the
+# same node as "DS-160").
+GENERIC_TOKENS = {"a", "an", "the", "of", "for", "to", "form", "application", "document", "process", "step"}
+
+
+def normalize_label(label):
+    """Lowercases, strips punctuation and generic words: "DS-160 Form" -> "ds 160"."""
+    tokens = re.findall(r"[a-z0-9]+", (label or "").lower())
+    specific = [t for t in tokens if t not in GENERIC_TOKENS]
+    return " ".join(specific or tokens)
+
+
+def identifiers(key):
+    """
+    Form and visa ids in a normalized label, each digit-bearing token with
+    the short letter prefix before it: "h 2b visa petition" -> {"h 2b"}.
+    """
+    tokens = key.split()
+    found = set()
+    for position, token in enumerate(tokens):
+        if any(c.isdigit() for c in token):
+            before = tokens[position - 1] if position else ""
+            prefix = before if before.isalpha() and len(before) <= 3 else ""
+            found.add(f"{prefix} {token}".strip())
+    return frozenset(found)
+
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class LabelIndex:
+    """
+    Maps node labels to node ids for deduplication without a graph snapshot.
+
+    Lookups first try the normalized label (O(1)), then fall back to trigram
+    Jaccard similarity over an inverted trigram index, so only nodes sharing
+    at least one trigram with the candidate are ever compared. Labels only
+    match fuzzily when they carry the same form and visa ids (identifiers),
+    so "I-765" and "I-766" or "F-1 Visa Interview" and "J-1 Visa Interview"
+    stay separate however similar the rest is.
+    """
+
+    def __init__(self, threshold=0.7):
+        self.threshold = threshold
+        self.by_key = {}  # normalized label -> [node_id, ...], oldest first
+        self.keys = {}  # node_id -> normalized label
+        self.gram_counts = {}  # node_id -> number of trigrams in its key
+        self.idents = {}  # node_id -> form/visa ids in its key
+        self.postings = {}  # trigram -> set of node_ids
+
+    def add(self, node_id, label):
+        key = normalize_label(label)
+        grams = trigrams(key)
+        self.keys[node_id] = key
+        self.gram_counts[node_id] = len(grams)
+        self.idents[node_id] = identifiers(key)
+        self.by_key.setdefault(key, []).append(node_id)
+        for gram in grams:
+            self.postings.setdefault(gram, set()).add(node_id)
+
+    def remove(self, node_id):
+        key = self.keys.pop(node_id, None)
+        if key is None:
+            return
+        del self.gram_counts[node_id]
+        del self.idents[node_id]
+        ids = self.by_key[key]
+        ids.remove(node_id)
+        if not ids:
+            del self.by_key[key]
+        for gram in trigrams(key):
+            ids = self.postings.get(gram)
+            if ids is not None:
+                ids.discard(node_id)
+                if not ids:
+                    del self.postings[gram]
+
+    def clear(self):
+        self.by_key.clear()
+        self.keys.clear()
+        self.gram_counts.clear()
+        self.idents.clear()
+        self.postings.clear()
+
+    def find(self, label):
+        """Returns the id of an existing node matching `label`, or None."""
+        key = normalize_label(label)
+        if key in self.by_key:
+            return self.by_key[key][0]
+
+        idents = identifiers(key)
+        grams = trigrams(key)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+
+        best_id, best_score = None, self.threshold
+        for node_id, overlap in shared.items():
+            if self.idents[node_id] != idents:
+                continue
+            score = overlap / (len(grams) + self.gram_counts[node_id] - overlap)
+            if score >= best_score:
+                best_id, best_score = node_id, score
+        return best_id
@@ -0,0 +1,195 @@
+import random
+import networkx as nx
+
+LAYOUT_MODES = ("spring", "layered")
+
+# Edge types that imply an ordering between steps. "conflict" edges are
+# ignored when ranking so they don't create cycles in the layered layout.
+ORDERING_EDGE_TYPES = ("dependency", "timeline")
+
+
+def layered_layout(graph, layer_spacing=0.35, node_spacing=0.5):
+    """
+    Sugiyama-style layered layout in O(V + E) (plus a per-layer sort).
+
+    Nodes are ranked by longest path along dependency/timeline edges, so every
+    step sits below the steps it depends on. Cycles are broken greedily: when
+    no node is free, the next remaining node is ranked from the predecessors
+    already placed. Within a layer, nodes are ordered by the barycenter of
+    their predecessors to cut down on edge crossings.
+    """
+    successors = {n: [] for n in graph}
+    predecessors = {n: [] for n in graph}
+    indegree = dict.fromkeys(graph, 0)
+    for u, v, data in graph.edges(data=True):
+        if u == v or data.get("type", "dependency") not in ORDERING_EDGE_TYPES:
+            continue
+        successors[u].append(v)
+        predecessors[v].append(u)
+        indegree[v] += 1
+
+    rank = dict.fromkeys(graph, 0)
+    placed = set()
+    order = []
+    queue = [n for n in graph if indegree[n] == 0]
+    remaining = iter(list(graph))
+    while len(order) < len(rank):
+        if not queue:
+            # Only cycles are left: force the next unplaced node in.
+            node = next(n for n in remaining if n not in placed)
+            queue.append(node)
+        node = queue.pop()
+        if node in placed:
+            continue
+        placed.add(node)
+        order.append(node)
+        for succ in successors[node]:
+            if succ in placed:
+                continue
+            rank[succ] = max(rank[succ], rank[node] + 1)
+            indegree[succ] -= 1
+            if indegree[succ] == 0:
+                queue.append(succ)
+
+    layers = {}
+    for node in order:
+        layers.setdefault(rank[node], []).append(node)
+
+    positions = {}
+    slot = {}
+    for depth in sorted(layers):
+        layer = layers[depth]
+        def barycenter(n):
+            placed_preds = [slot[p] for p in predecessors[n] if p in slot]
+            return sum(placed_preds) / len(placed_preds) if placed_preds else float("inf")
+        layer.sort(key=barycenter)
+        offset = (len(layer) - 1) / 2
+        for i, node in enumerate(layer):
+            slot[node] = i - offset
+            positions[node] = ((i - offset) * node_spacing, depth * layer_spacing)
+    return positions
+
+
+class LayoutEngine:
+    """
+    Caches node positions between calls to GraphManager.get_graph_data.
+
+    Positions are kept per node. Newly added nodes are placed incrementally
+    (warm-started next to their neighbors, existing nodes held fixed), and the
+    whole graph is only laid out again once the topology has drifted by more
+    than `relayout_ratio` since the last full layout.
+
+    The "layered" mode is cheap enough to recompute on any change, so it is
+    simply cached until the graph changes.
+    """
+
+    def __init__(self, relayout_ratio=0.5, incremental_iterations=15, seed=42):
+        self.relayout_ratio = relayout_ratio
+        self.incremental_iterations = incremental_iterations
+        self.seed = seed
+        self.positions = {}
+        self.stats = {"hits": 0, "misses": 0, "full_layouts": 0, "incremental_layouts": 0,
+                      "layered_layouts": 0}
+        self._new_nodes = []
+        self._dirty = False
+        self._changes_since_full = 0
+        self._nodes_at_full = 0
+        self._needs_full = True
+        self._layered_positions = None
+
+    def node_added(self, node_id):
+        self._layered_positions = None
+        self._new_nodes.append(node_id)
+        self._changes_since_full += 1
+        self._dirty = True
+
+    def edge_added(self, source_id, target_id):
+        self._layered_positions = None
+        self._changes_since_full += 1
+        self._dirty = True
+
+    def node_removed(self, node_id):
+        self._layered_positions = None
+        self.positions.pop(node_id, None)
+        if node_id in self._new_nodes:
+            self._new_nodes.remove(node_id)
+        self._changes_since_full += 1
+        self._dirty = True
+
+    def reset(self):
+        """Drops all cached positions (e.g. when the graph is cleared)."""
+        self.positions = {}
+        self._new_nodes = []
+        self._changes_since_full = 0
+        self._nodes_at_full = 0
+        self._needs_full = True
+        self._dirty = True
+        self._layered_positions = None
+
+    def get_positions(self, graph, mode="spring"):
+        """
+        Returns a {node_id: (x, y)} mapping for every node in the graph,
+        recomputing as little as possible.
+        """
+        if mode not in LAYOUT_MODES:
+            raise ValueError(f"Unknown layout mode: {mode}")
+        if mode == "layered":
+            return self._get_layered_positions(graph)
+
+        if not self._dirty:
+            self.stats["hits"] += 1
+            return self.positions
+
+        self.stats["misses"] += 1
+        threshold = self.relayout_ratio * max(self._nodes_at_full, 1)
+        try:
+            if self._needs_full or self._changes_since_full > threshold:
+                self._full_layout(graph)
+            elif self._new_nodes:
+                self._incremental_layout(graph)
+        except Exception as e:
+            print(f"Layout failed, falling back to cached positions: {e}")
+
+        self._new_nodes = []
+        self._dirty = False
+        return self.positions
+
+    def _get_layered_positions(self, graph):
+        if self._layered_positions is not None:
+            self.stats["hits"] += 1
+            return self._layered_positions
+        self.stats["misses"] += 1
+        self._layered_positions = layered_layout(graph)
+        self.stats["layered_layouts"] += 1
+        return self._layered_positions
+
+    def _full_layout(self, graph):
+        pos = nx.spring_layout(graph, seed=self.seed) if graph.number_of_nodes() > 0 else {}
+        self.positions = {n: (float(x), float(y)) for n, (x, y) in pos.items()}
+        self._nodes_at_full = graph.number_of_nodes()
+        self._changes_since_full = 0
+        self._needs_full = False
+        self.stats["full_layouts"] += 1
+
+    def _incremental_layout(self, graph):
+        rng = random.Random(self.seed + len(self.positions))
+        initial = dict(self.positions)
+        for node_id in self._new_nodes:
+            if node_id not in graph:
+                continue
+            placed = [initial[n] for n in nx.all_neighbors(graph, node_id) if n in initial]
+            if placed:
+                cx = sum(p[0] for p in placed) / len(placed)
+                cy = sum(p[1] for p in placed) / len(placed)
+            else:
+                cx, cy = 0.0, 0.0
+            initial[node_id] = (cx + rng.uniform(-0.1, 0.1), cy + rng.uniform(-0.1, 0.1))
+
+        fixed = [n for n in self.positions if n in graph]
+        if fixed:
+            pos = nx.spring_layout(graph, pos=initial, fixed=fixed,
+                                   iterations=self.incremental_iterations, seed=self.seed)
+        else:
+            pos = initial
+        self.positions = {n: (float(x), float(y)) for n, (x, y) in pos.items()}
+        self.stats["incremental_layouts"] += 1
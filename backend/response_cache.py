@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_BYPASS_HEADER = "X-Cache-Bypass"
+
+DISK_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    latency_ms REAL NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS {table}_last_used ON {table} (last_used);
+"""
+
+
+def cache_bypassed(headers):
+    """True if the request asks to skip cached LLM responses (e.g. `X-Cache-Bypass: 1`)."""
+    return (headers.get(CACHE_BYPASS_HEADER) or "").strip().lower() in ("1", "true", "yes")
+
+
+def request_key(request):
+    """Content hash of a messages.create request: model, system prompt, messages and parameters."""
+    canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Caches the text of deterministic (temperature 0) Claude responses, keyed
+    by request_key.
+
+    The in-memory tier is an LRU bounded by entry count and total bytes. If
+    `path` is set (LEGOL_LLM_CACHE_PATH), entries are also written to a SQLite
+    file shared by restarts and worker processes, trimmed to
+    `max_disk_entries` least recently used. Entries older than `ttl_seconds`
+    are ignored in both tiers.
+
+    Limits default to LEGOL_LLM_CACHE_ENTRIES, LEGOL_LLM_CACHE_MAX_BYTES,
+    LEGOL_LLM_CACHE_TTL_SECONDS and LEGOL_LLM_CACHE_DISK_ENTRIES. Subclasses
+    caching something else set their own ENV_PREFIX and TABLE.
+    """
+
+    ENV_PREFIX = "LEGOL_LLM_CACHE"
+    TABLE = "llm_cache"
+
+    def __init__(self, max_entries=None, max_bytes=None, ttl_seconds=None, path=None, max_disk_entries=None):
+        env = self.ENV_PREFIX
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv(f"{env}_ENTRIES", 512))
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv(f"{env}_MAX_BYTES", 32 * 1024 * 1024))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv(f"{env}_TTL_SECONDS", 86400))
+        self.path = path if path is not None else os.getenv(f"{env}_PATH")
+        self.max_disk_entries = (max_disk_entries if max_disk_entries is not None
+                                 else int(os.getenv(f"{env}_DISK_ENTRIES", 10000)))
+        self.entries = OrderedDict()  # key -> (text, latency_ms, created_at)
+        self.bytes = 0
+        self.stats = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0,
+                      "evictions": 0, "saved_ms": 0.0}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if self.path:
+            self._connection().executescript(DISK_SCHEMA.format(table=self.TABLE))
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _expired(self, created_at, now):
+        return bool(self.ttl_seconds) and now - created_at > self.ttl_seconds
+
+    def get(self, key):
+        """Returns the cached response text for `key`, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and self._expired(entry[2], now):
+                self._drop(key)
+                entry = None
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.stats["memory_hits"] += 1
+        if entry is None and self.path:
+            entry = self._disk_get(key, now)
+            if entry is not None:
+                with self._lock:
+                    self.stats["disk_hits"] += 1
+                    self._remember(key, entry)
+        with self._lock:
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            self.stats["saved_ms"] += entry[1]
+        return entry[0]
+
+    def put(self, key, text, latency_ms):
+        """Stores a response; `latency_ms` is what a later hit saves."""
+        entry = (text, latency_ms, time.time())
+        with self._lock:
+            self._remember(key, entry)
+        if self.path:
+            conn = self._connection()
+            conn.execute(f"INSERT OR REPLACE INTO {self.TABLE} (key, value, latency_ms, created_at, last_used) "
+                         "VALUES (?, ?, ?, ?, ?)", (key, text, latency_ms, entry[2], entry[2]))
+            conn.execute(f"DELETE FROM {self.TABLE} WHERE key IN (SELECT key FROM {self.TABLE} "
+                         "ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_disk_entries,))
+
+    def record_bypass(self):
+        with self._lock:
+            self.stats["bypassed"] += 1
+
+    def _remember(self, key, entry):
+        self._drop(key)
+        self.entries[key] = entry
+        self.bytes += len(entry[0])
+        while self.entries and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+            self._drop(next(iter(self.entries)))
+            self.stats["evictions"] += 1
+
+    def _drop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= len(entry[0])
+
+    def _disk_get(self, key, now):
+        conn = self._connection()
+        row = conn.execute(f"SELECT value, latency_ms, created_at FROM {self.TABLE} WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if self._expired(row[2], now):
+            conn.execute(f"DELETE FROM {self.TABLE} WHERE key = ?", (key,))
+            return None
+        conn.execute(f"UPDATE {self.TABLE} SET last_used = ? WHERE key = ?", (now, key))
+        return row
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self.entries)
+            stats["bytes"] = self.bytes
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0
+        stats["saved_ms"] = round(stats["saved_ms"], 1)
+        return stats
@@ -0,0 +1,210 @@
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+import numpy as np
+from context_serializer import estimate_tokens
+from session_store import DEFAULT_SESSION
+
+RETRIEVAL_CHUNK_CHARS = int(os.getenv("LEGOL_RETRIEVAL_CHUNK_CHARS", 800))
+RETRIEVAL_TOP_K = int(os.getenv("LEGOL_RETRIEVAL_TOP_K", 12))
+
+_WORD = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+
+
+def tokenize(text):
+    """Lower-cased words; hyphenated form names like I-20 stay one token."""
+    return _WORD.findall((text or "").lower())
+
+
+def split_text(text, size):
+    """Splits text into pieces of at most `size` characters, preferring line and word breaks."""
+    pieces = []
+    text = (text or "").strip()
+    while len(text) > size:
+        cut = text.rfind("\n", 0, size)
+        if cut < size // 2:
+            cut = text.rfind(" ", 0, size)
+        if cut < size // 2:
+            cut = size
+        pieces.append(text[:cut].strip())
+        text = text[cut:].strip()
+    if text:
+        pieces.append(text)
+    return pieces
+
+
+class BM25Index:
+    """
+    In-memory inverted index over text chunks, scored with BM25.
+
+    Sources (a document, an inline file) are added incrementally: add()
+    appends their chunks and postings, and the NumPy arrays a query term
+    needs are rebuilt only for terms whose postings changed since the last
+    search. Scoring a query is one vectorized pass per query term over that
+    term's postings.
+    """
+
+    def __init__(self, chunk_chars=None, k1=1.5, b=0.75):
+        self.chunk_chars = chunk_chars or RETRIEVAL_CHUNK_CHARS
+        self.k1 = k1
+        self.b = b
+        self.chunks = []  # chunk id -> (source, page, text)
+        self.lengths = []  # chunk id -> number of terms
+        self.postings = {}  # term -> ([chunk ids], [term frequencies])
+        self.sources = OrderedDict()  # source -> [chunk ids], in the order added
+        self._arrays = {}  # term -> (chunk id array, tf array), dropped when the term gets new postings
+        self._norm = None  # BM25 length normalization per chunk, dropped on add()
+        self._lock = threading.Lock()
+
+    def __contains__(self, source):
+        return source in self.sources
+
+    def add(self, source, sections):
+        """
+        Indexes `sections` ([(page, text)]) under `source`, split into chunks
+        of about chunk_chars. A source already in the index is skipped.
+        Returns the number of chunks added.
+        """
+        chunks = []
+        for page, text in sections:
+            for piece in split_text(text, self.chunk_chars):
+                chunks.append((page, piece, Counter(tokenize(piece))))
+        with self._lock:
+            if source in self.sources:
+                return 0
+            ids = []
+            for page, piece, terms in chunks:
+                chunk_id = len(self.chunks)
+                self.chunks.append((source, page, piece))
+                self.lengths.append(sum(terms.values()))
+                for term, count in terms.items():
+                    chunk_ids, frequencies = self.postings.setdefault(term, ([], []))
+                    chunk_ids.append(chunk_id)
+                    frequencies.append(count)
+                    self._arrays.pop(term, None)
+                ids.append(chunk_id)
+            self.sources[source] = ids
+            self._norm = None
+        return len(ids)
+
+    def _term_arrays(self, term):
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            chunk_ids, frequencies = self.postings[term]
+            arrays = (np.array(chunk_ids, dtype=np.int64), np.array(frequencies, dtype=np.float32))
+            self._arrays[term] = arrays
+        return arrays
+
+    def scores(self, query, sources=None):
+        """BM25 score of every chunk for `query` (a float32 array indexed by chunk id)."""
+        with self._lock:
+            count = len(self.chunks)
+            scores = np.zeros(count, dtype=np.float32)
+            if not count:
+                return scores
+            if self._norm is None:
+                lengths = np.array(self.lengths, dtype=np.float32)
+                self._norm = self.k1 * (1 - self.b + self.b * lengths / max(lengths.mean(), 1.0))
+            norm = self._norm
+            for term in set(tokenize(query)):
+                if term not in self.postings:
+                    continue
+                chunk_ids, frequencies = self._term_arrays(term)
+                idf = np.log(1 + (count - len(chunk_ids) + 0.5) / (len(chunk_ids) + 0.5))
+                scores[chunk_ids] += idf * frequencies * (self.k1 + 1) / (frequencies + norm[chunk_ids])
+        if sources is not None:
+            mask = np.zeros(count, dtype=bool)
+            for source in sources:
+                mask[self.sources.get(source, [])] = True
+            scores[~mask] = 0
+        return scores
+
+    def search(self, query, top_k=None, token_budget=None, sources=None):
+        """
+        The best-scoring chunks for `query`, best first, as
+        [(source, page, text)]: at most `top_k`, and no more than
+        `token_budget` tokens in total (a chunk that doesn't fit is skipped
+        in favor of smaller ones further down). Only chunks of `sources` are
+        considered if given. Empty if no query term occurs in the index.
+        """
+        top_k = top_k or RETRIEVAL_TOP_K
+        scores = self.scores(query, sources)
+        matched = int(np.count_nonzero(scores > 0))
+        if not matched:
+            return []
+        # Candidates beyond top_k are kept so skipped chunks can be replaced
+        candidates = min(matched, top_k * 4)
+        best = np.argpartition(-scores, candidates - 1)[:candidates]
+        best = best[np.argsort(-scores[best], kind="stable")]
+
+        hits, used = [], 0
+        for chunk_id in best.tolist():
+            source, page, text = self.chunks[chunk_id]
+            cost = estimate_tokens(text)
+            if token_budget is not None and used + cost > token_budget:
+                continue
+            hits.append((source, page, text))
+            used += cost
+            if len(hits) == top_k:
+                break
+        return hits
+
+    def head(self, sources, token_budget=None):
+        """
+        Leading chunks of `sources` for a query nothing matched: one chunk
+        from each source in turn, in the given order, until the budget is spent.
+        """
+        with self._lock:
+            queues = [list(self.sources.get(source, [])) for source in sources]
+        hits, used = [], 0
+        while any(queues):
+            for queue in queues:
+                if not queue:
+                    continue
+                source, page, text = self.chunks[queue.pop(0)]
+                cost = estimate_tokens(text)
+                if token_budget is not None and used + cost > token_budget:
+                    return hits
+                hits.append((source, page, text))
+                used += cost
+        return hits
+
+    def metrics(self):
+        with self._lock:
+            return {"sources": len(self.sources), "chunks": len(self.chunks), "terms": len(self.postings)}
+
+
+class SessionIndexes:
+    """
+    One BM25Index per chat session over the documents it has uploaded,
+    LRU-bounded to `max_sessions` (LEGOL_RETRIEVAL_SESSIONS). The shared
+    default session gets a fresh index per request.
+    """
+
+    def __init__(self, max_sessions=None):
+        self.max_sessions = max_sessions if max_sessions is not None else int(os.getenv("LEGOL_RETRIEVAL_SESSIONS", 256))
+        self.indexes = OrderedDict()  # session_id -> BM25Index
+        self.stats = {"sources_indexed": 0, "chunks_indexed": 0, "searches": 0, "fallbacks": 0}
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        if session_id in (None, DEFAULT_SESSION):
+            return BM25Index()
+        with self._lock:
+            index = self.indexes.pop(session_id, None) or BM25Index()
+            self.indexes[session_id] = index
+            while len(self.indexes) > self.max_sessions:
+                self.indexes.popitem(last=False)
+            return index
+
+    def record(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["sessions"] = len(self.indexes)
+            stats["chunks"] = sum(len(index.chunks) for index in self.indexes.values())
+        return stats
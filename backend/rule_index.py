@@ -0,0 +1,227 @@
+import threading
+from bisect import bisect_left, bisect_right
+from collections import Counter, OrderedDict, deque
+from typing import Any, Dict, List, Tuple
+
+EQ, GT, LT, PRESENT = "eq", "gt", "lt", "present"
+
+
+def compile_condition(condition: Dict) -> List[Tuple[str, str, Any]]:
+    """
+    Splits a rule condition into (key, op, value) constraints, reading it
+    the way RulesEngine.matches_condition does: str/int/bool values are
+    equality tests, {"gt": x, "lt": y} bounds are comparisons, and anything
+    else only requires the key to be present.
+    """
+    constraints = []
+    for key, value in (condition or {}).items():
+        if isinstance(value, (str, int, bool)):
+            constraints.append((key, EQ, value))
+        elif isinstance(value, dict) and ("gt" in value or "lt" in value):
+            if "gt" in value:
+                constraints.append((key, GT, value["gt"]))
+            if "lt" in value:
+                constraints.append((key, LT, value["lt"]))
+        else:
+            constraints.append((key, PRESENT, None))
+    return constraints
+
+
+def satisfies(constraints: List[Tuple[str, str, Any]], facts: Dict) -> bool:
+    """True if the facts meet every compiled constraint. Values that can't be compared don't match."""
+    for key, op, value in constraints:
+        if key not in facts:
+            return False
+        if op == EQ:
+            if facts[key] != value:
+                return False
+        elif op != PRESENT:
+            try:
+                if not (facts[key] > value if op == GT else facts[key] < value):
+                    return False
+            except TypeError:
+                return False
+    return True
+
+
+class ConditionIndex:
+    """
+    Discrimination index over rule conditions, compiled once when rules load.
+
+    Each rule is filed under one anchor constraint: its most selective
+    equality test (the smallest key/value bucket), else a gt/lt bound, else
+    a key-presence test. Equality anchors go in hash buckets per key, bounds
+    in sorted threshold lists per key searched with bisect. Matching looks
+    up only the keys present in the facts to collect candidate rules, and
+    checks just those against their full compiled conditions.
+    """
+
+    def __init__(self, rules: List[Dict]):
+        self.rules = rules
+        self.constraints = [compile_condition(rule.get("condition")) for rule in rules]
+        self.always: List[int] = []  # rules with an empty condition
+        self.equality: Dict[str, Dict[Any, List[int]]] = {}
+        self.presence: Dict[str, List[int]] = {}
+        greater: Dict[str, List] = {}
+        less: Dict[str, List] = {}
+
+        bucket_sizes = Counter((key, value) for constraints in self.constraints
+                               for key, op, value in constraints if op == EQ)
+        for position, constraints in enumerate(self.constraints):
+            if not constraints:
+                self.always.append(position)
+                continue
+            equalities = [(bucket_sizes[key, value], key, value) for key, op, value in constraints if op == EQ]
+            if equalities:
+                _, key, value = min(equalities, key=lambda entry: entry[0])
+                self.equality.setdefault(key, {}).setdefault(value, []).append(position)
+                continue
+            key, op, value = next((c for c in constraints if c[1] in (GT, LT)), constraints[0])
+            if op == GT:
+                greater.setdefault(key, []).append((value, position))
+            elif op == LT:
+                less.setdefault(key, []).append((value, position))
+            else:
+                self.presence.setdefault(key, []).append(position)
+
+        # key -> (sorted thresholds, rule positions in the same order)
+        self.greater = {key: self._sorted(entries) for key, entries in greater.items()}
+        self.less = {key: self._sorted(entries) for key, entries in less.items()}
+
+    @staticmethod
+    def _sorted(entries):
+        entries.sort(key=lambda entry: entry[0])
+        return [threshold for threshold, _ in entries], [position for _, position in entries]
+
+    def candidates(self, facts: Dict) -> List[int]:
+        """Positions of the rules whose anchor constraint the facts meet."""
+        found = list(self.always)
+        for key, fact_value in facts.items():
+            bucket = self.equality.get(key)
+            if bucket:
+                try:
+                    found.extend(bucket.get(fact_value, ()))
+                except TypeError:
+                    pass  # unhashable fact values equal no rule value
+            found.extend(self.presence.get(key, ()))
+            try:
+                if key in self.greater:
+                    # fact_value > gt for every threshold left of the insertion point
+                    thresholds, positions = self.greater[key]
+                    found.extend(positions[:bisect_left(thresholds, fact_value)])
+                if key in self.less:
+                    # fact_value < lt for every threshold right of the insertion point
+                    thresholds, positions = self.less[key]
+                    found.extend(positions[bisect_right(thresholds, fact_value):])
+            except TypeError:
+                pass  # values that can't be compared with the thresholds match none of them
+        return found
+
+    def match(self, facts: Dict) -> List[Dict]:
+        """The rules whose conditions the facts satisfy, in rule order."""
+        matched = [position for position in self.candidates(facts) if satisfies(self.constraints[position], facts)]
+        return [self.rules[position] for position in sorted(matched)]
+
+
+class RuleGraph:
+    """
+    The rules' depends_on DAG, compiled once when rules load: an id -> rule
+    index, each rule's dependency ids, and a topological order (dependencies
+    first). Rules on a dependency cycle, or depending on one, have no place
+    in that order and are listed in `cyclic` instead.
+
+    The dependency closure of a rule is walked iteratively the first time it
+    is asked for and kept as a replayable list of node and edge events, so
+    later requests for the same rule don't walk the DAG again. Kept closures
+    are LRU-bounded to `max_events` events in total.
+    """
+
+    def __init__(self, rules: List[Dict], max_events: int = 500000):
+        self.by_id: Dict[str, Dict] = {}
+        for rule in rules:
+            self.by_id.setdefault(rule["id"], rule)
+        self.depends_on = {rule_id: list(rule.get("depends_on", [])) for rule_id, rule in self.by_id.items()}
+        self.max_events = max_events
+        self.closures: "OrderedDict[str, List[Tuple]]" = OrderedDict()
+        self.events = 0
+        self._lock = threading.Lock()
+
+        # Kahn's algorithm over the rules' known dependencies
+        dependents: Dict[str, List[str]] = {rule_id: [] for rule_id in self.by_id}
+        pending = {}
+        for rule_id, deps in self.depends_on.items():
+            known = [dep for dep in set(deps) if dep in self.by_id]
+            pending[rule_id] = len(known)
+            for dep in known:
+                dependents[dep].append(rule_id)
+        ready = deque(rule_id for rule_id, count in pending.items() if not count)
+        self.topological_order: List[str] = []
+        while ready:
+            rule_id = ready.popleft()
+            self.topological_order.append(rule_id)
+            for dependent in dependents[rule_id]:
+                pending[dependent] -= 1
+                if not pending[dependent]:
+                    ready.append(dependent)
+        self.cyclic = set(self.by_id) - set(self.topological_order)
+        if self.cyclic:
+            print(f"Rules with circular depends_on: {sorted(self.cyclic)}")
+
+    def __getstate__(self):
+        # Compiled snapshots keep the index and order, not the lock or closures cached at runtime
+        state = dict(self.__dict__)
+        del state["_lock"]
+        state["closures"], state["events"] = OrderedDict(), 0
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def closure(self, rule_id: str) -> List[Tuple]:
+        """
+        Depth-first walk of `rule_id` and everything it depends on, as
+        events: ("node", id, depth) the first time a rule is reached and
+        ("edge", dependency, id) for each of its depends_on entries, in the
+        order a recursive walk would produce them.
+        """
+        with self._lock:
+            events = self.closures.get(rule_id)
+            if events is not None:
+                self.closures.move_to_end(rule_id)
+                return events
+
+        events = []
+        visited = set()
+        stack = []
+
+        def enter(current, depth):
+            if current in visited:
+                return
+            visited.add(current)
+            if current not in self.by_id:
+                return
+            events.append(("node", current, depth))
+            stack.append((iter(self.depends_on[current]), current, depth))
+
+        enter(rule_id, 0)
+        while stack:
+            deps, current, depth = stack[-1]
+            dep = next(deps, None)
+            if dep is None:
+                stack.pop()
+                continue
+            events.append(("edge", dep, current))
+            enter(dep, depth + 1)
+
+        with self._lock:
+            if rule_id not in self.closures:
+                self.closures[rule_id] = events
+                self.events += len(events)
+            while self.events > self.max_events and len(self.closures) > 1:
+                self.events -= len(self.closures.popitem(last=False)[1])
+        return events
+
+    def dependencies(self, rule_id: str) -> List[str]:
+        """Every rule `rule_id` depends on, directly or not, in walk order."""
+        return [event[1] for event in self.closure(rule_id)[1:] if event[0] == "node"]
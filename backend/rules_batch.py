@@ -0,0 +1,268 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import numpy as np
+from rule_index import EQ, GT, LT, PRESENT, compile_condition
+
+BATCH_WORKERS = int(os.getenv("LEGOL_RULES_BATCH_WORKERS", 1))
+
+_batch_pool = None
+
+
+def to_columns(fact_sets: List[Dict]) -> Dict[str, List]:
+    """Columnar form of a list of fact dicts: key -> one value per profile, None where a profile lacks the key."""
+    keys = []
+    for facts in fact_sets:
+        keys.extend(key for key in facts if key not in keys)
+    return {key: [facts.get(key) for facts in fact_sets] for key in keys}
+
+
+def _column_length(columns: Dict[str, List]) -> int:
+    lengths = {len(values) for values in columns.values()}
+    if len(lengths) > 1:
+        raise ValueError("All fact columns must have one value per profile")
+    return lengths.pop() if lengths else 0
+
+
+def _parse_date(value):
+    try:
+        return np.datetime64(datetime.strptime(value, "%Y-%m-%d").date(), "D")
+    except (TypeError, ValueError):
+        return np.datetime64("NaT")
+
+
+def _numbers(values) -> np.ndarray:
+    return np.array([float(value) if isinstance(value, (int, float)) else np.nan for value in values], dtype=float)
+
+
+def _parse_dates(values) -> np.ndarray:
+    """datetime64[D] per value, NaT where it isn't a YYYY-MM-DD string. Repeated dates are parsed once."""
+    parsed = {}
+    dates = []
+    for value in values:
+        try:
+            date = parsed.get(value)
+            if date is None:
+                date = parsed[value] = _parse_date(value)
+        except TypeError:
+            date = np.datetime64("NaT")
+        dates.append(date)
+    return np.array(dates, dtype="datetime64[D]")
+
+
+class _Column:
+    """One fact key over all profiles: value codes for equality, float64 values for bounds, presence."""
+
+    def __init__(self, values, count):
+        if isinstance(values, np.ndarray):
+            values = values.tolist()
+        self.values = values or [None] * count
+        try:
+            self.lookup = {value: code for code, value in enumerate(dict.fromkeys(self.values))}
+            self.codes = np.fromiter(map(self.lookup.__getitem__, self.values), np.int64, len(self.values))
+            # Presence and numeric value per distinct value, spread to profiles by code
+            distinct = list(self.lookup)
+            self.present = np.array([value is not None for value in distinct], dtype=bool)[self.codes]
+            self.numbers = _numbers(distinct)[self.codes]
+        except TypeError:
+            self.lookup, self.codes = {}, None  # unhashable values: equality is tested one by one
+            self.present = np.array([value is not None for value in self.values], dtype=bool)
+            self.numbers = _numbers(self.values)
+        self._buckets = None
+
+    def bucket(self, value) -> np.ndarray:
+        """Profiles whose value equals `value`, ascending."""
+        if self._buckets is None:
+            # One stable sort groups profiles by value code
+            order = np.argsort(self.codes, kind="stable")
+            bounds = np.searchsorted(self.codes[order], np.arange(len(self.lookup) + 1))
+            self._buckets = [order[bounds[code]:bounds[code + 1]] for code in range(len(self.lookup))]
+        try:
+            code = self.lookup.get(value)
+        except TypeError:
+            code = None
+        if code is None:
+            return np.empty(0, dtype=np.int64)
+        return self._buckets[code]
+
+    def test(self, op, value, profiles: np.ndarray) -> np.ndarray:
+        """Boolean mask over `profiles`: which of them meet (op, value)."""
+        if op == PRESENT:
+            return self.present[profiles]
+        if op == EQ and self.codes is not None:
+            try:
+                code = self.lookup.get(value)
+            except TypeError:
+                code = None
+            return self.codes[profiles] == code if code is not None else np.zeros(len(profiles), dtype=bool)
+        if op in (GT, LT) and isinstance(value, (int, float)):
+            numbers = self.numbers[profiles]
+            return numbers > value if op == GT else numbers < value
+        return np.array([_compare(self.values[profile], op, value) for profile in profiles.tolist()], dtype=bool)
+
+
+class BatchEvaluator:
+    """
+    Evaluates compiled rules against many fact sets at once, the batch
+    counterpart of RulesEngine.find_applicable_rules and extract_timeline.
+
+    Facts come in columnar form (see to_columns); None marks a missing key.
+    Each column is encoded once per batch: integer value codes grouped into
+    per-value profile buckets with one sort, plus a float64 copy for gt/lt
+    bounds. A rule starts from the smallest bucket among its equality tests
+    (or the profiles meeting its first constraint) and narrows that
+    candidate set with its remaining constraints as array operations.
+    Deadlines are datetime64 arithmetic over all matching profiles of a
+    rule at a time.
+    """
+
+    def __init__(self, rules: List[Dict], constraints: Optional[List] = None):
+        self.rules = rules
+        # ConditionIndex.constraints can be passed in to skip recompiling
+        self.constraints = constraints or [compile_condition(rule.get("condition")) for rule in rules]
+
+    def match_profiles(self, columns: Dict[str, List]) -> List[np.ndarray]:
+        """Per rule, the ascending positions of the profiles its condition holds for."""
+        count = _column_length(columns)
+        encoded = {}
+        first = {}  # profiles meeting a non-equality anchor, shared by rules with the same one
+        everyone = np.arange(count)
+
+        def column(key):
+            if key not in encoded:
+                encoded[key] = _Column(columns.get(key), count) if key in columns else None
+            return encoded[key]
+
+        matched = []
+        for constraints in self.constraints:
+            if not constraints:
+                matched.append(everyone)
+                continue
+            if any(column(key) is None for key, _, _ in constraints):
+                matched.append(everyone[:0])
+                continue
+            buckets = [(column(key).bucket(value), index) for index, (key, op, value) in enumerate(constraints)
+                       if op == EQ and column(key).codes is not None]
+            if buckets:
+                profiles, anchor = min(buckets, key=lambda entry: len(entry[0]))
+            else:
+                anchor = 0
+                key, op, value = constraints[0]
+                try:
+                    profiles = first.get(constraints[0])
+                except TypeError:
+                    profiles = None
+                if profiles is None:
+                    profiles = everyone[column(key).test(op, value, everyone)]
+                    try:
+                        first[constraints[0]] = profiles
+                    except TypeError:
+                        pass
+            for index, (key, op, value) in enumerate(constraints):
+                if index == anchor or not len(profiles):
+                    continue
+                profiles = profiles[column(key).test(op, value, profiles)]
+            matched.append(profiles)
+        return matched
+
+    def evaluate(self, columns: Dict[str, List], with_timeline: bool = True) -> List[Dict[str, Any]]:
+        """Per profile: {"matches": [rule ids in rule order], "timeline": [events as extract_timeline builds them]}."""
+        count = _column_length(columns)
+        matched = self.match_profiles(columns)
+        results = [{"matches": [], "timeline": []} for _ in range(count)]
+        # Rules are visited in order, so each profile's ids come out in rule order
+        for position, profiles in enumerate(matched):
+            if len(profiles):
+                rule_id = self.rules[position]["id"]
+                for profile in profiles.tolist():
+                    results[profile]["matches"].append(rule_id)
+        if not with_timeline or "military_notice_date" not in columns:
+            return results
+
+        notice = _parse_dates(columns["military_notice_date"])
+        dated = ~np.isnat(notice)
+        notice_strings = np.datetime_as_string(notice)
+        for profile in np.flatnonzero(dated).tolist():
+            results[profile]["timeline"].append({"date": str(notice_strings[profile]),
+                                                 "event": "Military Notice Received",
+                                                 "source": "military_notice"})
+        for position, profiles in enumerate(matched):
+            rule = self.rules[position]
+            days = rule.get("deadline_days")
+            if not days or not len(profiles):
+                continue
+            profiles = profiles[dated[profiles]]
+            if float(days).is_integer():
+                deadlines = notice[profiles] + np.timedelta64(int(days), "D")
+            else:
+                seconds = np.timedelta64(int(round(days * 86400)), "s")
+                deadlines = (notice[profiles].astype("datetime64[s]") + seconds).astype("datetime64[D]")
+            for profile, date in zip(profiles.tolist(), np.datetime_as_string(deadlines).tolist()):
+                results[profile]["timeline"].append({"date": date, "event": rule["name"],
+                                                     "deadline": rule.get("deadline_description", ""),
+                                                     "source": rule.get("source", "")})
+        for result in results:
+            if len(result["timeline"]) > 1:
+                result["timeline"].sort(key=lambda event: event["date"])
+        return results
+
+
+def _compare(item, op, value):
+    if item is None:
+        return False
+    try:
+        if op == EQ:
+            return item == value
+        return item > value if op == GT else item < value
+    except TypeError:
+        return False
+
+
+def _get_batch_pool(workers):
+    global _batch_pool
+    if _batch_pool is None or _batch_pool[0] != workers:
+        if _batch_pool is not None:
+            _batch_pool[1].shutdown(wait=False)
+        _batch_pool = (workers, ProcessPoolExecutor(max_workers=workers))
+    return _batch_pool[1]
+
+
+def _reset_batch_pool():
+    """Drops a broken pool so the next sharded evaluation starts a fresh one."""
+    global _batch_pool
+    entry, _batch_pool = _batch_pool, None
+    if entry is not None:
+        entry[1].shutdown(wait=False, cancel_futures=True)
+
+
+def _evaluate_shard(rules, columns, with_timeline):
+    """Worker: evaluates one contiguous range of profiles."""
+    return BatchEvaluator(rules).evaluate(columns, with_timeline)
+
+
+def evaluate_batch(rules: List[Dict], columns: Dict[str, List], workers: Optional[int] = None,
+                   with_timeline: bool = True, evaluator: Optional[BatchEvaluator] = None) -> List[Dict[str, Any]]:
+    """
+    BatchEvaluator.evaluate over `columns`, split into one contiguous shard
+    of profiles per worker process when `workers` (LEGOL_RULES_BATCH_WORKERS)
+    is above 1. Results are in profile order either way.
+    """
+    workers = BATCH_WORKERS if workers is None else workers
+    count = _column_length(columns)
+    if workers > 1 and count >= 2 * workers:
+        shard = -(-count // workers)
+        try:
+            pool = _get_batch_pool(workers)
+            futures = [pool.submit(_evaluate_shard, rules,
+                                   {key: values[start:start + shard] for key, values in columns.items()},
+                                   with_timeline)
+                       for start in range(0, count, shard)]
+            return [result for future in futures for result in future.result()]
+        except (OSError, NotImplementedError, RuntimeError) as e:
+            # No multiprocessing (e.g. some serverless sandboxes), or a worker died
+            if isinstance(e, BrokenProcessPool):
+                _reset_batch_pool()
+            print(f"Parallel rules evaluation unavailable, falling back to serial: {e}")
+    return (evaluator or BatchEvaluator(rules)).evaluate(columns, with_timeline)
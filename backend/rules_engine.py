@@ -1,14 +1,24 @@
 import json
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from datetime import datetime, timedelta
+from rule_index import ConditionIndex, RuleGraph
+from rules_batch import BatchEvaluator, evaluate_batch
 
 class RulesEngine:
     """Matches extracted facts against hardcoded rules"""
     
-    def __init__(self, rules_file: str = "rules.json"):
-        with open(rules_file, 'r') as f:
-            self.data = json.load(f)
+    def __init__(self, rules_file: str = "rules.json", rules: Optional[List[Dict]] = None):
+        if rules is None:
+            with open(rules_file, 'r') as f:
+                self.data = json.load(f)
+        else:
+            self.data = {"rules": rules}
         self.rules = self.data.get("rules", [])
+        # Compiled once; find_applicable_rules only visits rules sharing a fact key
+        self.condition_index = ConditionIndex(self.rules)
+        # Id index, topological order and memoized dependency closures, shared by all requests
+        self.rule_graph = RuleGraph(self.rules)
+        self.batch_evaluator = None
     
     def matches_condition(self, condition: Dict, facts: Dict) -> bool:
         """Check if a rule's condition matches the given facts"""
@@ -36,11 +46,20 @@ class RulesEngine:
     
     def find_applicable_rules(self, facts: Dict) -> List[Dict]:
         """Find all rules that apply to these facts"""
-        applicable = []
-        for rule in self.rules:
-            if self.matches_condition(rule.get("condition", {}), facts):
-                applicable.append(rule)
-        return applicable
+        return self.condition_index.match(facts)
+    
+    def evaluate_batch(self, fact_columns: Dict[str, List], workers: Optional[int] = None,
+                       with_timeline: bool = True) -> List[Dict[str, Any]]:
+        """
+        find_applicable_rules and extract_timeline for many profiles at once.
+        `fact_columns` maps each fact key to one value per profile (None where
+        a profile lacks it; rules_batch.to_columns builds this from fact
+        dicts). Returns one {"matches": [rule ids], "timeline": [...]} per
+        profile, optionally sharded across `workers` processes.
+        """
+        if self.batch_evaluator is None:
+            self.batch_evaluator = BatchEvaluator(self.rules, self.condition_index.constraints)
+        return evaluate_batch(self.rules, fact_columns, workers, with_timeline, evaluator=self.batch_evaluator)
     
     def build_dependency_graph(self, facts: Dict) -> Dict:
         """Build a graph of rule dependencies"""
@@ -49,31 +68,27 @@ class RulesEngine:
         edges = []
         visited = set()
         
-        def add_rule(rule_id, depth=0):
-            if rule_id in visited:
-                return
-            visited.add(rule_id)
-            
-            rule = next((r for r in self.rules if r["id"] == rule_id), None)
-            if not rule:
-                return
-            
-            nodes.append({
-                "id": rule_id,
-                "label": rule["name"],
-                "type": "rule",
-                "source": rule.get("source", "Unknown"),
-                "source_url": rule.get("source_url", ""),
-                "deadline": rule.get("deadline_description", ""),
-                "depth": depth
-            })
-            
-            for dep in rule.get("depends_on", []):
-                edges.append({"from": dep, "to": rule_id, "type": "dependency"})
-                add_rule(dep, depth + 1)
-        
+        # Replays each rule's cached closure; a rule reached from an earlier
+        # applicable rule was already added along with its own dependencies.
         for rule in applicable_rules:
-            add_rule(rule["id"])
+            added = set()
+            for kind, first, second in self.rule_graph.closure(rule["id"]):
+                if kind == "edge":
+                    if second in added:
+                        edges.append({"from": first, "to": second, "type": "dependency"})
+                elif first not in visited:
+                    visited.add(first)
+                    added.add(first)
+                    node_rule = self.rule_graph.by_id[first]
+                    nodes.append({
+                        "id": first,
+                        "label": node_rule["name"],
+                        "type": "rule",
+                        "source": node_rule.get("source", "Unknown"),
+                        "source_url": node_rule.get("source_url", ""),
+                        "deadline": node_rule.get("deadline_description", ""),
+                        "depth": second
+                    })
         
         return {"nodes": nodes, "edges": edges}
     
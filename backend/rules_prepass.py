@@ -0,0 +1,336 @@
+import asyncio
+import re
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from context_serializer import serialize_graph_context
+from retrieval_index import tokenize
+
+NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+                "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "eighteen": 18, "twenty": 20, "twenty-four": 24}
+_NUMBER = r"(\d+|" + "|".join(NUMBER_WORDS) + r")"
+
+_VISA_TYPE = re.compile(r"\b(?:[fjmhol]-?1b?|e-?3|tn)\b", re.I)
+# "apply for H-1B", "switch to O-1": a visa the user is aiming for, not the one they hold
+_TARGET_VISA = re.compile(r"\b(?:for|to|into)\s+(?:an?\s+|the\s+)?$", re.I)
+
+# (fact key, pattern, value); value None means "read it from the match"
+FACT_PATTERNS = [
+    ("military_service", re.compile(r"\b(?:military|army|navy|air force|conscript\w*|national service|"
+                                    r"enlist\w*|drafted|reservists?|ns)\b", re.I), True),
+    ("military_service_months", re.compile(_NUMBER + r"[ -]*(months?|years?)\b", re.I), None),
+    ("status", re.compile(r"\b(?:graduated|(?:recent|new) grad(?:uate)?)\b", re.I), "graduated"),
+    ("opt_approved", re.compile(r"\b(?:on opt|opt (?:is |was |got |been )*approved|approved (?:for )?opt|"
+                                r"opt ead|ead card)\b", re.I), True),
+    ("employer_sponsoring", re.compile(r"\b(?:employer|company|job)\b[^.?!]*\bsponsor\w*|"
+                                       r"\bsponsor\w*\b[^.?!]*\b(?:employer|company)\b", re.I), True),
+    ("oie_notified", re.compile(r"\b(?:notified|told|informed|contacted)\b[^.?!]*\b(?:oie|dso|"
+                                r"international (?:student )?office)\b", re.I), True),
+    ("military_notice_date", re.compile(r"\b\d{4}-\d{2}-\d{2}\b"), None),
+]
+
+# A fact only counts in the clause it's stated in: "I did military service, my
+# brother didn't" is about two people
+_CLAUSE_BREAK = re.compile(r"[.?!;,]|\b(?:and|but|or|so|because|though|although|while)\b", re.I)
+_NEGATION = re.compile(r"\b(?:not|never|no|without)\b|n['’]t\b", re.I)
+_THIRD_PARTY = re.compile(r"\b(?:he|she|they|his|her|their|someone|somebody)\b|\b(?:brother|sister|friend|cousin|"
+                          r"son|daughter|husband|wife|spouse|partner|father|mother|dad|mom|parent|roommate|"
+                          r"classmate|colleague|boyfriend|girlfriend)(?:s|'s)?\b", re.I)
+# Facts about something that has already happened; "will", "once" or "in 2 years" mean it hasn't
+PAST_ONLY_FACTS = {"status", "opt_approved", "oie_notified"}
+_FUTURE = re.compile(r"\b(?:will|shall|going to|gonna|plan(?:ning)? to|hop(?:e|ing) to|expect(?:ing)? to|"
+                     r"about to|once|if|unless|next|soon|in (?:\d+|a|an|one|two|three|a few) \w+)\b|'ll\b", re.I)
+
+# Question and function words that don't need covering
+FILLER_WORDS = set("""
+a about after am an and any are as at be been before being but by can could did do does doing during
+for from get gets getting go going had has have having how i if im in into is it its just
+know let like me might more much must my need needs next now of on or our out over please
+should so some than that the their them then there these they this to too under until up us
+want was we were what when where which while who why will with within would yes you your
+m s t re ve ll d student students already currently still got here soon start starting last
+day days week weeks month months year years
+january february march april may june july august september october november december
+happen happens happened thing things tell explain mean means step steps process
+""".split())
+
+STEM_CHARS = 6
+
+
+def _stem(token: str) -> str:
+    """Crude prefix stem, so "graduated"/"graduation" or "terminates"/"termination" compare equal."""
+    return token[:STEM_CHARS]
+
+
+def _asserted(key: str, text: str, match) -> bool:
+    """
+    False when the clause around `match` negates the fact, states it about
+    someone else, or (for PAST_ONLY_FACTS) says it hasn't happened yet.
+    """
+    breaks = [found.end() for found in _CLAUSE_BREAK.finditer(text, 0, match.start())]
+    following = _CLAUSE_BREAK.search(text, match.end())
+    before = text[breaks[-1] if breaks else 0:match.start()]
+    after = text[match.end():following.start() if following else len(text)]
+    if _NEGATION.search(before + match.group(0) + after) or _THIRD_PARTY.search(before):
+        return False
+    return key not in PAST_ONLY_FACTS or not _FUTURE.search(before + " " + after)
+
+
+def extract_facts(query_text: str) -> Tuple[Dict[str, Any], Set[str], Set[str]]:
+    """
+    Rule facts stated in a query, read with FACT_PATTERNS (no model call),
+    the words those facts account for, and the keys of facts that were
+    mentioned but not asserted (negated, about someone else, or not yet
+    true; see _asserted). The visa type is the first one mentioned that
+    isn't a goal ("sponsor me for H-1B"), and OPT implies F-1. Months only
+    count as military service months when military service is mentioned.
+    """
+    text = query_text or ""
+    facts: Dict[str, Any] = {}
+    consumed: Set[str] = set()
+    hedged: Set[str] = set()
+    for match in _VISA_TYPE.finditer(text):
+        if _TARGET_VISA.search(text[max(0, match.start() - 20):match.start()]):
+            consumed.update(tokenize(match.group(0)))
+        elif not _asserted("visa_type", text, match):
+            hedged.add("visa_type")
+        else:
+            consumed.update(tokenize(match.group(0)))
+            found = match.group(0).upper().replace("-", "")
+            facts.setdefault("visa_type", found[0] + "-" + found[1:] if found != "TN" else found)
+    for key, pattern, value in FACT_PATTERNS:
+        if key == "military_service_months" and not facts.get("military_service"):
+            continue
+        for match in pattern.finditer(text):
+            if not _asserted(key, text, match):
+                hedged.add(key)
+                continue
+            consumed.update(tokenize(match.group(0)))
+            if key in facts:
+                continue
+            if key == "military_service_months":
+                count = match.group(1).lower()
+                count = int(count) if count.isdigit() else NUMBER_WORDS[count]
+                facts[key] = count * 12 if match.group(2).lower().startswith("year") else count
+            elif key == "military_notice_date":
+                facts[key] = match.group(0)
+            else:
+                facts[key] = value
+    if "visa_type" not in facts:
+        for match in re.finditer(r"\bopt\b", text, re.I):
+            if _asserted("visa_type", text, match):
+                facts["visa_type"] = "F-1"
+                consumed.add("opt")
+                break
+    return facts, consumed, hedged
+
+
+def remainder(query_text: str, uncovered: List[str]) -> str:
+    """The clauses of the question holding words the rules didn't account for (all of it if none do)."""
+    words = set(uncovered)
+    clauses = [clause.strip() for clause in re.findall(r"[^.?!;,]+[.?!;,]*", query_text or "")
+               if words & set(tokenize(clause))]
+    return " ".join(clauses) or query_text
+
+
+def rule_updates(engine, graph: Dict) -> Dict[str, List[Dict]]:
+    """A build_dependency_graph result in the {"new_nodes", "new_edges"} shape GraphManager.apply_updates takes."""
+    by_id = engine.rule_graph.by_id
+    nodes = []
+    for node in graph["nodes"]:
+        rule = by_id[node["id"]]
+        consequence = rule.get("consequence") or {}
+        description = consequence.get("action", "")
+        if consequence.get("timeline"):
+            description = f"{description} (timeline: {consequence['timeline']})".strip()
+        nodes.append({
+            "type": "action",
+            "label": rule["name"],
+            "description": description,
+            "source": rule.get("source", "Rules"),
+            "status": "pending",
+            "deadline": rule.get("deadline_description") or consequence.get("timeline"),
+            "required_documents": []
+        })
+    edges = [{"source_label": by_id[edge["from"]]["name"], "target_label": by_id[edge["to"]]["name"],
+              "type": "dependency", "description": "Required first"}
+             for edge in graph["edges"] if edge["from"] in by_id and edge["to"] in by_id]
+    return {"new_nodes": nodes, "new_edges": edges}
+
+
+def _rule_vocabulary(engine, rule_ids: List[str]) -> Set[str]:
+    words = set()
+    for rule_id in rule_ids:
+        rule = engine.rule_graph.by_id[rule_id]
+        consequence = rule.get("consequence") or {}
+        texts = [rule.get("name"), rule.get("scenario"), rule.get("source"), rule.get("deadline_description")]
+        texts += [value for value in consequence.values() if isinstance(value, str)]
+        if rule.get("deadline_days"):
+            texts.append("deadline")
+        for text in texts:
+            words.update(_stem(token) for token in tokenize(str(text or "").replace("_", " ")))
+    return words
+
+
+class QueryPrepass:
+    """
+    Deterministic first stage of /query: facts are read from the question
+    with patterns, and when rules apply, their dependency graph
+    (RulesEngine.build_dependency_graph) becomes graph updates without a
+    model call.
+
+    The question counts as covered when every rule in that graph applies to
+    the facts on its own (find_applicable_rules), no fact was mentioned
+    negated, about someone else or as not yet true, and every word is
+    filler, part of a recognized fact, or appears in the matched rules'
+    names, consequences and deadlines. Either way the steps of the rules
+    that apply go into the graph first. When the question isn't covered,
+    the model is then asked only about the clauses the rules didn't account
+    for (see remainder), with those steps in its graph context, and its
+    answer is merged by label. `rules` is a RulesReloader (anything with
+    get() -> RulesEngine).
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.stats = {"queries": 0, "served_by_rules": 0, "rules_with_llm": 0, "llm_only": 0,
+                      "rules_ms_sum": 0.0, "llm_path_ms_sum": 0.0}
+
+    def run(self, query_text: str) -> Dict[str, Any]:
+        """
+        {"facts", "hedged", "rule_ids", "unsupported", "updates",
+        "uncovered": [words], "covered": bool} for a query. `unsupported`
+        are rules in the dependency graph whose own conditions the facts
+        don't meet; `updates` hold the steps of the others.
+        """
+        engine = self.rules.get()
+        facts, consumed, hedged = extract_facts(query_text)
+        graph = engine.build_dependency_graph(facts) if facts else {"nodes": [], "edges": []}
+        rule_ids = [node["id"] for node in graph["nodes"]]
+        applicable = {rule["id"] for rule in engine.find_applicable_rules(facts)} if facts else set()
+        unsupported = [rule_id for rule_id in rule_ids if rule_id not in applicable]
+        supported = {"nodes": [node for node in graph["nodes"] if node["id"] in applicable],
+                     "edges": [edge for edge in graph["edges"]
+                               if edge["from"] in applicable and edge["to"] in applicable]}
+        vocabulary = _rule_vocabulary(engine, rule_ids)
+        uncovered = []
+        for token in tokenize(query_text):
+            if (token in FILLER_WORDS or token in consumed or token.isdigit() or
+                    _stem(token) in vocabulary or token in uncovered):
+                continue
+            uncovered.append(token)
+        covered = bool(rule_ids) and not uncovered and not unsupported and not hedged
+        return {"facts": facts, "hedged": sorted(hedged), "rule_ids": rule_ids, "unsupported": unsupported,
+                "updates": rule_updates(engine, supported), "uncovered": uncovered, "covered": covered}
+
+    def _plan(self, query_text: str):
+        """The pre-pass, its summary for the response, and what to ask the model (None when covered)."""
+        prepass = self.run(query_text)
+        self.stats["queries"] += 1
+        summary = {"facts": prepass["facts"], "rules": prepass["rule_ids"], "llm": not prepass["covered"]}
+        if prepass["covered"]:
+            self.stats["served_by_rules"] += 1
+            return prepass, summary, None
+        if prepass["updates"]["new_nodes"]:
+            self.stats["rules_with_llm"] += 1
+            model_query = remainder(query_text, prepass["uncovered"])
+        else:
+            self.stats["llm_only"] += 1
+            model_query = query_text
+        summary["llm_query"] = model_query
+        return prepass, summary, model_query
+
+    @staticmethod
+    def _model_context(prepass: Dict[str, Any], model_query: str, graph_manager) -> str:
+        """Graph context for the model, naming the rule steps already applied."""
+        graph_context = serialize_graph_context(graph_manager.graph, model_query)
+        nodes = prepass["updates"]["new_nodes"]
+        if not nodes:
+            return graph_context
+        facts = ", ".join(f"{key}={value}" for key, value in prepass["facts"].items())
+        labels = "; ".join(node["label"] for node in nodes)
+        return (f"Already handled by the rules engine for this user ({facts}); these steps are in the graph, "
+                f"connect to them by label instead of repeating them: {labels}\n\n{graph_context}")
+
+    def _finish(self, start: float, updates: Dict, llm_updates: Optional[Dict] = None) -> Dict[str, List[Dict]]:
+        elapsed = (time.perf_counter() - start) * 1000
+        if llm_updates is None:
+            self.stats["rules_ms_sum"] += elapsed
+            return updates
+        self.stats["llm_path_ms_sum"] += elapsed
+        return {"new_nodes": updates["new_nodes"] + llm_updates.get("new_nodes", []),
+                "new_edges": updates["new_edges"] + llm_updates.get("new_edges", [])}
+
+    def answer(self, query_text: str, graph_manager, claude_integration, use_cache: bool = True):
+        """
+        Applies the steps of the rules that apply, then, unless they cover
+        the question, calls claude_integration.process_query for the rest and
+        applies its result with the same label mapping. Returns (updates
+        applied, pre-pass summary for the response).
+        """
+        start = time.perf_counter()
+        prepass, summary, model_query = self._plan(query_text)
+        label_to_id: Dict[str, str] = {}
+        updates = prepass["updates"]
+        if updates["new_nodes"]:
+            graph_manager.apply_updates(updates, label_to_id)
+        if model_query is None:
+            return self._finish(start, updates), summary
+
+        graph_context = self._model_context(prepass, model_query, graph_manager)
+        llm_updates = claude_integration.process_query(model_query, graph_context, use_cache=use_cache)
+        graph_manager.apply_updates(llm_updates, label_to_id)
+        return self._finish(start, updates, llm_updates), summary
+
+    async def answer_async(self, query_text: str, graph_manager, claude_integration, use_cache: bool = True):
+        """
+        answer() for the asyncio server: `claude_integration` is an
+        AsyncClaudeIntegration, and the pre-pass and graph work run in the
+        default thread pool, off the event loop.
+        """
+        start = time.perf_counter()
+        prepass, summary, model_query = await asyncio.to_thread(self._plan, query_text)
+        label_to_id: Dict[str, str] = {}
+        updates = prepass["updates"]
+        if updates["new_nodes"]:
+            await asyncio.to_thread(graph_manager.apply_updates, updates, label_to_id)
+        if model_query is None:
+            return self._finish(start, updates), summary
+
+        graph_context = await asyncio.to_thread(self._model_context, prepass, model_query, graph_manager)
+        llm_updates = await claude_integration.process_query(model_query, graph_context, use_cache=use_cache)
+        await asyncio.to_thread(graph_manager.apply_updates, llm_updates, label_to_id)
+        return self._finish(start, updates, llm_updates), summary
+
+    def stream(self, query_text: str, graph_manager, claude_integration, use_cache: bool = True):
+        """
+        Streaming answer() for /query/stream: yields ("new_nodes", node) and
+        ("new_edges", edge) like claude_integration.process_query_stream,
+        the rule steps first, then the model's items if the rules don't
+        cover the question. The caller applies each item before asking for
+        the next one, with one label mapping for the whole stream.
+        """
+        start = time.perf_counter()
+        prepass, _, model_query = self._plan(query_text)
+        for kind in ("new_nodes", "new_edges"):
+            for item in prepass["updates"][kind]:
+                yield kind, item
+        if model_query is None:
+            self._finish(start, prepass["updates"])
+            return
+
+        graph_context = self._model_context(prepass, model_query, graph_manager)
+        yield from claude_integration.process_query_stream(model_query, graph_context, use_cache)
+        self._finish(start, prepass["updates"], {})
+
+    def metrics(self) -> Dict[str, Any]:
+        """Share of queries answered without a model call and mean latency of each path."""
+        stats = dict(self.stats)
+        queries = stats["queries"]
+        served = stats["served_by_rules"]
+        llm = queries - served
+        stats["served_by_rules_ratio"] = round(served / queries, 3) if queries else 0.0
+        rules_ms, llm_ms = stats.pop("rules_ms_sum"), stats.pop("llm_path_ms_sum")
+        stats["rules_ms_avg"] = round(rules_ms / served, 2) if served else 0.0
+        stats["llm_path_ms_avg"] = round(llm_ms / llm, 2) if llm else 0.0
+        return stats
@@ -0,0 +1,213 @@
+"""
+Compiled rules snapshots and hot reload.
+
+Usage: python rules_snapshot.py [rules.json] [--output rules.compiled]
+"""
+import argparse
+import gc
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from rules_engine import RulesEngine
+
+# Bump when RulesEngine or its compiled indexes change shape
+SNAPSHOT_FORMAT = 1
+RULES_PATH = os.getenv("LEGOL_RULES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules.json"))
+RULES_RELOAD_SECONDS = float(os.getenv("LEGOL_RULES_RELOAD_SECONDS", 2))
+
+
+def snapshot_path(rules_file: str) -> str:
+    """
+    LEGOL_RULES_SNAPSHOT, else rules.json -> rules.compiled next to it. On
+    Vercel (VERCEL is set) the deployment directory is read-only and the
+    snapshot isn't shipped, so it goes in the temp directory instead.
+    """
+    if os.getenv("LEGOL_RULES_SNAPSHOT"):
+        return os.environ["LEGOL_RULES_SNAPSHOT"]
+    name = os.path.splitext(rules_file)[0] + ".compiled"
+    if os.getenv("VERCEL"):
+        return os.path.join(tempfile.gettempdir(), os.path.basename(name))
+    return name
+
+
+def validate_rules(rules: Any) -> List[Dict]:
+    """Raises ValueError listing every malformed rule; returns the rules otherwise."""
+    if not isinstance(rules, list):
+        raise ValueError('rules file must contain {"rules": [...]}')
+    problems = []
+    seen = set()
+    for position, rule in enumerate(rules):
+        if not isinstance(rule, dict):
+            problems.append(f"rule {position}: not an object")
+            continue
+        name = rule.get("id", f"rule {position}")
+        if not isinstance(rule.get("id"), str) or not rule["id"]:
+            problems.append(f"{name}: missing id")
+        elif rule["id"] in seen:
+            problems.append(f"{name}: duplicate id")
+        seen.add(rule.get("id"))
+        if not isinstance(rule.get("name"), str):
+            problems.append(f"{name}: missing name")
+        if not isinstance(rule.get("condition", {}), dict):
+            problems.append(f"{name}: condition must be an object")
+        if not isinstance(rule.get("depends_on", []), list):
+            problems.append(f"{name}: depends_on must be a list")
+        days = rule.get("deadline_days")
+        if days is not None and (isinstance(days, bool) or not isinstance(days, (int, float))):
+            problems.append(f"{name}: deadline_days must be a number")
+    if problems:
+        raise ValueError("Invalid rules: " + "; ".join(problems))
+    return rules
+
+
+def _source_stamp(rules_file: str, content: Optional[bytes] = None) -> Dict[str, Any]:
+    if content is None:
+        with open(rules_file, "rb") as f:
+            content = f.read()
+    stat = os.stat(rules_file)
+    return {"sha256": hashlib.sha256(content).hexdigest(), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def compile_rules(rules_file: str, output: Optional[str] = None) -> RulesEngine:
+    """
+    Parses and validates `rules_file`, builds the engine with its indexes and
+    writes it as a versioned pickle to `output` (default snapshot_path). The
+    write is atomic; a directory that isn't writable only costs the snapshot.
+    """
+    with open(rules_file, "rb") as f:
+        content = f.read()
+    data = json.loads(content)
+    engine = RulesEngine(rules=validate_rules(data.get("rules") if isinstance(data, dict) else None))
+    output = output or snapshot_path(rules_file)
+    payload = {"format": SNAPSHOT_FORMAT, "source": _source_stamp(rules_file, content), "engine": engine}
+    try:
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output)), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, output)
+    except OSError as e:
+        print(f"Could not write rules snapshot {output}: {e}")
+    return engine
+
+
+def _load_pickle(f):
+    # Collections during the load would scan the half-built object graph
+    # over and over; without them loading is several times faster.
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return pickle.load(f)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def load_rules(rules_file: str = RULES_PATH) -> RulesEngine:
+    """
+    The compiled engine for `rules_file`: from its snapshot when that was
+    built from the same file contents by this SNAPSHOT_FORMAT, else compiled
+    (and the snapshot rewritten). A matching size and mtime skip hashing the
+    source; after a deploy resets mtimes the content hash still matches.
+    Snapshots are pickles: only load ones your own build produced.
+    """
+    path = snapshot_path(rules_file)
+    try:
+        with open(path, "rb") as f:
+            payload = _load_pickle(f)
+        stamp = payload["source"]
+        if payload["format"] == SNAPSHOT_FORMAT:
+            stat = os.stat(rules_file)
+            if ((stat.st_size, stat.st_mtime_ns) == (stamp["size"], stamp["mtime_ns"]) or
+                    _source_stamp(rules_file)["sha256"] == stamp["sha256"]):
+                return payload["engine"]
+    except FileNotFoundError:
+        pass
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError, KeyError, TypeError) as e:
+        print(f"Ignoring unreadable rules snapshot {path}: {e}")
+    return compile_rules(rules_file, path)
+
+
+class RulesReloader:
+    """
+    Holds the current RulesEngine and swaps in a new one when the rules file
+    changes on disk.
+
+    get() checks the file's size and mtime at most every `interval` seconds
+    (LEGOL_RULES_RELOAD_SECONDS). A change is compiled on a background thread
+    while callers keep getting the current engine, and the new one replaces
+    it with a single reference assignment. Requests already holding the old
+    engine finish on it. A file that fails to parse or validate is reported
+    and the current rules stay in place.
+    """
+
+    def __init__(self, rules_file: str = RULES_PATH, interval: float = RULES_RELOAD_SECONDS):
+        self.rules_file = rules_file
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._reloading = None
+        self._checked_at = time.monotonic()
+        self._stat = self._file_stat()
+        start = time.perf_counter()
+        self.engine = load_rules(rules_file)
+        self.stats = {"load_ms": round((time.perf_counter() - start) * 1000, 2), "reloads": 0, "reload_errors": 0}
+
+    def _file_stat(self):
+        try:
+            stat = os.stat(self.rules_file)
+            return stat.st_size, stat.st_mtime_ns
+        except OSError:
+            return None
+
+    def get(self) -> RulesEngine:
+        now = time.monotonic()
+        if now - self._checked_at >= self.interval:
+            with self._lock:
+                if now - self._checked_at >= self.interval and self._reloading is None:
+                    self._checked_at = now
+                    stat = self._file_stat()
+                    if stat is not None and stat != self._stat:
+                        self._reloading = threading.Thread(target=self._reload, args=(stat,), daemon=True)
+                        self._reloading.start()
+        return self.engine
+
+    def _reload(self, stat):
+        try:
+            engine = compile_rules(self.rules_file)
+            self.engine = engine
+            self.stats["reloads"] += 1
+            print(f"Reloaded {len(engine.rules)} rules from {self.rules_file}")
+        except (OSError, ValueError) as e:
+            self.stats["reload_errors"] += 1
+            print(f"Keeping current rules, reload of {self.rules_file} failed: {e}")
+        finally:
+            with self._lock:
+                self._stat = stat
+                self._reloading = None
+
+    def wait(self, timeout: Optional[float] = None):
+        """Blocks until a reload in progress, if any, has finished."""
+        thread = self._reloading
+        if thread is not None:
+            thread.join(timeout)
+
+    def metrics(self) -> Dict[str, Any]:
+        return dict(self.stats, rules=len(self.engine.rules), reloading=self._reloading is not None)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("rules_file", nargs="?", default=RULES_PATH)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+    engine = compile_rules(args.rules_file, args.output)
+    print(f"Compiled {len(engine.rules)} rules to {args.output or snapshot_path(args.rules_file)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import atexit
+import os
+import threading
+import time
+from collections import OrderedDict
+from graph_manager import GraphManager
+
+SESSION_HEADERS = ("X-Session-Id", "X-User-Id")
+DEFAULT_SESSION = "default"
+
+
+def session_id_from_headers(headers):
+    """Picks the session key from request headers, falling back to a shared default."""
+    for name in SESSION_HEADERS:
+        value = headers.get(name)
+        if value:
+            return value.strip()[:128]
+    return DEFAULT_SESSION
+
+
+class SessionStore:
+    """
+    Holds one GraphManager per session, bounded in count, idle time and
+    approximate memory. Sessions are kept in LRU order; whenever a limit is
+    exceeded the least recently used sessions are evicted first.
+
+    Limits default to the LEGOL_MAX_SESSIONS, LEGOL_SESSION_TTL_SECONDS and
+    LEGOL_SESSION_MAX_BYTES environment variables (0 disables a limit).
+
+    With a `persistence` backend, sessions are loaded from it on first use,
+    reloaded when another process has written them, and flushed before they
+    are evicted or the process exits.
+    """
+
+    def __init__(self, max_sessions=None, ttl_seconds=None, max_bytes=None, factory=GraphManager,
+                 persistence=None):
+        self.max_sessions = max_sessions if max_sessions is not None else int(os.getenv("LEGOL_MAX_SESSIONS", 1000))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("LEGOL_SESSION_TTL_SECONDS", 3600))
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv("LEGOL_SESSION_MAX_BYTES", 256 * 1024 * 1024))
+        self.factory = factory
+        self.persistence = persistence
+        self.sessions = OrderedDict()  # session_id -> (manager, last_access)
+        self.evictions = {"lru": 0, "ttl": 0, "memory": 0}
+        self._lock = threading.Lock()
+        if persistence is not None:
+            atexit.register(self.flush_all)
+
+    def get(self, session_id):
+        """Returns the GraphManager for a session, creating it if needed."""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            entry = self.sessions.pop(session_id, None)
+            manager = entry[0] if entry else None
+            if manager is None:
+                manager = (self.factory() if self.persistence is None
+                           else self.factory.load(self.persistence, session_id))
+            elif manager.is_stale():
+                manager = self.factory.load(self.persistence, session_id, min_revision=manager.revision + 1)
+            self.sessions[session_id] = (manager, now)
+            self._evict_over_limits()
+            return manager
+
+    def _evict_expired(self, now):
+        if not self.ttl_seconds:
+            return
+        while self.sessions:
+            session_id, (_, last_access) = next(iter(self.sessions.items()))
+            if now - last_access < self.ttl_seconds:
+                break
+            self.sessions.popitem(last=False)[1][0].flush()
+            self.evictions["ttl"] += 1
+
+    def _evict_over_limits(self):
+        while self.max_sessions and len(self.sessions) > self.max_sessions:
+            self.sessions.popitem(last=False)[1][0].flush()
+            self.evictions["lru"] += 1
+
+        if not self.max_bytes:
+            return
+        total = sum(manager.approx_bytes for manager, _ in self.sessions.values())
+        # The session being requested is the most recent one and is never evicted.
+        while total > self.max_bytes and len(self.sessions) > 1:
+            _, (manager, _) = self.sessions.popitem(last=False)
+            manager.flush()
+            total -= manager.approx_bytes
+            self.evictions["memory"] += 1
+
+    def flush_all(self):
+        with self._lock:
+            for manager, _ in self.sessions.values():
+                manager.flush()
+
+    def metrics(self):
+        with self._lock:
+            sizes = [manager.approx_bytes for manager, _ in self.sessions.values()]
+            return {
+                "live_sessions": len(sizes),
+                "evictions": dict(self.evictions),
+                "total_bytes": sum(sizes),
+                "avg_bytes_per_graph": sum(sizes) // len(sizes) if sizes else 0,
+                "max_bytes_per_graph": max(sizes, default=0),
+                "limits": {
+                    "max_sessions": self.max_sessions,
+                    "ttl_seconds": self.ttl_seconds,
+                    "max_bytes": self.max_bytes
+                }
+            }
@@ -0,0 +1,65 @@
+import json
+
+
+def format_sse(payload, event=None):
+    """Formats one Server-Sent Events message with a JSON payload."""
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(payload)}\n\n"
+
+
+def chat_sse_events(claude_integration, query_text, conversation_history=None, file_contents=None, session_id=None):
+    """
+    Yields the SSE stream for /chat/stream: one `data: {"text": ...}` message
+    per chunk, then an `event: done` message with this request's timing
+    metrics and prompt size.
+    """
+    metrics = {}
+    try:
+        for text in claude_integration.chat_stream(query_text, conversation_history, file_contents, session_id,
+                                                   metrics=metrics):
+            yield format_sse({"text": text})
+    except Exception as e:
+        yield format_sse({"error": str(e)}, event="error")
+        return
+
+    yield format_sse({"ttfb_ms": metrics.get("ttfb_ms"), "total_ms": metrics.get("total_ms"),
+                      "prompt_tokens": metrics.get("prompt_tokens")}, event="done")
+
+
+def query_sse_events(claude_integration, graph_manager, query_text, graph_context, use_cache=True,
+                     query_prepass=None):
+    """
+    Yields the SSE stream for /query/stream. With a `query_prepass`
+    (rules_prepass.QueryPrepass) the items come from its stream(), so
+    questions the rules cover are answered without Claude, and
+    `graph_context` is unused. Each node or edge is applied to
+    the graph as soon as Claude finishes writing it, followed by one
+    `data: {"kind", "item", "changes"}` message, where `changes` is the
+    structural get_changes_since delta it caused (no layout, so node
+    payloads have no position). The stream ends with an `event: done`
+    message carrying the final revision and the positions of every node,
+    laid out once.
+    """
+    label_to_id = {}
+    revision = graph_manager.revision
+    counts = {"new_nodes": 0, "new_edges": 0}
+    try:
+        if query_prepass is not None:
+            items = query_prepass.stream(query_text, graph_manager, claude_integration, use_cache)
+        else:
+            items = claude_integration.process_query_stream(query_text, graph_context, use_cache)
+        for kind, item in items:
+            if kind not in counts or not isinstance(item, dict):
+                continue
+            counts[kind] += 1
+            graph_manager.apply_updates({kind: [item]}, label_to_id)
+            changes = graph_manager.get_changes_since(revision, positions=False)
+            revision = changes["revision"]
+            yield format_sse({"kind": kind, "item": item, "changes": changes})
+    except Exception as e:
+        yield format_sse({"error": str(e)}, event="error")
+    finally:
+        graph_manager.flush()
+
+    yield format_sse({"revision": graph_manager.revision, "nodes": counts["new_nodes"],
+                      "edges": counts["new_edges"], "positions": graph_manager.get_positions()}, event="done")
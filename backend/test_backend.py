@@ -1,8 +1,44 @@
 import unittest
 from unittest.mock import MagicMock, patch
 import json
+import os
+import tempfile
+import threading
+import time
 from app import app
 from graph_manager import GraphManager
+from session_store import SessionStore
+from graph_persistence import SQLitePersistence
+from context_serializer import serialize_graph_context, estimate_tokens
+from claude_integration import ClaudeIntegration, prompt_text
+from response_cache import ResponseCache, request_key
+from sse import chat_sse_events
+from conversation_window import ConversationWindow
+from json_stream import JsonItemStream
+import file_parser
+from concurrent.futures.process import BrokenProcessPool
+from file_parser import extract_text_from_pdf, extract_text_cached, parse_cache_key, ParseCache
+from bench_pdf import write_text_pdf
+from upload_stream import MultipartStreamParser, stream_uploads
+from document_store import DocumentStore
+from retrieval_index import BM25Index
+from rules_engine import RulesEngine
+from bench_rules import synthetic_rules, synthetic_facts, linear_scan
+from bench_rule_graph import synthetic_dag, recursive_dependency_graph
+from bench_rules_batch import synthetic_profiles, per_profile
+import rules_batch
+from rules_batch import to_columns
+from deadline_scheduler import parse_deadline, anchor_key
+from bench_schedule import synthetic_schedule, dates
+from rules_snapshot import RulesReloader, compile_rules, load_rules, snapshot_path
+from rules_prepass import QueryPrepass, extract_facts
+import random
+import io
+from async_claude_integration import AsyncClaudeIntegration, RateLimiter
+import asyncio
+from aiohttp.test_utils import TestClient, TestServer
+import async_app
+from unittest.mock import AsyncMock
 
 class TestMosaicBackend(unittest.TestCase):
     def setUp(self):
@@ -83,5 +119,1055 @@ class TestMosaicBackend(unittest.TestCase):
         self.assertEqual(data['edges'][0]['source'], n1)
         self.assertEqual(data['edges'][0]['target'], n2)
 
+    def test_layout_cache_hits_on_repeated_polls(self):
+        gm = GraphManager()
+        n1 = gm.add_node("document", "Doc A", "desc")
+        n2 = gm.add_node("action", "Action B", "desc")
+        gm.add_edge(n1, n2)
+
+        first = gm.get_graph_data()
+        second = gm.get_graph_data()
+        stats = gm.get_layout_stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(first['nodes'][0]['position'], second['nodes'][0]['position'])
+
+    def test_layout_places_new_nodes_incrementally(self):
+        gm = GraphManager()
+        ids = [gm.add_node("action", f"Step {i}", "desc") for i in range(10)]
+        for a, b in zip(ids, ids[1:]):
+            gm.add_edge(a, b)
+        before = {n['id']: n['position'] for n in gm.get_graph_data()['nodes']}
+
+        new_id = gm.add_node("document", "Late Doc", "desc")
+        gm.add_edge(new_id, ids[0])
+        after = {n['id']: n['position'] for n in gm.get_graph_data()['nodes']}
+
+        self.assertEqual(gm.get_layout_stats()['incremental_layouts'], 1)
+        self.assertIn(new_id, after)
+        for node_id in ids:
+            self.assertAlmostEqual(before[node_id]['x'], after[node_id]['x'])
+            self.assertAlmostEqual(before[node_id]['y'], after[node_id]['y'])
+
+    def test_layered_layout_ranks_dependencies(self):
+        gm = GraphManager()
+        a = gm.add_node("document", "Passport", "desc")
+        b = gm.add_node("action", "DS-160", "desc")
+        c = gm.add_node("event", "Interview", "desc")
+        gm.add_edge(a, b, "dependency")
+        gm.add_edge(b, c, "timeline")
+        gm.add_edge(c, a, "conflict")
+
+        data = gm.get_graph_data(layout="layered")
+        y = {n['id']: n['position']['y'] for n in data['nodes']}
+        self.assertLess(y[a], y[b])
+        self.assertLess(y[b], y[c])
+
+    def test_layered_layout_handles_cycles(self):
+        gm = GraphManager()
+        a = gm.add_node("action", "A", "desc")
+        b = gm.add_node("action", "B", "desc")
+        gm.add_edge(a, b, "dependency")
+        gm.add_edge(b, a, "dependency")
+
+        data = gm.get_graph_data(layout="layered")
+        self.assertEqual(len(data['nodes']), 2)
+        self.assertNotEqual(data['nodes'][0]['position'], data['nodes'][1]['position'])
+
+    def test_get_graph_rejects_unknown_layout(self):
+        response = self.app.get('/graph?layout=circular')
+        self.assertEqual(response.status_code, 400)
+        response = self.app.get('/graph?layout=layered')
+        self.assertEqual(response.status_code, 200)
+
+    def test_changes_since_returns_only_delta(self):
+        gm = GraphManager()
+        n1 = gm.add_node("document", "Doc A", "desc")
+        n2 = gm.add_node("action", "Action B", "desc")
+        gm.add_edge(n1, n2)
+        rev = gm.get_graph_data()['revision']
+
+        n3 = gm.add_node("event", "Event C", "desc")
+        e2 = gm.add_edge(n2, n3)
+        gm.update_node(n1, status="completed")
+        gm.remove_node(n2)
+
+        delta = gm.get_changes_since(rev)
+        self.assertFalse(delta['full'])
+        self.assertEqual(delta['revision'], gm.revision)
+        self.assertEqual([n['id'] for n in delta['nodes']['added']], [n3])
+        self.assertEqual([n['id'] for n in delta['nodes']['changed']], [n1])
+        self.assertEqual(delta['nodes']['changed'][0]['data']['status'], "completed")
+        self.assertEqual(delta['nodes']['removed'], [n2])
+        self.assertEqual(delta['edges']['added'], [])
+        self.assertEqual(len(delta['edges']['removed']), 1)
+        self.assertNotIn(e2, delta['edges']['removed'])
+
+        self.assertEqual(gm.get_changes_since(gm.revision)['nodes']['added'], [])
+
+    def test_changes_since_compacted_revision_returns_snapshot(self):
+        gm = GraphManager(max_changes=3)
+        for i in range(5):
+            gm.add_node("action", f"Step {i}", "desc")
+
+        delta = gm.get_changes_since(0)
+        self.assertTrue(delta['full'])
+        self.assertEqual(len(delta['nodes']), 5)
+        self.assertFalse(gm.get_changes_since(gm.revision - 3)['full'])
+
+        gm.clear_graph()
+        self.assertTrue(gm.get_changes_since(gm.revision - 1)['full'])
+
+    def test_get_graph_since_endpoint(self):
+        rev = self.app.get('/graph').json['revision']
+        response = self.app.get(f'/graph?since={rev}')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json['full'])
+        self.assertEqual(self.app.get('/graph?since=abc').status_code, 400)
+
+    def test_sessions_are_isolated(self):
+        self.app.post('/clear', headers={'X-Session-Id': 'alice'})
+        with patch('claude_integration.ClaudeIntegration.process_query') as mock_process_query:
+            mock_process_query.return_value = {
+                "new_nodes": [{"type": "document", "label": "Passport", "description": "d"}],
+                "new_edges": []
+            }
+            self.app.post('/query', data=json.dumps({"query": "visa"}),
+                          content_type='application/json', headers={'X-Session-Id': 'alice'})
+
+        alice = self.app.get('/graph', headers={'X-Session-Id': 'alice'}).json
+        bob = self.app.get('/graph', headers={'X-Session-Id': 'bob'}).json
+        self.assertEqual(len(alice['nodes']), 1)
+        self.assertEqual(len(bob['nodes']), 0)
+
+        metrics = self.app.get('/metrics').json
+        self.assertGreaterEqual(metrics['sessions']['live_sessions'], 2)
+
+    def test_session_store_evicts_lru_and_expired(self):
+        store = SessionStore(max_sessions=2, ttl_seconds=0, max_bytes=0)
+        a = store.get("a")
+        store.get("b")
+        self.assertIs(store.get("a"), a)
+        store.get("c")
+        self.assertEqual(list(store.sessions), ["a", "c"])
+        self.assertEqual(store.metrics()['evictions']['lru'], 1)
+
+        store = SessionStore(max_sessions=0, ttl_seconds=60, max_bytes=0)
+        store.get("old")
+        store.sessions["old"] = (store.sessions["old"][0], -1000)
+        store.get("new")
+        self.assertEqual(list(store.sessions), ["new"])
+        self.assertEqual(store.metrics()['evictions']['ttl'], 1)
+
+    def test_session_store_evicts_over_memory_budget(self):
+        store = SessionStore(max_sessions=0, ttl_seconds=0, max_bytes=5000)
+        big = store.get("big")
+        for i in range(5):
+            big.add_node("action", f"Step {i}", "desc")
+        self.assertGreater(big.approx_bytes, 5000)
+        store.get("small")
+        self.assertEqual(list(store.sessions), ["small"])
+        self.assertEqual(store.metrics()['evictions']['memory'], 1)
+
+    def test_persistence_round_trip_and_cross_process_reload(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "graphs.db")
+            worker_a = SessionStore(max_sessions=0, ttl_seconds=0, max_bytes=0,
+                                    persistence=SQLitePersistence(path))
+            gm = worker_a.get("s1")
+            n1 = gm.add_node("document", "Passport", "desc")
+            n2 = gm.add_node("action", "DS-160", "desc")
+            gm.add_edge(n1, n2)
+            gm.flush()
+
+            # A second worker (own store, own connection) sees the same graph.
+            worker_b = SessionStore(max_sessions=0, ttl_seconds=0, max_bytes=0,
+                                    persistence=SQLitePersistence(path))
+            other = worker_b.get("s1")
+            self.assertEqual(set(other.graph.nodes), {n1, n2})
+            self.assertEqual(other.graph.edges[n1, n2]['type'], "dependency")
+
+            other.remove_node(n2)
+            other.flush()
+
+            # Worker A notices the write and reloads on its next request.
+            reloaded = worker_a.get("s1")
+            self.assertIsNot(reloaded, gm)
+            self.assertEqual(list(reloaded.graph.nodes), [n1])
+            self.assertGreater(reloaded.revision, gm.revision)
+
+            reloaded.clear_graph()
+            reloaded.flush()
+            self.assertEqual(worker_b.get("s1").graph.number_of_nodes(), 0)
+
+    def test_apply_updates_merges_similar_labels(self):
+        gm = GraphManager()
+        passport = gm.add_node("document", "Passport", "desc")
+        gm.add_node("document", "DS-160", "desc")
+
+        created = gm.apply_updates({
+            "new_nodes": [
+                {"type": "document", "label": "DS-160 Form", "description": "dup"},
+                {"type": "document", "label": "Pasport", "description": "typo"},
+                {"type": "event", "label": "Visa Interview", "description": "new"}
+            ],
+            "new_edges": [
+                {"source_label": "DS-160 Form", "target_label": "Visa Interview", "type": "dependency"},
+                {"source_label": "Passport", "target_label": "DS-160", "type": "dependency"}
+            ]
+        })
+
+        self.assertEqual([n['label'] for n in created], ["Visa Interview"])
+        self.assertEqual(gm.graph.number_of_nodes(), 3)
+        self.assertEqual(gm.graph.number_of_edges(), 2)
+        self.assertEqual(gm.find_node_by_label("passport form"), passport)
+        self.assertIsNone(gm.find_node_by_label("I-20"))
+
+        gm.remove_node(passport)
+        self.assertIsNone(gm.find_node_by_label("Passport"))
+        gm.clear_graph()
+        self.assertIsNone(gm.find_node_by_label("DS-160"))
+
+
+    def test_labels_with_different_form_ids_stay_separate(self):
+        pairs = [("H-2B Visa Petition", "H-1B Visa Petition"), ("F-1 Visa Interview", "J-1 Visa Interview"),
+                 ("I-765", "I-766"), ("I-901", "I-902"), ("I-130", "I-131")]
+        for existing, candidate in pairs:
+            gm = GraphManager()
+            node_id = gm.add_node("document", existing, "desc")
+            self.assertIsNone(gm.find_node_by_label(candidate), candidate)
+            self.assertEqual(gm.find_node_by_label(existing + " Form"), node_id)
+        gm = GraphManager()
+        node_id = gm.add_node("document", "I-765 Work Permit Application", "desc")
+        self.assertEqual(gm.find_node_by_label("I-765 Work Permmit Application"), node_id)
+
+    def test_serialize_graph_context_is_compact(self):
+        gm = GraphManager()
+        n1 = gm.add_node("document", "Passport", "desc", agency="State Dept")
+        n2 = gm.add_node("action", "DS-160", "desc")
+        gm.add_edge(n1, n2, "dependency")
+
+        text = serialize_graph_context(gm.graph, "visa")
+        self.assertIn("n1|document|Passport|pending|State Dept|", text)
+        self.assertIn("n1>n2:dependency", text)
+        self.assertNotIn(n1, text)
+        self.assertEqual(serialize_graph_context(GraphManager().graph), "(empty graph)")
+
+    def test_serialize_graph_context_prunes_to_query_neighborhood(self):
+        gm = GraphManager()
+        ids = [gm.add_node("action", f"Unrelated step number {i}", "desc") for i in range(300)]
+        visa = gm.add_node("event", "Visa Interview", "desc")
+        ds160 = gm.add_node("document", "DS-160", "desc")
+        gm.add_edge(ds160, visa)
+        gm.add_edge(ids[0], ids[1])
+
+        text = serialize_graph_context(gm.graph, "When is my visa interview?", token_budget=300)
+        self.assertLessEqual(estimate_tokens(text), 320)
+        self.assertIn("n1|event|Visa Interview", text)
+        self.assertIn("|DS-160|", text)
+        self.assertIn("n2>n1:dependency", text)
+        self.assertIn("less relevant nodes omitted", text)
+
+    def test_serialize_graph_context_seeds_on_form_ids_not_stopwords(self):
+        gm = GraphManager()
+        for i in range(300):
+            gm.add_node("action", f"Unrelated step number {i}", "desc")
+        for label in ("I-20", "I-765 Work Permit", "I-94 Record"):
+            gm.add_node("document", label, "desc")
+        gm.add_node("event", "Visa Interview", "desc")
+
+        # "I" and "in" are stopwords, so the I-forms aren't pulled in by them
+        text = serialize_graph_context(gm.graph, "Should I bring anything in to my visa interview?",
+                                       token_budget=300)
+        self.assertIn("n1|event|Visa Interview", text)
+        self.assertNotIn("|I-20|", text)
+        self.assertNotIn("|I-765 Work Permit|", text)
+
+        text = serialize_graph_context(gm.graph, "Where do I get my I-20?", token_budget=300)
+        self.assertIn("n1|document|I-20|", text)
+        self.assertNotIn("|I-94 Record|", text)
+
+    @patch('claude_integration.ClaudeIntegration.chat_stream')
+    def test_chat_stream_endpoint_sends_sse(self, mock_chat_stream):
+        mock_chat_stream.return_value = iter(["Hello", " world"])
+        response = self.app.post('/chat/stream', data=json.dumps({"query": "hi"}),
+                                 content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/event-stream'))
+        body = response.get_data(as_text=True)
+        self.assertIn('data: {"text": "Hello"}', body)
+        self.assertIn('data: {"text": " world"}', body)
+        self.assertIn('event: done', body)
+
+        response = self.app.post('/chat/stream', data=json.dumps({}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_chat_stream_yields_chunks_and_falls_back(self):
+        claude = ClaudeIntegration()
+        claude.client = MagicMock()
+        stream = MagicMock()
+        stream.text_stream = iter(["A", "B"])
+        claude.client.messages.stream.return_value.__enter__.return_value = stream
+
+        self.assertEqual(list(claude.chat_stream("hi")), ["A", "B"])
+        self.assertEqual(claude.get_stream_stats()['streams'], 1)
+
+        claude.client.messages.stream.side_effect = RuntimeError("no streaming")
+        claude.client.messages.create.return_value.content = [MagicMock(text="full answer")]
+        self.assertEqual(list(claude.chat_stream("hi")), ["full answer"])
+        self.assertEqual(claude.get_stream_stats()['fallbacks'], 1)
+
+    def test_chat_stream_done_event_reports_its_own_request(self):
+        claude = ClaudeIntegration(client=MagicMock(), cache=ResponseCache(path=""))
+        quiet, busy = MagicMock(), MagicMock()
+        quiet.text_stream = iter(["A", "B"])
+        quiet.get_final_message.return_value = MagicMock(usage=None)  # no usage: keeps the estimate
+        busy.text_stream = iter(["C"])
+        busy.get_final_message.return_value.usage = MagicMock(input_tokens=500, cache_read_input_tokens=0,
+                                                              cache_creation_input_tokens=0)
+        claude.client.messages.stream.return_value.__enter__.side_effect = [quiet, busy]
+
+        first = chat_sse_events(claude, "hi")
+        next(first)
+        list(chat_sse_events(claude, "a much longer question " * 50))  # finishes while the first streams
+        done = json.loads(list(first)[-1].split("data: ", 1)[1])
+        self.assertEqual(claude.chat_stats["last_prompt_tokens"], 500)
+        self.assertLess(done["prompt_tokens"], 500)
+        self.assertGreaterEqual(done["total_ms"], done["ttfb_ms"])
+
+    @patch('async_claude_integration.AsyncClaudeIntegration.process_query', new_callable=AsyncMock)
+    def test_async_app_matches_flask_query_contract(self, mock_process_query):
+        mock_process_query.return_value = {"new_nodes": [{"type": "document", "label": "I-20"}], "new_edges": []}
+
+        async def run():
+            async with TestClient(TestServer(async_app.create_app())) as client:
+                headers = {"X-Session-Id": "async-delta"}
+                revision = (await (await client.get('/graph?since=0', headers=headers)).json())['revision']
+                bad = await client.get('/graph?since=latest', headers=headers)
+                response = await client.post('/query', json={"query": "Where do I get my I-20?", "since": revision},
+                                             headers=headers)
+                covered = await client.post('/query', json={
+                    "query": "I graduated on F-1 last month, what is the OPT deadline?"}, headers=headers)
+                return bad.status, await response.json(), await covered.json()
+
+        threads = []
+        serialize = lambda graph, query: threads.append(threading.get_ident()) or "(empty graph)"
+        with patch('rules_prepass.serialize_graph_context', side_effect=serialize):
+            status, data, covered = asyncio.run(run())
+        self.assertEqual(status, 400)
+        # Same contract as app.py, rules pre-pass included
+        self.assertEqual(mock_process_query.call_count, 1)
+        self.assertTrue(data['rules']['llm'])
+        self.assertEqual((covered['rules']['rules'], covered['rules']['llm']), (['f1_opt_eligibility'], False))
+        self.assertIn('F-1 Graduate Eligible for OPT', [node['data']['label'] for node in covered['graph']['nodes']])
+        self.assertEqual(len(threads), 1)
+        self.assertNotIn(threading.get_ident(), threads)  # kept off the event loop's thread
+        self.assertNotIn('graph', data)
+        self.assertEqual([node['data']['label'] for node in data['changes']['nodes']['added']], ['I-20'])
+
+    def test_async_integration_caps_concurrency(self):
+        async def run():
+            in_flight = []
+            peak = [0]
+
+            async def create(**kwargs):
+                in_flight.append(1)
+                peak[0] = max(peak[0], len(in_flight))
+                await asyncio.sleep(0.01)
+                in_flight.pop()
+                return MagicMock(content=[MagicMock(text='{"items": [{"title": "T"}]}')])
+
+            client = MagicMock()
+            client.messages.create = AsyncMock(side_effect=create)
+            claude = AsyncClaudeIntegration(client=client, limiter=RateLimiter(max_concurrency=3))
+            history = [{"role": "user", "text": "hi"}]
+            results = await asyncio.gather(*[claude.extract_timeline_from_conversation(history) for _ in range(10)])
+            return results, peak[0], claude.limiter.stats
+
+        results, peak, stats = asyncio.run(run())
+        self.assertEqual(results[0], [{"title": "T"}])
+        self.assertLessEqual(peak, 3)
+        self.assertEqual(stats['acquired'], 10)
+        self.assertEqual(stats['in_flight'], 0)
+
+    def test_response_cache_tiers_and_eviction(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'cache.db')
+            cache = ResponseCache(max_entries=2, ttl_seconds=60, path=path)
+            for i in range(3):
+                cache.put(f"k{i}", f"v{i}", latency_ms=100)
+            self.assertEqual(list(cache.entries), ["k1", "k2"])
+            self.assertEqual(cache.get("k2"), "v2")
+
+            # A fresh process only has the disk tier
+            fresh = ResponseCache(max_entries=2, ttl_seconds=60, path=path)
+            self.assertEqual(fresh.get("k0"), "v0")
+            self.assertIsNone(fresh.get("missing"))
+            stats = fresh.metrics()
+            self.assertEqual((stats['disk_hits'], stats['misses'], stats['saved_ms']), (1, 1, 100))
+
+            expired = ResponseCache(ttl_seconds=60, path=path)
+            expired.ttl_seconds = -1
+            self.assertIsNone(expired.get("k1"))
+
+    def test_deterministic_calls_are_cached(self):
+        claude = ClaudeIntegration(client=MagicMock(), cache=ResponseCache(path=""))
+        claude.client.messages.create.return_value.content = [MagicMock(text='{"items": [{"title": "T"}]}')]
+        history = [{"role": "user", "text": "I need OPT"}]
+
+        self.assertEqual(claude.extract_timeline_from_conversation(history), [{"title": "T"}])
+        self.assertEqual(claude.extract_timeline_from_conversation(history), [{"title": "T"}])
+        self.assertEqual(claude.client.messages.create.call_count, 1)
+        claude.extract_timeline_from_conversation(history, use_cache=False)
+        self.assertEqual(claude.client.messages.create.call_count, 2)
+        self.assertEqual(request_key({"b": 1, "a": 2}), request_key({"a": 2, "b": 1}))
+
+        # Unparseable answers are not cached
+        claude.client.messages.create.return_value.content = [MagicMock(text='not json')]
+        self.assertEqual(claude.process_query("q", "(empty graph)"), {"new_nodes": [], "new_edges": []})
+        claude.process_query("q", "(empty graph)")
+        self.assertEqual(claude.client.messages.create.call_count, 4)
+        self.assertEqual(claude.cache.metrics()['bypassed'], 1)
+
+    def test_incremental_timeline_sends_only_new_turns(self):
+        claude = ClaudeIntegration(client=MagicMock(), cache=ResponseCache(path=""))
+        create = claude.client.messages.create
+        create.return_value.content = [MagicMock(text='{"items": [{"title": "File I-20", "description": "old", "relatedDocuments": ["Passport"]}]}')]
+        history = [{"role": "user", "text": "I got into a US college"}, {"role": "assistant", "text": "You need an I-20"}]
+        self.assertEqual(len(claude.extract_timeline_from_conversation(history)), 1)
+
+        create.return_value.content = [MagicMock(text='{"items": [{"title": "File I-20", "description": "new", "relatedDocuments": ["Bank statement"]}, {"title": "Pay SEVIS fee", "description": "d"}]}')]
+        history += [{"role": "user", "text": "What about SEVIS?"}]
+        items = claude.extract_timeline_from_conversation(history)
+
+        content = create.call_args.kwargs["messages"][0]["content"]
+        self.assertIn("- File I-20: old", content)
+        self.assertIn("What about SEVIS?", content)
+        self.assertNotIn("I got into a US college", content)
+        self.assertEqual([i["title"] for i in items], ["File I-20", "Pay SEVIS fee"])
+        self.assertEqual(items[0]["description"], "new")
+        self.assertEqual(items[0]["relatedDocuments"], ["Passport", "Bank statement"])
+
+        self.assertEqual(claude.extract_timeline_from_conversation(history), items)
+        self.assertEqual(create.call_count, 2)
+        self.assertEqual(claude.timeline_stats, {"full": 1, "incremental": 1, "reused": 1})
+
+    def test_conversation_window_folds_old_turns(self):
+        window = ConversationWindow(max_turns=4, history_tokens=1000, fold_step=2)
+        history = []
+        for i in range(5):
+            history += [{"role": "user", "text": f"question {i}"}, {"role": "assistant", "text": f"answer {i}"}]
+
+        plan = window.plan(history, "claude-3-haiku-20240307")
+        self.assertEqual(plan["turns"][0], ("user", "question 3"))
+        self.assertEqual((len(plan["turns"]), plan["folded"], len(plan["to_fold"])), (4, 6, 6))
+        window.remember(plan["key"], "summary of 0-2")
+
+        # One more exchange slides the window by two turns; only those get folded
+        history += [{"role": "user", "text": "question 5"}, {"role": "assistant", "text": "answer 5"}]
+        plan = window.plan(history, "claude-3-haiku-20240307")
+        self.assertEqual(plan["summary"], "summary of 0-2")
+        self.assertEqual(plan["to_fold"], [("user", "question 3"), ("assistant", "answer 3")])
+
+        # The token budget shrinks the window further, still starting on a user turn
+        tight = ConversationWindow(max_turns=4, history_tokens=6, fold_step=1).plan(history, "m")
+        self.assertEqual(tight["turns"], [("user", "question 5"), ("assistant", "answer 5")])
+
+    def test_chat_summarizes_once_per_slide_and_pins_documents(self):
+        claude = ClaudeIntegration(client=MagicMock())
+        claude.window = ConversationWindow(max_turns=2, history_tokens=1000, fold_step=2)
+        create = claude.client.messages.create
+        create.return_value.content = [MagicMock(text="reply")]
+        create.return_value.usage.input_tokens = 321
+        history = [{"role": "user", "text": "I study at CMU"}, {"role": "assistant", "text": "Great"},
+                   {"role": "user", "text": "I am from Singapore"}, {"role": "assistant", "text": "Noted"}]
+        files = [{"filename": "i20.pdf", "content": "I-20 text", "type": "pdf", "pages": 1}]
+
+        claude.chat("What about OPT?", history, files, session_id="s1")
+        summary_request, chat_request = [c.kwargs for c in create.call_args_list]
+        self.assertIn("I study at CMU", summary_request["messages"][0]["content"])
+        self.assertEqual(chat_request["system"][1]["text"], "Summary of the earlier conversation:\nreply")
+        self.assertEqual(chat_request["messages"][0]["content"], "I am from Singapore")
+
+        claude.chat("And CPT?", history, session_id="s1")
+        self.assertEqual(create.call_count, 3)  # summary reused
+        self.assertIn("I-20 text", create.call_args.kwargs["messages"][-1]["content"])
+        claude.chat("And CPT?", history, session_id="s2")
+        self.assertNotIn("UPLOADED DOCUMENTS", create.call_args.kwargs["messages"][-1]["content"])
+        self.assertEqual(claude.get_chat_stats()["last_prompt_tokens"], 321)
+        self.assertEqual(claude.get_chat_stats()["summaries"], 1)
+
+    def test_prompt_cache_markers_and_usage(self):
+        class StubMessages:
+            def __init__(self):
+                self.requests = []
+
+            def create(self, **request):
+                self.requests.append(request)
+                usage = MagicMock(input_tokens=50, output_tokens=10, cache_read_input_tokens=900,
+                                  cache_creation_input_tokens=0)
+                return MagicMock(content=[MagicMock(text='{"new_nodes": [], "new_edges": [], "items": []}')], usage=usage)
+
+        stub = StubMessages()
+        claude = ClaudeIntegration(client=MagicMock(messages=stub), cache=ResponseCache(path=""))
+        history = [{"role": "user", "text": "I am on F-1"}, {"role": "assistant", "text": "OK"}]
+        claude.process_query("OPT?", "(empty graph)")
+        claude.extract_timeline_from_conversation(history)
+        claude.chat("And CPT?", history)
+
+        def breakpoints(content):
+            return [] if isinstance(content, str) else [b["text"] for b in content if "cache_control" in b]
+
+        query, timeline, chat = stub.requests
+        for request in (query, timeline, chat):
+            self.assertEqual(len(breakpoints(request["system"])), 1)
+            self.assertEqual(request["system"][0]["cache_control"], {"type": "ephemeral"})
+        # Only the stable history prefix is cached in chat, not the new question
+        self.assertEqual([breakpoints(m["content"]) for m in chat["messages"]], [[], ["OK"], []])
+        self.assertIn("And CPT?", prompt_text(chat))
+
+        usage = claude.get_usage_stats()
+        self.assertEqual((usage["responses"], usage["cache_read_input_tokens"]), (3, 2700))
+        self.assertEqual(usage["cache_read_ratio"], round(900 / 950, 3))
+        self.assertEqual(claude.get_chat_stats()["last_prompt_tokens"], 950)
+
+    def test_json_item_stream_emits_objects_as_they_close(self):
+        text = ('```json\n{"new_nodes": [{"label": "I-20", "note": "a \\"}\\" brace"}, {"label": "DS-160"}],\n'
+                ' "new_edges": [{"source_label": "I-20", "target_label": "DS-160", "type": "dependency"}, {"source_label": "DS')
+        parser = JsonItemStream()
+        emitted = []
+        for i in range(0, len(text), 7):
+            emitted.append(parser.feed(text[i:i + 7]))
+        flat = [item for chunk in emitted for item in chunk]
+        self.assertEqual([(k, v.get("label", v.get("target_label"))) for k, v in flat],
+                         [("new_nodes", "I-20"), ("new_nodes", "DS-160"), ("new_edges", "DS-160")])
+        self.assertEqual(flat[0][1]["note"], 'a "}" brace')
+        # Each object is emitted in the chunk where it closes, not at the end
+        self.assertGreater(sum(1 for chunk in emitted if chunk), 1)
+
+        claude = ClaudeIntegration(client=MagicMock(), cache=ResponseCache(path=""))
+        claude.client.messages.create.return_value.content = [MagicMock(text=text)]
+        updates = claude.process_query("visa", "(empty graph)")
+        self.assertEqual(len(updates["new_nodes"]), 2)
+        self.assertEqual(len(updates["new_edges"]), 1)
+        self.assertEqual(claude.cache.metrics()["entries"], 0)
+
+    @patch('claude_integration.ClaudeIntegration.process_query_stream')
+    def test_query_stream_endpoint_applies_items_progressively(self, mock_stream):
+        mock_stream.return_value = iter([
+            ("new_nodes", {"type": "document", "label": "I-20"}),
+            ("new_nodes", {"type": "action", "label": "Pay SEVIS Fee"}),
+            ("new_edges", {"source_label": "I-20", "target_label": "Pay SEVIS Fee", "type": "dependency"}),
+        ])
+        response = self.app.post('/query/stream', data=json.dumps({"query": "F-1 steps"}),
+                                 content_type='application/json', headers={"X-Session-Id": "stream-test"})
+        self.assertTrue(response.content_type.startswith('text/event-stream'))
+        events = [json.loads(line[len("data: "):]) for line in response.get_data(as_text=True).splitlines()
+                  if line.startswith("data: ")]
+        self.assertEqual([e.get("kind") for e in events], ["new_nodes", "new_nodes", "new_edges", None])
+        self.assertEqual(len(events[0]["changes"]["nodes"]["added"]), 1)
+        self.assertEqual(len(events[2]["changes"]["edges"]["added"]), 1)
+        self.assertEqual((events[-1]["nodes"], events[-1]["edges"]), (2, 1))
+        # Items carry structure only; the layout runs once, for the done event
+        self.assertNotIn("position", events[1]["changes"]["nodes"]["added"][0])
+        self.assertNotIn("positions", events[1]["changes"])
+        self.assertEqual(len(events[-1]["positions"]), 2)
+
+    @patch('claude_integration.ClaudeIntegration.process_query_stream')
+    def test_query_stream_answers_covered_questions_from_rules(self, mock_stream):
+        response = self.app.post('/query/stream', data=json.dumps({
+            "query": "I graduated on F-1 last month, what is the OPT deadline?"}),
+            content_type='application/json', headers={"X-Session-Id": "stream-rules"})
+        mock_stream.assert_not_called()
+        events = [json.loads(line[len("data: "):]) for line in response.get_data(as_text=True).splitlines()
+                  if line.startswith("data: ")]
+        self.assertEqual(events[0]["item"]["label"], 'F-1 Graduate Eligible for OPT')
+        self.assertEqual((events[-1]["nodes"], events[-1]["edges"]), (1, 0))
+
+    def test_parallel_pdf_extraction_matches_serial_and_honors_budget(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bundle.pdf')
+            write_text_pdf(path, 40, lines_per_page=3)
+            serial = extract_text_from_pdf(path, workers=1)
+            parallel = extract_text_from_pdf(path, workers=3)
+            self.assertEqual(serial['text'], parallel['text'])
+            self.assertIn('section 39 line 2', parallel['text'])
+            self.assertNotIn('truncated', parallel)
+
+            budgeted = extract_text_from_pdf(path, max_pages=10, workers=3)
+            self.assertEqual((budgeted['pages'], budgeted['pages_extracted']), (40, 10))
+            self.assertTrue(budgeted['truncated'])
+            self.assertNotIn('section 10 ', budgeted['text'])
+
+    def test_broken_pdf_pool_is_replaced(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bundle.pdf')
+            write_text_pdf(path, 40, lines_per_page=3)
+            broken = MagicMock()
+            broken.submit.side_effect = BrokenProcessPool("worker died")
+            original, file_parser._pdf_pool = file_parser._pdf_pool, broken
+            if original is not None:
+                original.shutdown()
+            result = extract_text_from_pdf(path, workers=3)
+            self.assertIsNone(file_parser._pdf_pool)  # the next call starts a fresh pool
+            broken.shutdown.assert_called_once()
+            self.assertEqual(result['text'], extract_text_from_pdf(path, workers=1)['text'])
+
+    def test_parse_cache_skips_reparsing_same_bytes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = ParseCache(path=os.path.join(tmp, 'parse.db'))
+            first = os.path.join(tmp, 'passport.pdf')
+            write_text_pdf(first, 2, lines_per_page=2)
+            result = extract_text_cached(first, cache)
+
+            # Same bytes under another name, in a fresh process with only the disk tier
+            second = os.path.join(tmp, 'passport (1).pdf')
+            with open(first, 'rb') as src, open(second, 'wb') as dst:
+                dst.write(src.read())
+            fresh = ParseCache(path=os.path.join(tmp, 'parse.db'))
+            with patch('file_parser.PdfReader') as reader:
+                self.assertEqual(extract_text_cached(second, fresh), result)
+                reader.assert_not_called()
+            self.assertEqual(fresh.metrics()['disk_hits'], 1)
+
+            with open(second, 'ab') as f:
+                f.write(b'\n% edited')
+            self.assertIsNone(fresh.get(parse_cache_key(second)))
+
+    def test_upload_streams_multipart_parts(self):
+        response = self.app.post('/upload', content_type='multipart/form-data', data={
+            'note': 'ignored field',
+            'files': [(io.BytesIO(b'I-20 issued by CMU\r\n--not a boundary'), 'i20.txt'),
+                      (io.BytesIO(b'\x89PNG'), 'passport.png')],
+        })
+        self.assertEqual(response.status_code, 200)
+        files = response.get_json()['files']
+        self.assertEqual([f['filename'] for f in files], ['i20.txt', 'passport.png'])
+        self.assertNotIn('content', files[0])
+        self.assertIn('Unsupported file type', files[1]['error'])
+
+        document = self.app.get(f"/documents/{files[0]['document_id']}?pages=1").get_json()
+        self.assertEqual(document['text'], [{'page': 1, 'text': 'I-20 issued by CMU\n--not a boundary'}])
+        self.assertEqual(self.app.get('/documents/' + '0' * 32).status_code, 404)
+
+        response = self.app.post('/upload', data='x', content_type='text/plain')
+        self.assertEqual(response.status_code, 400)
+
+    def test_document_store_extracts_pages_lazily(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'upload.pdf')
+            write_text_pdf(path, 60, lines_per_page=3)
+            store = DocumentStore(directory=os.path.join(tmp, 'documents'), parse_cache=ParseCache())
+            entry = store.add(path, 'i20.pdf')
+            self.assertEqual(entry['pages'], 60)
+            self.assertEqual(store.metrics()['pages_extracted'], 0)
+
+            pages = store.pages(entry['document_id'], 4, 6)
+            self.assertIn('section 5 line 0', pages[1])
+            self.assertEqual(store.metrics()['pages_extracted'], 2)
+
+            # Searching indexes every page once; the matching chunk comes from page 48
+            ref = {'document_id': entry['document_id'], 'filename': 'i20.pdf'}
+            excerpt = store.excerpt(ref, 'What does section 47 say?')
+            self.assertTrue(excerpt['content'].startswith('[page 48]'))
+            self.assertEqual(store.metrics()['pages_extracted'], 60)
+            ranged = store.excerpt(dict(ref, page_range='2-3'), 'anything')
+            self.assertEqual(ranged['content'].count('[page '), 2)
+
+            # Chat requests carry only the id; the excerpt is resolved server-side
+            claude = ClaudeIntegration(client=MagicMock(), documents=store)
+            claude.client.messages.create.return_value.content = [MagicMock(text='reply')]
+            claude.chat('What does section 47 say?', [], [{'document_id': entry['document_id']}], session_id='s1')
+            message = claude.client.messages.create.call_args.kwargs['messages'][-1]['content']
+            self.assertIn('Document: i20.pdf (PDF, 60 pages)', message)
+            self.assertIn('section 47 line 2', message)
+            self.assertIn('not found', store.excerpt({'document_id': 'f' * 32}, 'q')['error'])
+
+    def test_repeat_uploads_skip_parsing(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = ParseCache()
+            pdf, txt = os.path.join(tmp, 'upload.pdf'), os.path.join(tmp, 'notes.txt')
+
+            def upload(store, path, name):
+                if path == pdf:
+                    write_text_pdf(path, 5, lines_per_page=2)
+                else:
+                    with open(path, 'w') as f:
+                        f.write('OPT notes ' * 50)
+                return store.add(path, name)
+
+            store = DocumentStore(directory=os.path.join(tmp, 'a'), parse_cache=cache)
+            first = [upload(store, pdf, 'i20.pdf'), upload(store, txt, 'notes.txt')]
+            with patch('document_store.PdfReader') as reader, \
+                    patch('file_parser.extract_text_from_file') as extract:
+                # Same store: the stored entry is returned as is
+                self.assertEqual([upload(store, pdf, 'i20.pdf'), upload(store, txt, 'notes.txt')], first)
+                self.assertEqual(store.metrics()['documents_reused'], 2)
+                # Another store (another instance) with the shared parse cache
+                other = DocumentStore(directory=os.path.join(tmp, 'b'), parse_cache=cache)
+                self.assertEqual([upload(other, pdf, 'i20.pdf'), upload(other, txt, 'notes.txt')], first)
+                reader.assert_not_called()
+                extract.assert_not_called()
+            self.assertIn('OPT notes', other.pages(first[1]['document_id'])[0])
+
+    def test_stream_uploads_without_store_returns_cached_text(self):
+        body = (b'--XyZ\r\nContent-Disposition: form-data; name="files"; filename="a.txt"\r\n\r\n'
+                b'hello visa\r\n--XyZ--\r\n')
+        cache = ParseCache()
+        first = stream_uploads(io.BytesIO(body), 'multipart/form-data; boundary=XyZ', len(body), parse_cache=cache)
+        self.assertEqual((first[0]['filename'], first[0]['content'], first[0]['error']), ('a.txt', 'hello visa', None))
+        with patch('file_parser.extract_text_from_file') as extract:
+            again = stream_uploads(io.BytesIO(body), 'multipart/form-data; boundary=XyZ', len(body),
+                                   parse_cache=cache)
+            extract.assert_not_called()
+        self.assertEqual(again, first)
+
+    def test_document_store_ttl_tracks_in_memory_use(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = DocumentStore(directory=os.path.join(tmp, 'documents'), ttl_seconds=1000)
+            entries = []
+            for name in ('used.txt', 'idle.txt'):
+                path = os.path.join(tmp, name)
+                with open(path, 'w') as f:
+                    f.write(f'{name} contents')
+                entries.append(store.add(path, name)['document_id'])
+            used, idle = entries
+            old = time.time() - 2000
+            for document_id in entries:
+                os.utime(store._meta_path(document_id), (old, old))
+                store.loaded[document_id]['touched_at'] = old
+
+            # A hit served from memory still refreshes the file's mtime
+            self.assertIsNotNone(store.info(used))
+            self.assertGreater(os.path.getmtime(store._meta_path(used)), old)
+
+            # The directory scan is rate-limited; once due, it drops expired documents from memory too
+            store._prune()
+            self.assertIn(idle, store.loaded)
+            store._pruned_at = 0.0
+            store._prune()
+            self.assertNotIn(idle, store.loaded)
+            self.assertFalse(os.path.exists(store._meta_path(idle)))
+            self.assertIsNone(store.info(idle))
+            self.assertIsNotNone(store.info(used))
+
+    def test_bm25_index_is_incremental_and_budgeted(self):
+        index = BM25Index(chunk_chars=60)
+        index.add('a', [(0, 'The I-20 lists your program end date.\nTravel needs a valid signature.')])
+        self.assertEqual(index.search('program end date')[0][:2], ('a', 0))
+        # Postings added after a search are picked up by the next one
+        index.add('b', [(2, 'OPT applications are due within 60 days of the program end date.')])
+        self.assertEqual(index.add('b', [(0, 'ignored')]), 0)
+        self.assertEqual(index.search('OPT 60 days')[0][:2], ('b', 2))
+        self.assertEqual(index.search('OPT program', sources=['a'])[0][0], 'a')
+        # The 15-token chunk doesn't fit the budget; smaller ones further down do
+        self.assertEqual([text for _, _, text in index.search('program date', token_budget=12)],
+                         ['The I-20 lists your program end date.', 'date.'])
+        self.assertEqual(index.search('unrelated words'), [])
+
+    def test_chat_retrieves_relevant_chunks_across_session_documents(self):
+        claude = ClaudeIntegration(client=MagicMock())
+        claude.client.messages.create.return_value.content = [MagicMock(text='reply')]
+        filler = '\n'.join(f'Line {i} about enrollment records and school addresses.' for i in range(400))
+        files = [{'filename': 'handbook.txt', 'type': 'Text File', 'pages': 1,
+                  'content': filler + '\nSEVIS transfer release must be requested before the I-20 end date.'},
+                 {'filename': 'notes.txt', 'type': 'Text File', 'pages': 1, 'content': 'Unrelated notes.'}]
+
+        claude.chat('How do I request a SEVIS transfer release?', [], files, session_id='s1')
+        message = claude.client.messages.create.call_args.kwargs['messages'][-1]['content']
+        self.assertIn('SEVIS transfer release must be requested', message)  # deep past the old 4000-char cut
+        self.assertLess(estimate_tokens(message), claude.window.document_tokens + 200)
+
+        claude.chat('And the I-20 end date?', [], session_id='s1')
+        self.assertIn('before the I-20 end date', claude.client.messages.create.call_args.kwargs['messages'][-1]['content'])
+        self.assertEqual(claude.retrieval.metrics()['sources_indexed'], 2)  # indexed once per session
+
+    def test_condition_index_matches_linear_scan(self):
+        engine = RulesEngine('rules.json')
+        facts = {'visa_type': 'F-1', 'military_service': True, 'military_service_months': 6}
+        self.assertEqual([r['id'] for r in engine.find_applicable_rules(facts)],
+                         ['f1_military_termination', 'oie_notification'])
+
+        rng = random.Random(3)
+        rules = synthetic_rules(2000, rng) + [
+            {'id': 'always', 'condition': {}},
+            {'id': 'presence', 'condition': {'age': 2.5}},
+            {'id': 'window', 'condition': {'age': {'gt': 20, 'lt': 30}}},
+            {'id': 'flag', 'condition': {'dependents': True, 'age': {'lt': 40}}}]
+        engine = RulesEngine(rules=rules)
+        for _ in range(200):
+            facts = synthetic_facts(rng)
+            self.assertEqual(engine.find_applicable_rules(facts), linear_scan(engine, facts))
+        self.assertLess(len(engine.condition_index.candidates(facts)), 100)
+        self.assertEqual([r['id'] for r in engine.find_applicable_rules({'age': 'unknown', 'tags': ['a']})],
+                         ['always', 'presence'])
+
+    def test_dependency_graph_matches_recursive_walk(self):
+        engine = RulesEngine('rules.json')
+        facts = {'visa_type': 'F-1', 'opt_approved': True, 'employer_sponsoring': True, 'status': 'graduated'}
+        self.assertEqual(engine.build_dependency_graph(facts), recursive_dependency_graph(engine, facts))
+
+        rules = synthetic_dag(300, 30, random.Random(1))
+        rules[5]['depends_on'].append('missing_rule')
+        rules[1]['depends_on'] = ['rule_2']
+        rules[2]['depends_on'] = ['rule_1']  # a cycle
+        for rule in rules[::7]:
+            rule['condition'] = {'stage': 'final'}
+        engine = RulesEngine(rules=rules)
+        facts = {'stage': 'final'}
+        expected = recursive_dependency_graph(engine, facts)
+        self.assertEqual(engine.build_dependency_graph(facts), expected)
+        self.assertEqual(engine.build_dependency_graph(facts), expected)  # from cached closures
+        self.assertLessEqual({'rule_1', 'rule_2'}, engine.rule_graph.cyclic)
+        self.assertNotIn('rule_0', engine.rule_graph.cyclic)
+        order = {rule_id: i for i, rule_id in enumerate(engine.rule_graph.topological_order)}
+        self.assertTrue(all(order[dep] < order[rule['id']] for rule in rules if rule['id'] in order
+                            for dep in rule['depends_on'] if dep in order))
+
+        # Far deeper than the recursion limit
+        chain = [{'id': f'r{i}', 'name': f'R{i}', 'condition': {'go': True} if i == 5000 else {'go': False},
+                  'depends_on': [f'r{i - 1}'] if i else []} for i in range(5001)]
+        graph = RulesEngine(rules=chain).build_dependency_graph({'go': True})
+        self.assertEqual((len(graph['nodes']), graph['nodes'][-1]['depth']), (5001, 5000))
+
+    def test_batch_evaluation_matches_per_profile_calls(self):
+        rng = random.Random(4)
+        rules = synthetic_rules(300, rng)
+        rules[0].update(condition={'visa_type': 'F-1', 'age': {'gt': 40}}, deadline_days=10.5)
+        rules.append({'id': 'everyone', 'name': 'Everyone', 'condition': {}, 'deadline_days': 5})
+        engine = RulesEngine(rules=rules)
+        profiles = synthetic_profiles(400, rng)
+        profiles[0] = {'visa_type': 'F-1', 'age': 50, 'military_notice_date': '2024-01-31'}
+        profiles[1]['military_notice_date'] = 'not a date'
+        profiles[2]['age'] = 'unknown'
+        profiles.append({})
+
+        expected = per_profile(engine, profiles)
+        self.assertEqual(engine.evaluate_batch(to_columns(profiles)), expected)
+        self.assertIn('rule_0', expected[0]['matches'])
+        self.assertEqual(engine.evaluate_batch(to_columns(profiles), with_timeline=False),
+                         [{'matches': result['matches'], 'timeline': []} for result in expected])
+        with self.assertRaises(ValueError):
+            engine.evaluate_batch({'age': [1, 2], 'status': ['enrolled']})
+
+        broken = MagicMock()
+        broken.submit.side_effect = BrokenProcessPool("worker died")
+        original, rules_batch._batch_pool = rules_batch._batch_pool, (2, broken)
+        if original is not None:
+            original[1].shutdown()
+        self.assertEqual(engine.evaluate_batch(to_columns(profiles), workers=2), expected)
+        self.assertIsNone(rules_batch._batch_pool)  # the next call starts a fresh pool
+        broken.shutdown.assert_called_once()
+
+    def test_parse_deadline(self):
+        self.assertEqual(parse_deadline('Within 60 days of graduation'), ([('graduation', 0)], [('graduation', 60)]))
+        self.assertEqual(parse_deadline('2 weeks before the visa expiry date'), ([], [('visa expiry', -14)]))
+        self.assertEqual(parse_deadline('within 30 days'), ([], [('', 30)]))
+        self.assertEqual(parse_deadline('By 2024-05-01')[1][0][1], 739007)
+        self.assertEqual(parse_deadline(None), ([], []))
+        self.assertEqual(anchor_key('military_notice_date'), 'military notice')
+
+    def test_schedule_propagates_dates_and_slack(self):
+        graph_manager = GraphManager()
+        apply = graph_manager.add_node('action', 'Apply for OPT', '', deadline='Within 60 days of graduation')
+        ead = graph_manager.add_node('action', 'Receive EAD', '', deadline='2024-09-01')
+        start = graph_manager.add_node('action', 'Start job', '', deadline='within 2 weeks')
+        graph_manager.add_node('action', 'Unrelated', '')
+        graph_manager.update_node(ead, duration_days=90)
+        graph_manager.add_edge(apply, ead)
+        graph_manager.add_edge(ead, start)
+
+        schedule = graph_manager.get_schedule({'graduation': '2024-05-15'})
+        self.assertEqual(set(schedule['nodes']), {apply, ead, start})
+        self.assertEqual(schedule['nodes'][ead], {
+            'earliest_start': '2024-05-15', 'earliest_finish': '2024-08-13',
+            'latest_start': '2024-05-29', 'latest_finish': '2024-08-27', 'slack': 14, 'critical': False})
+        self.assertEqual(schedule['critical_path'], [apply, ead, start])
+
+        # Too late for the fixed EAD date; the job start keeps its own two weeks
+        schedule = graph_manager.get_schedule({'graduation': '2024-06-20'})
+        self.assertEqual([schedule['nodes'][n]['slack'] for n in (apply, ead, start)], [-17, -17, 14])
+        self.assertTrue(schedule['nodes'][ead]['critical'])
+        self.assertEqual(schedule['critical_path'], [apply, ead])
+        graph_manager.add_edge(start, apply)  # cycle: no dates for any of them
+        self.assertEqual(graph_manager.get_schedule()['nodes'], {})
+        graph_manager.remove_node(start)
+        self.assertEqual(graph_manager.get_schedule()['nodes'][ead]['slack'], -17)
+
+        response = self.app.post('/schedule', data=json.dumps({'anchors': {'graduation': 'soon'}}),
+                                 content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_incremental_schedule_matches_full_recompute(self):
+        rng = random.Random(9)
+        scheduler = synthetic_schedule(600, 12, rng)
+        for step in range(300):
+            choice = rng.randrange(5)
+            node_id = rng.randrange(600)
+            if choice == 0:
+                scheduler.set_anchor('graduation', f'2024-0{rng.randrange(1, 10)}-15')
+            elif choice == 1 and node_id in scheduler.specs:
+                _, releases, dues = scheduler.specs[node_id]
+                scheduler.set_node(node_id, rng.randrange(10), releases, dues)
+            elif choice == 2 and node_id in scheduler.specs:
+                scheduler.add_edge(node_id, rng.choice(list(scheduler.specs)))  # may close a cycle
+            elif choice == 3 and scheduler.successors.get(node_id):
+                scheduler.remove_edge(node_id, next(iter(scheduler.successors[node_id])))
+            elif choice == 4 and step % 10 == 0:
+                scheduler.remove_node(node_id)
+            if step % 7 == 0:
+                expected = dates(scheduler)
+                scheduler.recompute()
+                self.assertEqual(dates(scheduler), expected)
+
+    def test_rules_snapshot_goes_to_temp_dir_on_vercel(self):
+        with patch.dict(os.environ, {'VERCEL': '1'}):
+            os.environ.pop('LEGOL_RULES_SNAPSHOT', None)
+            self.assertEqual(snapshot_path('/var/task/backend/rules.json'),
+                             os.path.join(tempfile.gettempdir(), 'rules.compiled'))
+            os.environ['LEGOL_RULES_SNAPSHOT'] = '/data/rules.compiled'
+            self.assertEqual(snapshot_path('/var/task/backend/rules.json'), '/data/rules.compiled')
+
+    def test_rules_snapshot_is_versioned_by_source(self):
+        with tempfile.TemporaryDirectory() as directory:
+            rules_file = os.path.join(directory, 'rules.json')
+            with open(rules_file, 'w') as f:
+                json.dump({'rules': synthetic_rules(50, random.Random(2))}, f)
+            compiled = compile_rules(rules_file)
+            facts = synthetic_facts(random.Random(3))
+            with patch('rules_snapshot.compile_rules') as recompile:
+                engine = load_rules(rules_file)
+                recompile.assert_not_called()
+            self.assertEqual(engine.find_applicable_rules(facts), compiled.find_applicable_rules(facts))
+            self.assertEqual(engine.rule_graph.topological_order, compiled.rule_graph.topological_order)
+
+            with open(rules_file, 'w') as f:
+                json.dump({'rules': [{'id': 'only', 'name': 'Only', 'condition': {}}]}, f)
+            self.assertEqual([rule['id'] for rule in load_rules(rules_file).rules], ['only'])
+            with open(snapshot_path(rules_file), 'wb') as f:
+                f.write(b'not a pickle')
+            self.assertEqual([rule['id'] for rule in load_rules(rules_file).rules], ['only'])
+
+            with open(rules_file, 'w') as f:
+                json.dump({'rules': [{'id': 'a', 'name': 'A'}, {'id': 'a', 'deadline_days': '30'}]}, f)
+            with self.assertRaises(ValueError) as error:
+                compile_rules(rules_file)
+            self.assertIn('a: duplicate id', str(error.exception))
+            self.assertIn('deadline_days must be a number', str(error.exception))
+
+    def test_rules_reloader_swaps_in_changed_rules(self):
+        with tempfile.TemporaryDirectory() as directory:
+            rules_file = os.path.join(directory, 'rules.json')
+            with open(rules_file, 'w') as f:
+                json.dump({'rules': [{'id': 'old', 'name': 'Old', 'condition': {}}]}, f)
+            reloader = RulesReloader(rules_file, interval=0)
+            in_flight = reloader.get()
+
+            with open(rules_file, 'w') as f:
+                json.dump({'rules': [{'id': 'new', 'name': 'New', 'condition': {}}, {'id': 'more', 'name': 'More'}]}, f)
+            reloader.get()
+            reloader.wait()
+            self.assertEqual([rule['id'] for rule in reloader.get().find_applicable_rules({})], ['new', 'more'])
+            self.assertEqual([rule['id'] for rule in in_flight.rules], ['old'])
+
+            with open(rules_file, 'w') as f:
+                f.write('{"rules": [')
+            reloader.get()
+            reloader.wait()
+            self.assertEqual(len(reloader.get().rules), 2)
+            self.assertEqual((reloader.metrics()['reloads'], reloader.metrics()['reload_errors']), (1, 1))
+
+    def test_extract_facts_from_query(self):
+        facts, _, _ = extract_facts("I'm on F-1 and got drafted into the army for two years")
+        self.assertEqual(facts, {'visa_type': 'F-1', 'military_service': True, 'military_service_months': 24})
+        facts, _, _ = extract_facts("My OPT is approved and my employer will sponsor me for H-1B")
+        self.assertEqual(facts, {'visa_type': 'F-1', 'opt_approved': True, 'employer_sponsoring': True})
+        self.assertEqual(extract_facts("I have 3 months left on my J-1")[0], {'visa_type': 'J-1'})
+
+    def test_extract_facts_skips_negated_future_and_third_party_facts(self):
+        for query_text in ["I'm on F-1 and will graduate next month", "I'm on F-1, graduating in 2 years",
+                           "I'm on F-1 and did not graduate", "I'm on F-1 and haven't graduated yet"]:
+            self.assertEqual(extract_facts(query_text)[0], {'visa_type': 'F-1'}, query_text)
+        facts, _, hedged = extract_facts("I'm an F-1 student and my brother did national service for 2 years")
+        self.assertEqual((facts, hedged), ({'visa_type': 'F-1'}, {'military_service'}))
+        self.assertEqual(extract_facts("I'm on F-1 and have no military service")[2], {'military_service'})
+
+    def test_query_prepass_covers_only_applicable_asserted_rules(self):
+        prepass = QueryPrepass(RulesReloader())
+        for query_text in ["I'm on F-1 and will graduate next month. What is the OPT deadline?",
+                           "I'm on F-1, graduating in 2 years. What is the OPT deadline?",
+                           "I'm on F-1 and did not graduate. What is the OPT deadline?",
+                           "I'm on F-1 and haven't graduated yet. What is the OPT deadline?",
+                           "I'm an F-1 student and my brother did national service. What happens?"]:
+            result = prepass.run(query_text)
+            self.assertFalse(result['covered'], query_text)
+            self.assertNotIn('f1_opt_eligibility', result['rule_ids'], query_text)
+        # oie_notification applies, but the termination rule it depends on needs more than 5 months
+        result = prepass.run("F-1 student, military service 3 months")
+        self.assertEqual(result['unsupported'], ['f1_military_termination'])
+        self.assertFalse(result['covered'])
+        self.assertTrue(prepass.run("I graduated on F-1 last month, what is the OPT deadline?")['covered'])
+
+    @patch('claude_integration.ClaudeIntegration.process_query')
+    def test_query_rules_prepass(self, mock_process_query):
+        # Fully covered by rules.json: no model call
+        response = self.app.post('/query', data=json.dumps({
+            "query": "I'm an F-1 student and have to do military service for 8 months. What happens to my status?"}),
+            content_type='application/json')
+        mock_process_query.assert_not_called()
+        data = response.json
+        self.assertEqual(data['rules']['rules'], ['f1_military_termination', 'oie_notification'])
+        self.assertFalse(data['rules']['llm'])
+        labels = {node['id']: node['data']['label'] for node in data['graph']['nodes']}
+        self.assertEqual(sorted(labels.values()), ['F-1 Status Terminates (Military > 5 months)',
+                                                   'Notify CMU OIE of Military Leave'])
+        edge = data['graph']['edges'][0]
+        self.assertEqual((labels[edge['source']], labels[edge['target']]),
+                         ('F-1 Status Terminates (Military > 5 months)', 'Notify CMU OIE of Military Leave'))
+
+        # Partly covered: the rule steps go in first, and the model is asked only about the rest
+        mock_process_query.return_value = {
+            "new_nodes": [{"label": "Check scholarship terms"}],
+            "new_edges": [{"source_label": "Notify CMU OIE of Military Leave", "target_label": "Check scholarship terms",
+                           "type": "dependency"}]}
+        response = self.app.post('/query', data=json.dumps({
+            "query": "I'm an F-1 student doing military service for 6 months, will my scholarship be affected?"}),
+            content_type='application/json', headers={"X-Session-Id": "prepass-partial"})
+        model_query, context = mock_process_query.call_args[0][:2]
+        self.assertEqual(model_query, 'will my scholarship be affected?')
+        self.assertIn('Already handled by the rules engine', context)
+        self.assertIn('Notify CMU OIE of Military Leave', context)
+        self.assertTrue(response.json['rules']['llm'])
+        labels = {node['id']: node['data']['label'] for node in response.json['graph']['nodes']}
+        self.assertEqual(sorted(labels.values()), ['Check scholarship terms',
+                                                   'F-1 Status Terminates (Military > 5 months)',
+                                                   'Notify CMU OIE of Military Leave'])
+        self.assertIn(('Notify CMU OIE of Military Leave', 'Check scholarship terms'),
+                      [(labels[edge['source']], labels[edge['target']]) for edge in response.json['graph']['edges']])
+
+        # Rules whose own conditions the facts don't meet stay out of the graph
+        response = self.app.post('/query', data=json.dumps({"query": "F-1 student, military service 3 months"}),
+                                 content_type='application/json', headers={"X-Session-Id": "prepass-unsupported"})
+        self.assertIn('Notify CMU OIE of Military Leave',
+                      [node['data']['label'] for node in response.json['graph']['nodes']])
+        self.assertNotIn('F-1 Status Terminates (Military > 5 months)',
+                         [node['data']['label'] for node in response.json['graph']['nodes']])
+        metrics = self.app.get('/metrics').json['query_rules']
+        self.assertGreaterEqual(metrics['served_by_rules'], 1)
+
+    def test_multipart_parser_handles_any_chunking(self):
+        body = (b'--XyZ\r\nContent-Disposition: form-data; name="files"; filename="a.txt"\r\n\r\n'
+                b'hello\r\n--XyZ\r\nContent-Disposition: form-data; name="files"; filename="b.txt"\r\n\r\n'
+                b'wor\r\nld\r\n--XyZ--\r\n')
+        for size in (1, 3, 7, len(body)):
+            parts = []
+            parser = MultipartStreamParser('XyZ', lambda h, d: parts.append([d['filename'], b'']),
+                                           lambda data: parts[-1].__setitem__(1, parts[-1][1] + data),
+                                           lambda: None)
+            for i in range(0, len(body), size):
+                parser.feed(body[i:i + size])
+            parser.close()
+            self.assertEqual(parts, [['a.txt', b'hello'], ['b.txt', b'wor\r\nld']])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,213 @@
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from file_parser import extract_text_cached, extract_text_from_file
+
+UPLOAD_CHUNK_BYTES = 64 * 1024
+MAX_HEADER_BYTES = 16 * 1024
+UPLOAD_MAX_BYTES = int(os.getenv("LEGOL_UPLOAD_MAX_BYTES", 16 * 1024 * 1024))
+
+# Extraction of finished parts overlaps with reading the rest of the body.
+_extract_pool = ThreadPoolExecutor(max_workers=int(os.getenv("LEGOL_UPLOAD_EXTRACT_WORKERS", 4)))
+
+
+class UploadError(Exception):
+    """A malformed or oversized multipart body; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def multipart_boundary(content_type):
+    """Returns the boundary of a multipart/form-data Content-Type, or None."""
+    if not content_type or "multipart/form-data" not in content_type:
+        return None
+    for param in content_type.split(";")[1:]:
+        name, _, value = param.strip().partition("=")
+        if name.lower() == "boundary" and value:
+            return value.strip('"')
+    return None
+
+
+def _parse_part_headers(raw):
+    headers = {}
+    for line in raw.decode("utf-8", "replace").split("\r\n"):
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    disposition = {}
+    for param in headers.get("content-disposition", "").split(";")[1:]:
+        name, _, value = param.strip().partition("=")
+        disposition[name.lower()] = value.strip('"')
+    return headers, disposition
+
+
+class MultipartStreamParser:
+    """
+    Push parser for multipart/form-data bodies. feed() accepts the body in
+    chunks of any size and calls on_part_begin(headers, disposition),
+    on_part_data(bytes) and on_part_end() as parts go by, holding at most
+    one chunk plus a boundary's worth of bytes in memory.
+    """
+
+    def __init__(self, boundary, on_part_begin, on_part_data, on_part_end):
+        self.delimiter = b"\r\n--" + boundary.encode("latin-1")
+        self.on_part_begin = on_part_begin
+        self.on_part_data = on_part_data
+        self.on_part_end = on_part_end
+        # The first boundary has no leading CRLF
+        self.buffer = b"\r\n"
+        self.state = "preamble"
+
+    def feed(self, data):
+        self.buffer += data
+        while True:
+            if self.state == "preamble":
+                index = self.buffer.find(self.delimiter)
+                if index < 0:
+                    self.buffer = self.buffer[-len(self.delimiter):]
+                    return
+                self.buffer = self.buffer[index + len(self.delimiter):]
+                self.state = "boundary"
+            elif self.state == "boundary":
+                if len(self.buffer) < 2:
+                    return
+                if self.buffer.startswith(b"--"):
+                    self.state = "done"
+                    self.buffer = b""
+                    return
+                index = self.buffer.find(b"\r\n")
+                if index < 0:
+                    if len(self.buffer) > MAX_HEADER_BYTES:
+                        raise UploadError("Malformed multipart boundary")
+                    return
+                self.buffer = self.buffer[index + 2:]
+                self.state = "headers"
+            elif self.state == "headers":
+                index = self.buffer.find(b"\r\n\r\n")
+                if index < 0:
+                    if len(self.buffer) > MAX_HEADER_BYTES:
+                        raise UploadError("Multipart part headers too large")
+                    return
+                self.on_part_begin(*_parse_part_headers(self.buffer[:index]))
+                self.buffer = self.buffer[index + 4:]
+                self.state = "body"
+            elif self.state == "body":
+                index = self.buffer.find(self.delimiter)
+                if index >= 0:
+                    self.on_part_data(self.buffer[:index])
+                    self.on_part_end()
+                    self.buffer = self.buffer[index + len(self.delimiter):]
+                    self.state = "boundary"
+                    continue
+                # Keep a possible partial delimiter at the end for the next chunk
+                safe = len(self.buffer) - len(self.delimiter) + 1
+                if safe > 0:
+                    self.on_part_data(self.buffer[:safe])
+                    self.buffer = self.buffer[safe:]
+                return
+            else:
+                return
+
+    def close(self):
+        if self.state != "done":
+            raise UploadError("Multipart body ended before its closing boundary")
+
+
+def _extract_upload(path, filename, parse_cache):
+    try:
+        if parse_cache is not None:
+            content = extract_text_cached(path, parse_cache)
+        else:
+            content = extract_text_from_file(path)
+    finally:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+    return {
+        'filename': filename,
+        'content': content.get('text'),
+        'pages': content.get('pages', 0),
+        'type': content.get('type', 'Unknown'),
+        'error': content.get('error')
+    }
+
+
+def _store_upload(path, filename, documents):
+    try:
+        return documents.add(path, filename)
+    except Exception as e:
+        if os.path.exists(path):
+            os.unlink(path)
+        return {'filename': filename, 'pages': 0, 'type': 'Unknown', 'error': f'Error storing file: {str(e)}'}
+
+
+def stream_uploads(stream, content_type, content_length=None, parse_cache=None, field="files",
+                   max_bytes=None, documents=None):
+    """
+    Reads a multipart/form-data upload from `stream` in UPLOAD_CHUNK_BYTES
+    chunks. Each file in `field` is written to a temp file as it arrives and
+    handed to text extraction (through `parse_cache` if given) as soon as its
+    part ends, while later parts are still being read. Returns the
+    /upload entries in upload order; temp files are removed after extraction.
+
+    With a DocumentStore as `documents`, files are moved into the store
+    instead, and their entries carry a document_id rather than the text.
+    """
+    boundary = multipart_boundary(content_type)
+    if boundary is None:
+        raise UploadError("Invalid content type")
+    max_bytes = UPLOAD_MAX_BYTES if max_bytes is None else max_bytes
+    if content_length is not None and max_bytes and content_length > max_bytes:
+        raise UploadError("Upload too large", status=413)
+
+    futures = []
+    current = {}
+
+    def on_part_begin(headers, disposition):
+        filename = disposition.get("filename")
+        if disposition.get("name") != field or not filename:
+            current.clear()
+            return
+        suffix = os.path.splitext(filename)[1].lower()
+        current["file"] = tempfile.NamedTemporaryFile(delete=False, suffix=suffix, prefix="legol-upload-")
+        current["filename"] = os.path.basename(filename.replace("\\", "/"))
+
+    def on_part_data(data):
+        if current:
+            current["file"].write(data)
+
+    def on_part_end():
+        if current:
+            current["file"].close()
+            if documents is not None:
+                futures.append(_extract_pool.submit(_store_upload, current["file"].name, current["filename"], documents))
+            else:
+                futures.append(_extract_pool.submit(_extract_upload, current["file"].name, current["filename"],
+                                                    parse_cache))
+            current.clear()
+
+    parser = MultipartStreamParser(boundary, on_part_begin, on_part_data, on_part_end)
+    remaining = content_length
+    received = 0
+    try:
+        while remaining is None or remaining > 0:
+            chunk = stream.read(UPLOAD_CHUNK_BYTES if remaining is None else min(UPLOAD_CHUNK_BYTES, remaining))
+            if not chunk:
+                break
+            received += len(chunk)
+            if max_bytes and received > max_bytes:
+                raise UploadError("Upload too large", status=413)
+            if remaining is not None:
+                remaining -= len(chunk)
+            parser.feed(chunk)
+        parser.close()
+    except Exception:
+        if current:
+            current["file"].close()
+            os.unlink(current["file"].name)
+        for future in futures:
+            future.result()
+        raise
+    return [future.result() for future in futures]
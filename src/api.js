@@ -3,6 +3,18 @@ import axios from 'axios';
 // Use environment variable for API base URL, fallback to localhost for development
 const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || 'http://localhost:5001';
 
+// Each browser tab gets its own graph on the backend
+const getSessionId = () => {
+    let sessionId = sessionStorage.getItem('legolSessionId');
+    if (!sessionId) {
+        sessionId = crypto.randomUUID();
+        sessionStorage.setItem('legolSessionId', sessionId);
+    }
+    return sessionId;
+};
+
+axios.defaults.headers.common['X-Session-Id'] = getSessionId();
+
 export const api = {
     getGraph: async () => {
         const response = await axios.get(`${API_BASE_URL}/graph`);
@@ -14,8 +26,8 @@ export const api = {
         return response.data;
     },
 
-    chat: async (query, history = [], files = []) => {
-        const response = await axios.post(`${API_BASE_URL}/chat`, { query, history, files });
+    chat: async (query, history = [], files = [], documentIds = []) => {
+        const response = await axios.post(`${API_BASE_URL}/chat`, { query, history, files, document_ids: documentIds });
         return response.data;
     },
 
@@ -465,6 +465,7 @@ const Chat = () => {
         const userMessage = query.trim();
         let messageText = userMessage;
         let fileContents = [];
+        let documentIds = [];
 
         // Add user context from dropdowns
         let contextPrefix = '';
@@ -486,7 +487,9 @@ const Chat = () => {
                     ? `${userMessage}\n\n[Uploaded files: ${fileNames}]`
                     : `[Uploaded files: ${fileNames}]`;
 
-                fileContents = uploadResult.files;
+                // Stored documents are sent by id; only files that failed to upload go inline
+                documentIds = uploadResult.files.filter(f => f.document_id).map(f => f.document_id);
+                fileContents = uploadResult.files.filter(f => !f.document_id);
             } catch (err) {
                 console.error('File upload failed:', err);
                 setMessages(prev => [...prev, { role: 'assistant', text: 'Sorry, file upload failed. Please try again.' }]);
@@ -511,7 +514,7 @@ const Chat = () => {
             // Add context prefix to the actual message sent to Claude
             const messageWithContext = contextPrefix + messageText;
 
-            const result = await api.chat(messageWithContext, history, fileContents);
+            const result = await api.chat(messageWithContext, history, fileContents, documentIds);
             if (result.answer) {
                 setMessages(prev => [...prev, { role: 'assistant', text: result.answer }]);
             }